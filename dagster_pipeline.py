@@ -1,26 +1,41 @@
+import asyncio
+import fcntl
 import os
+import hashlib
 import random
 import json
 import re
 import subprocess
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
 from threading import Lock
 from tqdm import tqdm
 import yt_dlp
 import yaml
-import requests
 import time
 from pydub import AudioSegment
 from natsort import natsorted
 
+from file_index import index_for, record_added, record_removed, video_id_of
+from manifest import MANIFEST_PATH, STAGES, Manifest
+from service_client import ServiceClient, ServiceError
+
 from dagster import (
     asset,
     OpExecutionContext,
     Definitions,
     sensor,
     RunRequest,
-    job,
     DefaultSensorStatus,
+    DagsterRunStatus,
+    DataVersion,
+    Failure,
+    Output,
+    RetryPolicy,
+    Backoff,
+    RunsFilter,
+    StaticPartitionsDefinition,
+    define_asset_job,
 )
 
 # File paths for pipeline and state
@@ -31,6 +46,8 @@ PROXIES_JSON_FILE = "proxies.json"    # Maps country to list of proxies
 VIDEOS_INFO_JSON = "url_list/videos_info.json"
 STATE_FILE_PATH = "url_list/search_states.json"  # Holds state for keywords
 LID_BASE_URL = "http://localhost:3002"
+# Where the LID servers move files they can't decode (their LID_QUARANTINE_FOLDER)
+LID_QUARANTINE_FOLDER = "quarantine"
 
 # ---------------- Configuration and State Functions ----------------
 def load_pipeline_config():
@@ -157,43 +174,281 @@ def process_keywords_and_update_json(keywords, file_path, json_path, proxies, st
                 print(f"{kw} generated an exception: {exc}")
     print(f"Updated total duration: {total_duration} seconds")
 
+# ---------------- LID Fan-out Helpers ----------------
+def replica_for(file_path, num_replicas):
+    """Stable replica index for a file, so reruns send it to the same LID server"""
+    digest = hashlib.sha1(os.path.basename(file_path).encode("utf-8")).hexdigest()
+    return int(digest, 16) % num_replicas
+
+def find_moved_audio(file_path):
+    """
+    Result for an audio file a LID server moved without reporting it: the
+    server moves each file into a folder named after its language (or the
+    quarantine folder) next to it. None if the file wasn't moved.
+    """
+    folder, name = os.path.split(file_path)
+    with os.scandir(folder) as entries:
+        subfolders = [entry.path for entry in entries if entry.is_dir()]
+    for subfolder in subfolders:
+        destination = os.path.join(subfolder, name)
+        if not os.path.exists(destination):
+            continue
+        if os.path.basename(subfolder) == LID_QUARANTINE_FOLDER:
+            return {"file": file_path, "status": "error", "message": "Quarantined by the LID server", "quarantined": destination}
+        vtt_found = bool(index_for(subfolder).names(video_id_of(name), ".vtt", refresh_for=name))
+        return {"file": file_path, "status": "success", "language": os.path.basename(subfolder),
+                "vtt_found": vtt_found, "route": "reconciled", "destination": destination}
+    return None
+
+async def reconcile_chunk(client, job_id, chunk, context):
+    """
+    Settle the files of a chunk whose replica failed while it was processing it.
+
+    The replica's own results are used if it still answers. Files it moved
+    without reporting are found in the language folders. Files still in place
+    are only handed to another replica if the job is known to have stopped;
+    otherwise the replica may still be working on them.
+
+    Returns:
+        Tuple of (results, files to process elsewhere, files left for the next run)
+    """
+    reported = {}
+    job_stopped = job_id is None
+    if job_id is not None:
+        try:
+            answer = await client.get_job(job_id)
+        except ServiceError as e:
+            context.log.warning(f"{client.name}: could not fetch job {job_id} ({e})")
+        else:
+            # A restarted server without a journal no longer knows the job
+            job_stopped = answer is None or answer[0].get("status") in ("completed", "error")
+            if answer is not None:
+                reported = {result.get("file"): result for result in answer[1]}
+
+    results, requeue, left = [], [], []
+    for file_path in chunk:
+        result = reported.get(file_path)
+        if result is None and not os.path.exists(file_path):
+            result = find_moved_audio(file_path)
+        if result is not None:
+            results.append(result)
+        elif job_stopped and os.path.exists(file_path):
+            requeue.append(file_path)
+        else:
+            left.append(file_path)
+    return results, requeue, left
+
+async def fan_out_lid(clients, files, context, chunk_size=32):
+    """
+    Spread files over several LID servers that share the audio folder.
+
+    clients maps each replica's base URL to its ServiceClient. Files are split
+    between the replicas by hash and submitted to POST /jobs in chunks. A
+    replica that runs out of its own files steals chunks from the back of the
+    longest remaining queue. A file that fails on one replica is retried once
+    on another. A replica that can't be reached is dropped: the chunk it was
+    working on is settled with reconcile_chunk and its queue goes back to the
+    others. Files of that chunk the replica may still be processing get an
+    error result with "unsettled" set and are left for the next run.
+
+    Returns:
+        Tuple of (results, files handled per replica)
+    """
+    base_urls = list(clients)
+    queues = {base_url: [] for base_url in base_urls}
+    for file_path in files:
+        queues[base_urls[replica_for(file_path, len(base_urls))]].append(file_path)
+    # Failed files waiting for another replica: (file, replica it failed on, its result)
+    retries = []
+    # Replicas with a chunk in flight; only they can still add retries
+    busy = set()
+    results = []
+    handled = {base_url: 0 for base_url in base_urls}
+    # Notified whenever a replica finishes a chunk or is dropped
+    changed = asyncio.Condition()
+
+    def next_chunk(base_url):
+        """Returns (chunk, whether it is a retry)"""
+        for i, (file_path, failed_on, _) in enumerate(retries):
+            if failed_on != base_url:
+                del retries[i]
+                return [file_path], True
+        if queues[base_url]:
+            chunk, queues[base_url] = queues[base_url][:chunk_size], queues[base_url][chunk_size:]
+            return chunk, False
+        # Work stealing: take from the back of the longest queue
+        victim = max(queues, key=lambda url: len(queues[url]))
+        if queues[victim]:
+            chunk = queues[victim][-chunk_size:]
+            queues[victim] = queues[victim][:-len(chunk)]
+            return chunk, False
+        return [], False
+
+    async def run_replica(base_url):
+        while True:
+            async with changed:
+                chunk, is_retry = next_chunk(base_url)
+                if not chunk:
+                    if not busy:
+                        return
+                    # Wait for the busy replicas: they may still fail files this one can retry
+                    await changed.wait()
+                    continue
+                busy.add(base_url)
+
+            job = None
+            try:
+                job = await clients[base_url].submit_job(files=chunk)
+                _, chunk_results = await clients[base_url].follow_job(job["job_id"])
+            except Exception as e:
+                context.log.error(f"LID replica {base_url} failed, dropping it: {e}")
+                settled, requeue, left = await reconcile_chunk(clients[base_url], job and job["job_id"], chunk, context)
+                if left:
+                    context.log.warning(f"LID {base_url}: {len(left)} files may still be processing there, leaving them for the next run")
+                async with changed:
+                    busy.discard(base_url)
+                    handled[base_url] += len(settled)
+                    for result in settled:
+                        result["replica"] = base_url
+                    results.extend(settled)
+                    results.extend(
+                        {"file": file_path, "status": "error", "unsettled": True,
+                         "message": f"LID replica {base_url} was dropped while processing the file"}
+                        for file_path in left
+                    )
+                    leftovers = queues.pop(base_url) + requeue
+                    others = sorted(queues)
+                    for i, file_path in enumerate(leftovers):
+                        if others:
+                            queues[others[i % len(others)]].append(file_path)
+                        else:
+                            results.append({"file": file_path, "status": "error", "message": "No LID replica left to process the file"})
+                    changed.notify_all()
+                return
+
+            async with changed:
+                busy.discard(base_url)
+                handled[base_url] += len(chunk_results)
+                for result in chunk_results:
+                    result["replica"] = base_url
+                    retryable = (
+                        result.get("status") == "error"
+                        and not is_retry
+                        and "quarantined" not in result
+                        and len(queues) > 1
+                        and os.path.exists(result.get("file", ""))
+                    )
+                    if retryable:
+                        retries.append((result["file"], base_url, result))
+                    else:
+                        results.append(result)
+                changed.notify_all()
+            context.log.info(f"LID {base_url}: finished {len(chunk_results)} files ({len(results)}/{len(files)} overall)")
+
+    await asyncio.gather(*(run_replica(base_url) for base_url in base_urls))
+
+    # Failures no other replica was left to retry keep their original result
+    results.extend(result for _, _, result in retries)
+    return results, handled
+
+# ---------------- Video Shards ----------------
+# Every asset from the download onwards is partitioned by a hash of the video id,
+# so a run only lists and processes the files of its shard
+NUM_VIDEO_SHARDS = 16
+VIDEO_SHARDS = StaticPartitionsDefinition([f"{i:02d}" for i in range(NUM_VIDEO_SHARDS)])
+
+def video_shard(video_id):
+    digest = hashlib.sha1(video_id.encode("utf-8")).hexdigest()
+    return f"{int(digest, 16) % NUM_VIDEO_SHARDS:02d}"
+
+def read_url_lists():
+    """URLs of every file in url_list, without duplicates"""
+    folder_path = os.path.join(os.getcwd(), "url_list")
+    urls = []
+    for file_name in sorted(f for f in os.listdir(folder_path) if f.endswith(".txt")):
+        with open(os.path.join(folder_path, file_name), "r") as file:
+            urls.extend(line.strip() for line in file if line.strip())
+    return list(dict.fromkeys(urls))
+
+def urls_by_shard(urls):
+    shards = {}
+    for url in urls:
+        video_id = get_video_id(url)
+        if video_id:
+            shards.setdefault(video_shard(video_id), []).append(url)
+    return shards
+
+def fingerprint(entries):
+    """Order-independent hash of a list of strings"""
+    return hashlib.sha1("\n".join(sorted(entries)).encode("utf-8")).hexdigest()[:16]
+
+def shard_output(value, entries):
+    """Asset output whose data version changes only when the shard's entries do"""
+    return Output(value, data_version=DataVersion(fingerprint(entries)))
+
+# ---------------- Manifest Helpers ----------------
+def open_manifest():
+    return Manifest(load_pipeline_config().get("MANIFEST_PATH", MANIFEST_PATH))
+
+def manifest_output(value, manifest, shard, *columns):
+    """
+    Shard output versioned by the manifest columns a stage writes, so the
+    version only changes when that stage's results for the shard do.
+    """
+    entries = [":".join(str(row[column]) for column in ("video_id",) + columns) for row in manifest.videos(shard)]
+    return shard_output(dict(value, manifest=manifest.counts(shard)), entries)
+
+def needs_download(row):
+    """
+    Whether a video has to be downloaded: it isn't in the manifest yet, or it
+    is waiting for LID but its audio is found nowhere. Audio a LID server moved
+    to a language or quarantine folder without reporting it is settled by
+    language_detection_client instead. Videos past the download stage have
+    been moved on and must not be fetched into audio-and-captions again.
+    """
+    if row is None:
+        return True
+    if row["stage"] != "downloaded" or os.path.exists(row["audio_path"]):
+        return False
+    return find_moved_audio(row["audio_path"]) is None
+
+def register_download(manifest, video_id, url, target_lang, seconds=None):
+    """Add a video whose files are in audio-and-captions to the manifest"""
+    audio_file = os.path.join("audio-and-captions", f"{video_id}.mp3")
+    captions_file = os.path.join("audio-and-captions", f"{video_id}.{target_lang}.vtt")
+    if not os.path.exists(audio_file):
+        # Already moved on by an earlier run; its manifest row has its progress
+        return False
+    manifest.record_download(video_id, url, video_shard(video_id), audio_file, captions_file if os.path.exists(captions_file) else None, seconds)
+    return True
+
 # ---------------- Dagster Assets ----------------
 @asset
-def download_audio_and_captions(context: OpExecutionContext):
-    """Asset that processes URL files in 'url_list' and downloads audio and subtitles for videos that have target subtitles."""
+def optimized_youtube_keyword_processor(context: OpExecutionContext):
+    """Asset that uses optimized, concurrent processing to search for video URLs."""
     config = load_pipeline_config()
-    target_lang = config.get("lang", "ar")
-    folder_path = os.path.join(os.getcwd(), "url_list")
-    file_list = [f for f in os.listdir(folder_path) if f.endswith(".txt")]
-    context.log.info(f"Found {len(file_list)} URL file(s) in {folder_path}")
-    count_total = 0
+    max_results = config.get("max_results", 10)
+    lang = config.get("lang", "ar")
+    country = config.get("country", "egypt")
+    proxies_data = load_proxies_json()
+    proxies = proxies_data.get(country, [])
     
-    for file_name in file_list:
-        file_path = os.path.join(folder_path, file_name)
-        context.log.info(f"Processing file: {file_path}")
-        with open(file_path, "r") as file:
-            urls = [line.strip() for line in file if line.strip()]
-        
-        count_urls_with_cc = 0
-        for url in urls:
-            context.log.info(f"Processing URL: {url}")
-            if check_lang_captions(url, target_lang):
-                context.log.info(f"{url} has target subtitles ({target_lang})")
-                video_id = get_video_id(url)
-                if not video_id:
-                    context.log.info(f"Could not extract video ID for {url}")
-                    continue
-                if not check_file_existence(video_id, target_lang):
-                    download_lang_captions(url, target_lang)
-                else:
-                    context.log.info(f"Skipping: already downloaded {video_id}")
-                count_urls_with_cc += 1
-        context.log.info(f"Finished processing file: {file_path}")
-        context.log.info(f"Videos with target subtitles in this file: {count_urls_with_cc} out of {len(urls)}")
-        count_total += count_urls_with_cc
-    context.log.info(f"Total videos with target subtitles across all files: {count_total}")
-
-@asset(deps=[download_audio_and_captions])
+    file_path = URLS_FILE
+    json_path = VIDEOS_INFO_JSON
+    state_file_path = STATE_FILE_PATH
+    
+    if not os.path.exists(KEYWORDS_FILE):
+        context.log.info("No keywords file found.")
+        return
+    
+    with open(KEYWORDS_FILE, "r") as f:
+        keywords = [line.strip() for line in f if line.strip()]
+    
+    context.log.info(f"Starting optimized processing for keywords: {keywords}")
+    process_keywords_and_update_json(keywords, file_path, json_path, proxies, state_file_path, max_results)
+    context.log.info("Optimized keyword processing completed.")
+
+@asset(deps=[optimized_youtube_keyword_processor])
 def filter_song_urls(context: OpExecutionContext):
     """Asset that filters out song URLs from URLS_FILE."""
     file_path = URLS_FILE
@@ -237,257 +492,188 @@ def filter_song_urls(context: OpExecutionContext):
     context.log.info(f"Filtered out {len(urls) - len(not_songs)} song URLs out of {len(urls)}.")
     return not_songs
 
-@asset(deps=[filter_song_urls])
-def optimized_youtube_keyword_processor(context: OpExecutionContext):
-    """Asset that uses optimized, concurrent processing to search for video URLs."""
+@asset(deps=[filter_song_urls], partitions_def=VIDEO_SHARDS)
+def download_audio_and_captions(context: OpExecutionContext):
+    """Asset that downloads audio and subtitles for the videos of one shard of the URL lists that have target subtitles."""
     config = load_pipeline_config()
-    max_results = config.get("max_results", 10)
-    lang = config.get("lang", "ar")
-    country = config.get("country", "egypt")
-    proxies_data = load_proxies_json()
-    proxies = proxies_data.get(country, [])
-    
-    file_path = URLS_FILE
-    json_path = VIDEOS_INFO_JSON
-    state_file_path = STATE_FILE_PATH
-    
-    if not os.path.exists(KEYWORDS_FILE):
-        context.log.info("No keywords file found.")
-        return
-    
-    with open(KEYWORDS_FILE, "r") as f:
-        keywords = [line.strip() for line in f if line.strip()]
-    
-    context.log.info(f"Starting optimized processing for keywords: {keywords}")
-    process_keywords_and_update_json(keywords, file_path, json_path, proxies, state_file_path, max_results)
-    context.log.info("Optimized keyword processing completed.")
+    target_lang = config.get("lang", "ar")
+    manifest = open_manifest()
+    known = {row["video_id"]: row for row in manifest.videos(context.partition_key)}
+    shard_urls = urls_by_shard(read_url_lists()).get(context.partition_key, [])
+    urls = [url for url in shard_urls if needs_download(known.get(get_video_id(url)))]
+    context.log.info(f"Shard {context.partition_key}: {len(urls)} URLs to download, {len(shard_urls) - len(urls)} already in the manifest")
+
+    video_ids = []
+    for url in urls:
+        context.log.info(f"Processing URL: {url}")
+        start_time = time.time()
+        video_id = download_video(url, target_lang, context.log)
+        if video_id:
+            video_ids.append(video_id)
+            register_download(manifest, video_id, url, target_lang, round(time.time() - start_time, 3))
+    context.log.info(f"Videos with target subtitles in shard {context.partition_key}: {len(video_ids)} out of {len(urls)}")
+    return manifest_output({"status": "completed", "videos": video_ids}, manifest, context.partition_key, "audio_sha1", "captions_sha1")
 
 # ---------------- Language Detection Client ----------------
-@asset(deps=[optimized_youtube_keyword_processor])
+@asset(deps=[download_audio_and_captions], partitions_def=VIDEO_SHARDS)
 def language_detection_client(context: OpExecutionContext):
     """
-    Asset that checks the health of the language detection server,
-    starts processing, and polls until processing is complete.
+    Asset that checks the health of the language detection servers, then
+    splits the shard's MP3 files between them and collects the results.
+
+    LID_BASE_URLS in config.yaml lists the replicas (falling back to
+    LID_BASE_URL); all of them must see the same audio-and-captions folder.
     """
 
     config = load_pipeline_config()
-    LID_BASE_URL = config.get("LID_BASE_URL", "http://lang_detector:3002")
-
-    def check_health(wait_for_model=False, timeout=300):
-        start_time = time.time()
-        while True:
-            try:
-                response = requests.get(f"{LID_BASE_URL}/health", timeout=10)
-                response_data = response.json()
-
-                if response.status_code == 200:
-                    # If waiting for model, check if it's still initializing
-                    if wait_for_model and response_data.get("status") == "initializing":
-                        elapsed = time.time() - start_time
-                        if elapsed > timeout:
-                            context.log.error(f"Timeout waiting for model initialization ({timeout} seconds)")
-                            return False
-                        context.log.info(f"Model is still initializing. Waiting... ({elapsed:.1f}s)")
-                        time.sleep(5)
-                        continue
-
-                    model_loaded = response_data.get("model_loaded", False)
-                    context.log.info(f"Server is healthy! Model loaded: {model_loaded}")
-
-                    if wait_for_model and not model_loaded:
-                        elapsed = time.time() - start_time
-                        if elapsed > timeout:
-                            context.log.error(f"Timeout waiting for model to load ({timeout} seconds)")
-                            return False
-                        context.log.info(f"Waiting for model to load... ({elapsed:.1f}s)")
-                        time.sleep(5)
-                        continue
-
-                    return True
-                else:
-                    context.log.error(f"Server health check failed with status code: {response.status_code}")
-                    if wait_for_model:
-                        elapsed = time.time() - start_time
-                        if elapsed > timeout:
-                            context.log.error(f"Timeout waiting for server ({timeout} seconds)")
-                            return False
-                        context.log.info(f"Retrying in 5 seconds... ({elapsed:.1f}s)")
-                        time.sleep(5)
-                        continue
-                    return False
-
-            except requests.exceptions.RequestException as e:
-                context.log.error(f"Error connecting to server: {e}")
-                elapsed = time.time() - start_time
-                if elapsed > timeout:
-                    context.log.error(f"Timeout waiting for server connection ({timeout} seconds)")
-                    return False
-                context.log.info(f"Retrying connection in 5 seconds... ({elapsed:.1f}s)")
-                time.sleep(5)
-
-    def start_processing():
+    lid_base_urls = config.get("LID_BASE_URLS") or [config.get("LID_BASE_URL", "http://lang_detector:3002")]
+
+    manifest = open_manifest()
+    audio_files = []
+    for row in manifest.pending("downloaded", context.partition_key):
+        if os.path.exists(row["audio_path"]):
+            audio_files.append(row["audio_path"])
+            continue
+        # Moved by a replica that was dropped before it reported the file
+        moved = find_moved_audio(row["audio_path"])
+        if moved is not None:
+            manifest.record_lid(row["video_id"], moved)
+    audio_files = natsorted(audio_files)
+    # Seconds spent waiting on each replica, per phase
+    wait_seconds = {}
+
+    async def run():
+        clients = {base_url: ServiceClient(base_url, name=f"LID {base_url}", log=context.log) for base_url in lid_base_urls}
         try:
-            response = requests.post(f"{LID_BASE_URL}/process", timeout=30)
-            data = response.json()
-            context.log.info(f"Process start response: {json.dumps(data, indent=2)}")
-            return data
-        except Exception as e:
-            context.log.error(f"Error starting processing: {e}")
-            return None
-
-    def check_status():
-        try:
-            response = requests.get(f"{LID_BASE_URL}/status", timeout=30)
-            return response.json()
-        except Exception as e:
-            context.log.error(f"Error checking status: {e}")
-            return None
-
-    # Execute the client pipeline steps:
-    if not check_health(wait_for_model=True, timeout=600):
-        context.log.error("Server is not healthy or timeout reached. Exiting asset.")
-        return {"status": "failed"}
-
-    # Start processing unless you want to skip it (similar to --skip-process)
-    result = start_processing()
-    if result and result.get("status") == "error":
-        context.log.error(f"Processing error: {result.get('message')}")
-        return {"status": "error", "message": result.get("message")}
-
-    context.log.info("Polling processing status...")
-    while True:
-        status = check_status()
-        if status is None:
-            context.log.error("Error checking status. Exiting asset.")
-            return {"status": "error", "message": "Error checking status"}
-        if status.get("status") == "processing":
-            context.log.info("Processing is still running. Waiting 5 seconds...")
-            time.sleep(5)
-        else:
-            context.log.info("Processing completed!")
-            context.log.info(f"Final status: {json.dumps(status, indent=2)}")
-            break
+            healthy = await asyncio.gather(*(client.wait_until_healthy(timeout=600) for client in clients.values()))
+            healthy_clients = {base_url: client for (base_url, client), ok in zip(clients.items(), healthy) if ok}
+            if not healthy_clients:
+                context.log.error("No LID server is healthy or timeout reached. Exiting asset.")
+                return None
+            if len(healthy_clients) < len(clients):
+                context.log.warning(f"Continuing with {len(healthy_clients)} of {len(clients)} LID servers")
+            if not audio_files:
+                return [], {}
+            context.log.info(f"Sending {len(audio_files)} files to {len(healthy_clients)} LID servers...")
+            return await fan_out_lid(healthy_clients, audio_files, context)
+        finally:
+            for base_url, client in clients.items():
+                wait_seconds[base_url] = client.wait_report()
+                await client.aclose()
+
+    start_time = time.time()
+    outcome = asyncio.run(run())
+    elapsed = time.time() - start_time
+    if outcome is None:
+        # Failing the run lets the step retry policy and the shard sensor run it again
+        raise Failure(description="No LID server is healthy", metadata={"wait_seconds": wait_seconds})
+    if not audio_files:
+        context.log.info(f"Shard {context.partition_key} has no new audio files")
+        return manifest_output({"status": "completed", "results": []}, manifest, context.partition_key, "language")
+    results, handled = outcome
+    for result in results:
+        manifest.record_lid(video_id_of(result["file"]), result)
+    unsettled = sum(1 for result in results if result.get("unsettled"))
+    if unsettled:
+        # The retry settles them from the language folders once the replica is done with them
+        raise Failure(description=f"{unsettled} files were left on a dropped LID replica", metadata={"wait_seconds": wait_seconds})
+
+    failed = sum(1 for result in results if result.get("status") == "error")
+    routes = {}
+    for result in results:
+        route = result.get("route", "error")
+        routes[route] = routes.get(route, 0) + 1
+    status = {
+        "status": "completed",
+        "progress": {
+            "total": len(audio_files),
+            "done": len(results) - failed,
+            "failed": failed,
+            "elapsed_seconds": round(elapsed, 1),
+            "files_per_second": round(len(results) / elapsed, 3) if elapsed > 0 else 0.0,
+        },
+        "replicas": handled,
+        "cascade": {
+            route: {"files": count, "fraction": round(count / len(results), 4)}
+            for route, count in routes.items()
+        },
+        "wait_seconds": wait_seconds,
+        "results": results,
+    }
+    context.log.info("Processing completed!")
+    context.log.info(f"Final status: {status.get('status')}, progress: {json.dumps(status.get('progress', {}))}")
+    for base_url, count in handled.items():
+        context.log.info(f"  LID server {base_url}: {count} files, waited {json.dumps(wait_seconds.get(base_url, {}))}")
+    for route, share in sorted(status.get("cascade", {}).items()):
+        context.log.info(f"  LID path '{route}': {share['files']} files ({share['fraction']:.1%})")
 
-    return status
+    return manifest_output(status, manifest, context.partition_key, "language")
 
 # ---------------- Dialect Detection Client ----------------
-@asset(deps=[language_detection_client])
+@asset(deps=[language_detection_client], partitions_def=VIDEO_SHARDS)
 def dialect_detection_client(context: OpExecutionContext):
     """
-    Asset that checks the health of the dialect detection server,
-    starts processing, and polls until processing is complete.
+    Asset that checks the health of the dialect detection server, submits the
+    shard's Arabic VTT files as a job, and follows its event stream until it completes.
     """
     
     config = load_pipeline_config()
     DIALECT_BASE_URL = config.get("DIALECT_BASE_URL", "http://dialect_detector:3003")
+    manifest = open_manifest()
+    vtt_files = natsorted(row["captions_path"] for row in manifest.pending("language_detected", context.partition_key))
+    if not vtt_files:
+        context.log.info(f"Shard {context.partition_key} has no new Arabic VTT files")
+        return manifest_output({"status": "completed", "results": []}, manifest, context.partition_key, "dialect")
     
-    def check_health(wait_for_model=False, timeout=300):
-        start_time = time.time()
-        while True:
+    async def run(client):
+        if not await client.wait_until_healthy(timeout=600):
+            context.log.error("Server is not healthy or timeout reached. Exiting asset.")
+            return {"status": "failed", "message": "DID server is not healthy"}
+
+        job = await client.submit_job(files=vtt_files)
+        context.log.info(f"Submitted {len(vtt_files)} files as DID job {job['job_id']}")
+        summary, results = await client.follow_job(job["job_id"])
+        return dict(summary, results=results)
+
+    async def run_with_client():
+        async with ServiceClient(DIALECT_BASE_URL, name="DID", log=context.log) as client:
             try:
-                response = requests.get(f"{DIALECT_BASE_URL}/health", timeout=10)
-                response_data = response.json()
+                status = await run(client)
+            except ServiceError as e:
+                context.log.error(f"Error following dialect processing: {e}")
+                status = {"status": "error", "message": str(e)}
+            status["wait_seconds"] = client.wait_report()
+            return status
+
+    start_time = time.time()
+    status = asyncio.run(run_with_client())
+    if "progress" not in status:
+        # Failing the run lets the step retry policy and the shard sensor run it again
+        raise Failure(description=status.get("message", "DID job failed"), metadata={"wait_seconds": status["wait_seconds"]})
+    # The server reports no per-file time, so each file gets the job's average
+    seconds = round((time.time() - start_time) / len(vtt_files), 3)
+    for result in status["results"]:
+        manifest.record_did(video_id_of(result["file"]), result, seconds)
+    if status.get("status") == "error":
+        raise Failure(description=f"DID job {status.get('job_id')} failed after {len(status['results'])} of {len(vtt_files)} files")
+    context.log.info("Processing completed!")
+    context.log.info(f"Final status: {status.get('status')}, progress: {json.dumps(status.get('progress', {}))}")
+    if "engine" in status:
+        context.log.info(f"DID engine: {json.dumps(status['engine'])}")
+    context.log.info(f"Waited on DID: {json.dumps(status['wait_seconds'])}")
     
-                if response.status_code == 200:
-                    # If waiting for model, check if it's still initializing
-                    if wait_for_model and response_data.get("status") == "initializing":
-                        elapsed = time.time() - start_time
-                        if elapsed > timeout:
-                            context.log.error(f"Timeout waiting for model initialization ({timeout} seconds)")
-                            return False
-                        context.log.info(f"Model is still initializing. Waiting... ({elapsed:.1f}s)")
-                        time.sleep(5)
-                        continue
-    
-                    model_loaded = response_data.get("model_loaded", False)
-                    context.log.info(f"Server is healthy! Model loaded: {model_loaded}")
-    
-                    if wait_for_model and not model_loaded:
-                        elapsed = time.time() - start_time
-                        if elapsed > timeout:
-                            context.log.error(f"Timeout waiting for model to load ({timeout} seconds)")
-                            return False
-                        context.log.info(f"Waiting for model to load... ({elapsed:.1f}s)")
-                        time.sleep(5)
-                        continue
-    
-                    return True
-                else:
-                    context.log.error(f"Server health check failed with status code: {response.status_code}")
-                    if wait_for_model:
-                        elapsed = time.time() - start_time
-                        if elapsed > timeout:
-                            context.log.error(f"Timeout waiting for server ({timeout} seconds)")
-                            return False
-                        context.log.info(f"Retrying in 5 seconds... ({elapsed:.1f}s)")
-                        time.sleep(5)
-                        continue
-                    return False
-    
-            except requests.exceptions.RequestException as e:
-                context.log.error(f"Error connecting to server: {e}")
-                elapsed = time.time() - start_time
-                if elapsed > timeout:
-                    context.log.error(f"Timeout waiting for server connection ({timeout} seconds)")
-                    return False
-                context.log.info(f"Retrying connection in 5 seconds... ({elapsed:.1f}s)")
-                time.sleep(5)
-    
-    def start_processing():
-        try:
-            response = requests.post(f"{DIALECT_BASE_URL}/process", timeout=30)
-            data = response.json()
-            context.log.info(f"Process start response: {json.dumps(data, indent=2)}")
-            return data
-        except Exception as e:
-            context.log.error(f"Error starting processing: {e}")
-            return None
-    
-    def check_status():
-        try:
-            response = requests.get(f"{DIALECT_BASE_URL}/status", timeout=30)
-            return response.json()
-        except Exception as e:
-            context.log.error(f"Error checking status: {e}")
-            return None
-    
-    # Execute the client pipeline steps:
-    if not check_health(wait_for_model=True, timeout=600):
-        context.log.error("Server is not healthy or timeout reached. Exiting asset.")
-        return {"status": "failed"}
-    
-    result = start_processing()
-    if result and result.get("status") == "error":
-        context.log.error(f"Processing error: {result.get('message')}")
-        return {"status": "error", "message": result.get("message")}
-    
-    context.log.info("Polling processing status...")
-    while True:
-        status = check_status()
-        if status is None:
-            context.log.error("Error checking status. Exiting asset.")
-            return {"status": "error", "message": "Error checking status"}
-        if status.get("status") == "processing":
-            context.log.info("Processing is still running. Waiting 5 seconds...")
-            time.sleep(5)
-        else:
-            context.log.info("Processing completed!")
-            context.log.info(f"Final status: {json.dumps(status, indent=2)}")
-            break
-    
-    return status
+    return manifest_output(status, manifest, context.partition_key, "dialect")
 
-@asset(deps=[dialect_detection_client])
+@asset(deps=[dialect_detection_client], partitions_def=VIDEO_SHARDS)
 def mixed_arabic_extractor(context: OpExecutionContext):
     """
-    Asset to extract mixed language and Arabic-only transcriptions from VTT files 
-    located in the audio-and-captions/Arabic/<dialect> folder. The dialect must 
+    Asset to extract mixed language and Arabic-only transcriptions from the shard's
+    VTT files that the manifest lists as detected as <dialect>. The dialect must 
     be provided in the op_config (valid options: "ECA", "MSA"). Files with no valid 
     transcriptions are deleted.
     """
 
     config = load_pipeline_config()
-    lang = config.get("lang", "ar")
     dialect = config.get("dialect", "ECA")
     options = ["ECA", "MSA"]
     if dialect is None:
@@ -499,137 +685,42 @@ def mixed_arabic_extractor(context: OpExecutionContext):
         context.log.error(f"Invalid dialect: {dialect}. Valid options: " + ", ".join(options))
         return {"status": "failed", "message": f"Invalid dialect: {dialect}"}
 
-    lang = "ar"
-    # Define regex patterns for Arabic and English characters
-    arabic_pattern = re.compile(r"[\u0600-\u06FF]+")
-    english_pattern = re.compile(r"[a-zA-Z]+")
-
     # Create output folders if they don't exist
     mixedlanguage_folder = os.path.join(os.getcwd(), f"mixedlanguage-{dialect}")
     arabic_only_folder = os.path.join(os.getcwd(), f"arabic-only-{dialect}")
     for folder in [mixedlanguage_folder, arabic_only_folder]:
         os.makedirs(folder, exist_ok=True)
 
-    # Define the folder containing the VTT files for the given dialect
-    audio_and_captions_folder = os.path.join(os.getcwd(), f"audio-and-captions/Arabic/{dialect}")
-    if not os.path.exists(audio_and_captions_folder):
-        context.log.error(f"Folder {audio_and_captions_folder} does not exist.")
-        return {"status": "failed", "message": f"Folder {audio_and_captions_folder} not found"}
-
-    vtt_files = [file for file in os.listdir(audio_and_captions_folder) if file.endswith(".vtt")]
+    manifest = open_manifest()
+    pending = manifest.pending("dialect_detected", context.partition_key, dialect=dialect)
     processed_count = 0
     deleted_count = 0
     skipped_count = 0
 
-    with tqdm(total=len(vtt_files), desc="Processing files", unit="file") as pbar:
-        for vtt_file in vtt_files:
-            vtt_file_path = os.path.join(audio_and_captions_folder, vtt_file)
-            mixedlanguage_file_path = os.path.join(mixedlanguage_folder, vtt_file[:-4] + "_mixedlanguage.vtt")
-            arabic_only_file_path = os.path.join(arabic_only_folder, vtt_file[:-4] + "_arabic_only.vtt")
-
-            # If both output files already exist, skip processing this file
-            if os.path.exists(mixedlanguage_file_path) and os.path.exists(arabic_only_file_path):
-                context.log.info(f"Skipping file '{vtt_file}' - output files already exist.")
+    with tqdm(total=len(pending), desc="Processing files", unit="file") as pbar:
+        for row in pending:
+            start_time = time.time()
+            outcome, deleted = extract_transcriptions(row["captions_path"], mixedlanguage_folder, arabic_only_folder, context.log)
+            manifest.record_extraction(row["video_id"], outcome, round(time.time() - start_time, 3))
+            deleted_count += deleted
+            if outcome == "skipped":
                 skipped_count += 1
-                pbar.update(1)
-                continue
-
-            try:
-                with open(vtt_file_path, "r", encoding="utf-8") as file:
-                    contents = file.read()
-            except Exception as e:
-                context.log.error(f"Error reading file {vtt_file}: {e}")
-                pbar.update(1)
-                continue
-
-            lines = contents.split("\n")
-            current_timestamp = ""
-            current_transcription = ""
-            mixed_language_transcriptions = []
-            arabic_only_transcriptions = []
-            for line in lines:
-                if "-->" in line:
-                    # Save previous transcription if it contains Arabic characters
-                    if arabic_pattern.search(current_transcription):
-                        if english_pattern.search(current_transcription):
-                            mixed_language_transcriptions.append((current_timestamp, current_transcription))
-                        else:
-                            arabic_only_transcriptions.append((current_timestamp, current_transcription))
-                    # Reset for the next transcription
-                    current_timestamp = line.strip()
-                    current_transcription = ""
-                else:
-                    current_transcription += line.strip()
-            # Process any remaining transcription after the loop ends
-            if arabic_pattern.search(current_transcription):
-                if english_pattern.search(current_transcription):
-                    mixed_language_transcriptions.append((current_timestamp, current_transcription))
-                else:
-                    arabic_only_transcriptions.append((current_timestamp, current_transcription))
-
-            delete_flag = False
-            # Save mixed language transcriptions if any
-            if mixed_language_transcriptions:
-                try:
-                    with open(mixedlanguage_file_path, "w", encoding="utf-8") as f:
-                        for timestamp, transcription in mixed_language_transcriptions:
-                            f.write("Timestamp: " + timestamp + "\n")
-                            f.write("Transcription: " + transcription + "\n\n")
-                    context.log.info(f"Processed file '{vtt_file}' - mixed language file saved.")
-                    delete_flag = False
-                except Exception as e:
-                    context.log.error(f"Error writing mixed language file for {vtt_file}: {e}")
-            else:
-                context.log.info(f"Skipping file '{vtt_file}' - no mixed language transcriptions found.")
-                delete_flag = True
-
-            # Save Arabic-only transcriptions if any
-            if arabic_only_transcriptions:
-                try:
-                    with open(arabic_only_file_path, "w", encoding="utf-8") as f:
-                        for timestamp, transcription in arabic_only_transcriptions:
-                            f.write("Timestamp: " + timestamp + "\n")
-                            f.write("Transcription: " + transcription + "\n\n")
-                    context.log.info(f"Processed file '{vtt_file}' - Arabic-only file saved.")
-                    delete_flag = False
-                except Exception as e:
-                    context.log.error(f"Error writing Arabic-only file for {vtt_file}: {e}")
-            else:
-                context.log.info(f"Skipping file '{vtt_file}' - no Arabic-only transcriptions found.")
-                delete_flag = True
-
-            # If no valid transcriptions were found, delete the original VTT (and corresponding audio) file
-            if delete_flag:
-                try:
-                    os.remove(vtt_file_path)
-                    context.log.info(f"Deleted VTT file: {vtt_file}")
-                    deleted_count += 1
-                except Exception as e:
-                    context.log.error(f"Error deleting VTT file {vtt_file}: {e}")
-                try:
-                    audio_file_name = vtt_file.replace(f".{lang}.vtt", ".mp3")
-                    audio_file_path = os.path.join(audio_and_captions_folder, audio_file_name)
-                    os.remove(audio_file_path)
-                    context.log.info(f"Deleted audio file: {audio_file_name}")
-                    deleted_count += 1
-                except Exception as e:
-                    context.log.error(f"Error deleting audio file {audio_file_name}: {e}")
-
-            processed_count += 1
+            elif outcome != "error":
+                processed_count += 1
             pbar.update(1)
 
     context.log.info("Processing completed.")
-    return {
+    return manifest_output({
         "status": "completed",
         "processed_files": processed_count,
         "deleted_files": deleted_count,
         "skipped_files": skipped_count,
-    }
+    }, manifest, context.partition_key, "extraction")
 
-@asset(deps=[mixed_arabic_extractor])
+@asset(deps=[mixed_arabic_extractor], partitions_def=VIDEO_SHARDS)
 def audio_segmenter(context: OpExecutionContext):
     """
-    Asset to process MP3 files located in the audio-and-captions/Arabic/<dialect> folder.
+    Asset to process the shard's MP3 files that the manifest lists as extracted for <dialect>.
     It searches for corresponding VTT files in the folders "arabic-only-<dialect>" and 
     "mixedlanguage-<dialect>", reads the timestamps and transcriptions from the VTT(s), and 
     splits the MP3 into segments accordingly. It then writes segment information into text files.
@@ -650,124 +741,73 @@ def audio_segmenter(context: OpExecutionContext):
     # Define folder names based on dialect
     folder1 = f"arabic-only-{dialect}"
     folder2 = f"mixedlanguage-{dialect}"
-    mp3_folder = os.path.join(os.getcwd(), f"audio-and-captions/Arabic/{dialect}")
     output_folder = os.path.join(os.getcwd(), f"output-folder-{dialect}")
     os.makedirs(output_folder, exist_ok=True)
 
-    # Read all MP3 files from the mp3 folder
-    mp3_files = [os.path.join(mp3_folder, file) for file in os.listdir(mp3_folder) if file.endswith(".mp3")]
-    if not mp3_files:
-        context.log.info("No MP3 files found in the specified folder.")
-        return {"status": "failed", "message": "No MP3 files found"}
-
-    # --- Helper functions ---
-    def find_vtt_files(mp3_file, folder1=None, folder2=None):
-        vtt_files = []
-        if folder1 is None:
-            # Search in folder2
-            vtt_files_folder2 = [file for file in os.listdir(folder2) if file.startswith(os.path.basename(mp3_file[:-4])) and file.endswith(".vtt")]
-            vtt_files.extend(os.path.join(folder2, file) for file in vtt_files_folder2)
-        elif folder2 is None:
-            # Search in folder1
-            vtt_files_folder1 = [file for file in os.listdir(folder1) if file.startswith(os.path.basename(mp3_file[:-4])) and file.endswith(".vtt")]
-            vtt_files.extend(os.path.join(folder1, file) for file in vtt_files_folder1)
-        else:
-            # Search in both folders
-            vtt_files_folder1 = [file for file in os.listdir(folder1) if file.startswith(os.path.basename(mp3_file[:-4])) and file.endswith(".vtt")]
-            vtt_files.extend(os.path.join(folder1, file) for file in vtt_files_folder1)
-            vtt_files_folder2 = [file for file in os.listdir(folder2) if file.startswith(os.path.basename(mp3_file[:-4])) and file.endswith(".vtt")]
-            vtt_files.extend(os.path.join(folder2, file) for file in vtt_files_folder2)
-        return vtt_files
-
-    def read_timestamps_and_transcriptions_from_vtt(vtt_file_1, vtt_file_2=None):
-        timestamps = []
-        transcriptions = []
-        if vtt_file_1 and vtt_file_2:
-            with open(vtt_file_1, 'r', encoding='utf-8') as file:
-                lines = file.readlines()
-            with open(vtt_file_2, 'r', encoding='utf-8') as file:
-                lines += file.readlines()
-        else:
-            with open(vtt_file_1, 'r', encoding='utf-8') as file:
-                lines = file.readlines()
-
-        for line in lines:
-            if 'Timestamp' in line:
-                timestamp_line = line.strip().split(' ')
-                # Expecting a line such as: "Timestamp: <start_time> --> <end_time>"
-                start_time = timestamp_line[1]
-                end_time = timestamp_line[3]
-                if '-->' in end_time:
-                    end_time = timestamp_line[5]
-                timestamps.append((start_time, end_time))
-            if 'Transcription' in line:
-                parts = line.strip().split('Transcription:')
-                if len(parts) > 1:
-                    transcriptions.append(parts[1].strip())
-        return timestamps, transcriptions
-
-    def timestamp_to_ms(timestamp):
-        h, m, s = map(float, timestamp.split(':'))
-        return int((h * 3600 + m * 60 + s) * 1000)
-
-    def split_mp3(mp3_file, timestamps, transcriptions, output_folder):
-        text_file = os.path.join(output_folder, 'text.txt')
-        audio_paths_file = os.path.join(output_folder, 'audio_paths.txt')
-        audio = AudioSegment.from_mp3(mp3_file)
-        os.makedirs(output_folder, exist_ok=True)
-        with open(audio_paths_file, 'a') as ap_file, open(text_file, 'a') as t_file:
-            for i, (start_time, end_time) in enumerate(timestamps):
-                start_ms = timestamp_to_ms(start_time)
-                end_ms = timestamp_to_ms(end_time)
-                segment = audio[start_ms:end_ms]
-                output_file = os.path.join(output_folder, f"{os.path.splitext(os.path.basename(mp3_file))[0]}_segment_{i+1}.wav")
-                segment.export(output_file, format="wav", parameters=["-ar", "16000", "-ac", "1"])
-                t_file.write(f"{os.path.splitext(os.path.basename(mp3_file))[0]}_segment_{i+1} {transcriptions[i]}\n")
-                ap_file.write(f"{os.path.splitext(os.path.basename(mp3_file))[0]}_segment_{i+1}.wav {os.path.join(os.getcwd(), output_file)}\n")
-
-    def align_text_files(output_folder):
-        audio_paths_file = os.path.join(output_folder, 'audio_paths.txt')
-        text_file = os.path.join(output_folder, 'text.txt')
-        if os.path.isfile(audio_paths_file):
-            with open(audio_paths_file, 'r+') as file:
-                existing_audio_paths = {line.strip() for line in file}
-                file.seek(0)
-                file.truncate()
-                for line in natsorted(existing_audio_paths):
-                    file.write(f"{line}\n")
-        if os.path.isfile(text_file):
-            with open(text_file, 'r+') as file:
-                existing_text = {line.strip() for line in file}
-                file.seek(0)
-                file.truncate()
-                for line in natsorted(existing_text):
-                    file.write(f"{line}\n")
-
-    # --- End Helper Functions ---
+    manifest = open_manifest()
+    pending = manifest.pending("extracted", context.partition_key, dialect=dialect)
+    if not pending:
+        context.log.info(f"No MP3 files of shard {context.partition_key} are waiting to be segmented.")
+        return manifest_output({"status": "completed", "processed_files": 0}, manifest, context.partition_key, "segments")
 
     total_processed = 0
     # Process each MP3 file with a progress bar
-    for mp3_file in tqdm(mp3_files, desc="Processing MP3 files", unit="file"):
-        vtt_files = find_vtt_files(mp3_file, folder1, folder2)
-        if vtt_files:
-            if len(vtt_files) < 2:
-                context.log.info(f"Processing MP3 file: {mp3_file}")
-                for vtt_file in vtt_files:
-                    timestamps, transcriptions = read_timestamps_and_transcriptions_from_vtt(vtt_file)
-                    split_mp3(mp3_file, timestamps, transcriptions, output_folder)
-                    context.log.info(f"  MP3 file split based on timestamps in VTT file: {vtt_file}")
-            else:
-                context.log.info(f"Processing MP3 file: {mp3_file}")
-                timestamps, transcriptions = read_timestamps_and_transcriptions_from_vtt(vtt_files[0], vtt_files[1])
-                split_mp3(mp3_file, timestamps, transcriptions, output_folder)
-                context.log.info(f"  MP3 file split based on timestamps in VTT files: {vtt_files[0]}, {vtt_files[1]}")
+    for row in tqdm(pending, desc="Processing MP3 files", unit="file"):
+        start_time = time.time()
+        segments = segment_audio(row["audio_path"], folder1, folder2, output_folder, context.log)
+        manifest.record_segments(row["video_id"], segments or 0, round(time.time() - start_time, 3))
+        if segments is not None:
             total_processed += 1
-        else:
-            context.log.info(f"MP3 file: {mp3_file} has no corresponding VTT files.")
 
     align_text_files(output_folder)
     context.log.info("Audio segmentation completed.")
-    return {"status": "completed", "processed_files": total_processed}
+    return manifest_output({"status": "completed", "processed_files": total_processed}, manifest, context.partition_key, "segments")
+
+@asset(deps=[filter_song_urls])
+def streaming_pipeline(context: OpExecutionContext):
+    """
+    Asset that streams every video in the URL lists through download, LID, DID,
+    extraction and segmentation, instead of running each stage over whole
+    folders. Used instead of the stage-by-stage assets when config.yaml sets
+    pipeline_mode: "stream".
+    """
+    config = load_pipeline_config()
+    dialect = config.get("dialect", "ECA")
+    valid_options = ["ECA", "MSA"]
+    if dialect not in valid_options:
+        context.log.error(f"Invalid dialect: {dialect}. Valid options: " + ", ".join(valid_options))
+        return {"status": "failed", "message": f"Invalid dialect: {dialect}"}
+
+    urls = read_url_lists()
+    context.log.info(f"Streaming {len(urls)} URLs through the pipeline")
+
+    lid_base_urls = config.get("LID_BASE_URLS") or [config.get("LID_BASE_URL", "http://lang_detector:3002")]
+    dialect_base_url = config.get("DIALECT_BASE_URL", "http://dialect_detector:3003")
+    manifest = open_manifest()
+    # Seconds spent waiting on each service, per phase
+    wait_seconds = {}
+
+    async def run():
+        lid_clients = [ServiceClient(base_url, name=f"LID {base_url}", log=context.log) for base_url in lid_base_urls]
+        did_client = ServiceClient(dialect_base_url, name="DID", log=context.log)
+        clients = lid_clients + [did_client]
+        try:
+            healthy = await asyncio.gather(*(client.wait_until_healthy(timeout=600) for client in clients))
+            healthy_lid_clients = [client for client, ok in zip(lid_clients, healthy) if ok]
+            if not healthy_lid_clients or not healthy[-1]:
+                context.log.error("The LID or DID server is not healthy or timeout reached. Exiting asset.")
+                return None
+            return await stream_videos(urls, healthy_lid_clients, did_client, manifest, config, context.log)
+        finally:
+            for client in clients:
+                wait_seconds[client.name] = client.wait_report()
+                await client.aclose()
+
+    report = asyncio.run(run())
+    if report is None:
+        return {"status": "failed", "wait_seconds": wait_seconds}
+    context.log.info(f"Streaming completed: {json.dumps(report)}")
+    return dict(report, status="completed", wait_seconds=wait_seconds, manifest=manifest.counts())
 
 def check_lang_captions(video_url, lang):
     command = [
@@ -816,19 +856,490 @@ def download_lang_captions(video_url, lang):
     except subprocess.CalledProcessError as e:
         print(f"Error downloading captions for {video_url}: {e}")
 
-# ---------------- Jobs and Sensor ----------------
-@job
-def process_and_download_job():
-    optimized_youtube_keyword_processor()
-    filter_song_urls()
-    download_audio_and_captions()
-    language_detection_client()
-    dialect_detection_client()
-    mixed_arabic_extractor()
-    audio_segmenter()
+# ---------------- Per-Video Stage Functions ----------------
+ARABIC_PATTERN = re.compile(r"[\u0600-\u06FF]+")
+ENGLISH_PATTERN = re.compile(r"[a-zA-Z]+")
+@contextmanager
+def segment_index_lock(output_folder):
+    """
+    Exclusive lock on an output folder's text.txt and audio_paths.txt, which
+    streaming segmenter threads and parallel shard runs share.
+    """
+    with open(os.path.join(output_folder, ".index.lock"), "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def download_video(url, target_lang, log):
+    """
+    Download the audio and target-language captions of one video if it has them.
+
+    Returns:
+        The video id if the video has target-language captions, None otherwise
+    """
+    if not check_lang_captions(url, target_lang):
+        return None
+    log.info(f"{url} has target subtitles ({target_lang})")
+    video_id = get_video_id(url)
+    if not video_id:
+        log.info(f"Could not extract video ID for {url}")
+        return None
+    if not check_file_existence(video_id, target_lang):
+        download_lang_captions(url, target_lang)
+    else:
+        log.info(f"Skipping: already downloaded {video_id}")
+    return video_id
+
+def split_transcriptions(contents):
+    """
+    Split the cues of a VTT file into mixed Arabic/English and Arabic-only ones.
+
+    Returns:
+        Tuple of (mixed language, Arabic-only) lists of (timestamp, transcription)
+    """
+    lines = contents.split("\n")
+    current_timestamp = ""
+    current_transcription = ""
+    mixed_language_transcriptions = []
+    arabic_only_transcriptions = []
+    for line in lines:
+        if "-->" in line:
+            # Save previous transcription if it contains Arabic characters
+            if ARABIC_PATTERN.search(current_transcription):
+                if ENGLISH_PATTERN.search(current_transcription):
+                    mixed_language_transcriptions.append((current_timestamp, current_transcription))
+                else:
+                    arabic_only_transcriptions.append((current_timestamp, current_transcription))
+            # Reset for the next transcription
+            current_timestamp = line.strip()
+            current_transcription = ""
+        else:
+            current_transcription += line.strip()
+    # Process any remaining transcription after the loop ends
+    if ARABIC_PATTERN.search(current_transcription):
+        if ENGLISH_PATTERN.search(current_transcription):
+            mixed_language_transcriptions.append((current_timestamp, current_transcription))
+        else:
+            arabic_only_transcriptions.append((current_timestamp, current_transcription))
+    return mixed_language_transcriptions, arabic_only_transcriptions
+
+def extract_transcriptions(vtt_file_path, mixedlanguage_folder, arabic_only_folder, log, lang="ar"):
+    """
+    Write the mixed language and Arabic-only transcriptions of one VTT file.
+    A file missing either kind is deleted along with its audio.
+
+    Returns:
+        Tuple of (outcome, files deleted); outcome is 'processed', 'deleted', 'skipped' or 'error'
+    """
+    vtt_file = os.path.basename(vtt_file_path)
+    mixedlanguage_file_path = os.path.join(mixedlanguage_folder, vtt_file[:-4] + "_mixedlanguage.vtt")
+    arabic_only_file_path = os.path.join(arabic_only_folder, vtt_file[:-4] + "_arabic_only.vtt")
+
+    # If both output files already exist, skip processing this file
+    if os.path.exists(mixedlanguage_file_path) and os.path.exists(arabic_only_file_path):
+        log.info(f"Skipping file '{vtt_file}' - output files already exist.")
+        return "skipped", 0
+
+    try:
+        with open(vtt_file_path, "r", encoding="utf-8") as file:
+            contents = file.read()
+    except Exception as e:
+        log.error(f"Error reading file {vtt_file}: {e}")
+        return "error", 0
+
+    mixed_language_transcriptions, arabic_only_transcriptions = split_transcriptions(contents)
+
+    delete_flag = False
+    # Save mixed language transcriptions if any
+    if mixed_language_transcriptions:
+        try:
+            with open(mixedlanguage_file_path, "w", encoding="utf-8") as f:
+                for timestamp, transcription in mixed_language_transcriptions:
+                    f.write("Timestamp: " + timestamp + "\n")
+                    f.write("Transcription: " + transcription + "\n\n")
+            record_added(mixedlanguage_file_path)
+            log.info(f"Processed file '{vtt_file}' - mixed language file saved.")
+            delete_flag = False
+        except Exception as e:
+            log.error(f"Error writing mixed language file for {vtt_file}: {e}")
+    else:
+        log.info(f"Skipping file '{vtt_file}' - no mixed language transcriptions found.")
+        delete_flag = True
+
+    # Save Arabic-only transcriptions if any
+    if arabic_only_transcriptions:
+        try:
+            with open(arabic_only_file_path, "w", encoding="utf-8") as f:
+                for timestamp, transcription in arabic_only_transcriptions:
+                    f.write("Timestamp: " + timestamp + "\n")
+                    f.write("Transcription: " + transcription + "\n\n")
+            record_added(arabic_only_file_path)
+            log.info(f"Processed file '{vtt_file}' - Arabic-only file saved.")
+            delete_flag = False
+        except Exception as e:
+            log.error(f"Error writing Arabic-only file for {vtt_file}: {e}")
+    else:
+        log.info(f"Skipping file '{vtt_file}' - no Arabic-only transcriptions found.")
+        delete_flag = True
+
+    if not delete_flag:
+        return "processed", 0
+
+    # If no valid transcriptions were found, delete the original VTT (and corresponding audio) file
+    deleted_count = 0
+    try:
+        os.remove(vtt_file_path)
+        record_removed(vtt_file_path)
+        log.info(f"Deleted VTT file: {vtt_file}")
+        deleted_count += 1
+    except Exception as e:
+        log.error(f"Error deleting VTT file {vtt_file}: {e}")
+    audio_file_name = vtt_file.replace(f".{lang}.vtt", ".mp3")
+    try:
+        audio_file_path = os.path.join(os.path.dirname(vtt_file_path), audio_file_name)
+        os.remove(audio_file_path)
+        record_removed(audio_file_path)
+        log.info(f"Deleted audio file: {audio_file_name}")
+        deleted_count += 1
+    except Exception as e:
+        log.error(f"Error deleting audio file {audio_file_name}: {e}")
+    return "deleted", deleted_count
+
+def find_vtt_files(mp3_file, folder1=None, folder2=None):
+    """Extracted transcriptions of an MP3 file in folder1, then folder2; either folder may be None"""
+    video_id = video_id_of(mp3_file)
+    vtt_files = []
+    for folder in (folder1, folder2):
+        if folder is not None:
+            vtt_files.extend(index_for(folder).paths(video_id, ".vtt"))
+    return vtt_files
+
+def read_timestamps_and_transcriptions_from_vtt(vtt_file_1, vtt_file_2=None):
+    timestamps = []
+    transcriptions = []
+    if vtt_file_1 and vtt_file_2:
+        with open(vtt_file_1, 'r', encoding='utf-8') as file:
+            lines = file.readlines()
+        with open(vtt_file_2, 'r', encoding='utf-8') as file:
+            lines += file.readlines()
+    else:
+        with open(vtt_file_1, 'r', encoding='utf-8') as file:
+            lines = file.readlines()
+
+    for line in lines:
+        if 'Timestamp' in line:
+            timestamp_line = line.strip().split(' ')
+            # Expecting a line such as: "Timestamp: <start_time> --> <end_time>"
+            start_time = timestamp_line[1]
+            end_time = timestamp_line[3]
+            if '-->' in end_time:
+                end_time = timestamp_line[5]
+            timestamps.append((start_time, end_time))
+        if 'Transcription' in line:
+            parts = line.strip().split('Transcription:')
+            if len(parts) > 1:
+                transcriptions.append(parts[1].strip())
+    return timestamps, transcriptions
+
+def timestamp_to_ms(timestamp):
+    h, m, s = map(float, timestamp.split(':'))
+    return int((h * 3600 + m * 60 + s) * 1000)
+
+def split_mp3(mp3_file, timestamps, transcriptions, output_folder):
+    text_file = os.path.join(output_folder, 'text.txt')
+    audio_paths_file = os.path.join(output_folder, 'audio_paths.txt')
+    audio = AudioSegment.from_mp3(mp3_file)
+    os.makedirs(output_folder, exist_ok=True)
+    name = os.path.splitext(os.path.basename(mp3_file))[0]
+    text_lines = []
+    audio_path_lines = []
+    for i, (start_time, end_time) in enumerate(timestamps):
+        start_ms = timestamp_to_ms(start_time)
+        end_ms = timestamp_to_ms(end_time)
+        segment = audio[start_ms:end_ms]
+        output_file = os.path.join(output_folder, f"{name}_segment_{i+1}.wav")
+        segment.export(output_file, format="wav", parameters=["-ar", "16000", "-ac", "1"])
+        text_lines.append(f"{name}_segment_{i+1} {transcriptions[i]}\n")
+        audio_path_lines.append(f"{name}_segment_{i+1}.wav {os.path.join(os.getcwd(), output_file)}\n")
+    # One locked append per file, so files segmented in parallel don't interleave their lines
+    with segment_index_lock(output_folder), open(audio_paths_file, 'a') as ap_file, open(text_file, 'a') as t_file:
+        ap_file.writelines(audio_path_lines)
+        t_file.writelines(text_lines)
+    return len(text_lines)
+
+def align_text_files(output_folder):
+    with segment_index_lock(output_folder):
+        audio_paths_file = os.path.join(output_folder, 'audio_paths.txt')
+        text_file = os.path.join(output_folder, 'text.txt')
+        if os.path.isfile(audio_paths_file):
+            with open(audio_paths_file, 'r+') as file:
+                existing_audio_paths = {line.strip() for line in file}
+                file.seek(0)
+                file.truncate()
+                for line in natsorted(existing_audio_paths):
+                    file.write(f"{line}\n")
+        if os.path.isfile(text_file):
+            with open(text_file, 'r+') as file:
+                existing_text = {line.strip() for line in file}
+                file.seek(0)
+                file.truncate()
+                for line in natsorted(existing_text):
+                    file.write(f"{line}\n")
+
+def segment_audio(mp3_file, folder1, folder2, output_folder, log):
+    """
+    Split one MP3 file into segments by the timestamps of its extracted transcriptions.
+
+    Returns:
+        Number of segments written, or None if the file has no transcriptions to split by
+    """
+    vtt_files = find_vtt_files(mp3_file, folder1, folder2)
+    if not vtt_files:
+        log.info(f"MP3 file: {mp3_file} has no corresponding VTT files.")
+        return None
+    log.info(f"Processing MP3 file: {mp3_file}")
+    segments = 0
+    if len(vtt_files) < 2:
+        for vtt_file in vtt_files:
+            timestamps, transcriptions = read_timestamps_and_transcriptions_from_vtt(vtt_file)
+            segments += split_mp3(mp3_file, timestamps, transcriptions, output_folder)
+            log.info(f"  MP3 file split based on timestamps in VTT file: {vtt_file}")
+    else:
+        timestamps, transcriptions = read_timestamps_and_transcriptions_from_vtt(vtt_files[0], vtt_files[1])
+        segments += split_mp3(mp3_file, timestamps, transcriptions, output_folder)
+        log.info(f"  MP3 file split based on timestamps in VTT files: {vtt_files[0]}, {vtt_files[1]}")
+    return segments
+
+# ---------------- Streaming Pipeline ----------------
+# Defaults for the 'stream' section of config.yaml
+STREAM_DEFAULTS = {
+    # Capacity of each queue between two stages; a full queue blocks the stage feeding it
+    "queue_size": 16,
+    "download_workers": 4,
+    "extract_workers": 2,
+    "segment_workers": 2,
+    # Files per LID/DID job, and how long those stages wait to fill a batch
+    "batch_size": 8,
+    "batch_linger_seconds": 2.0,
+}
+
+async def next_batch(inbox, batch_size, linger_seconds):
+    """
+    Wait for one item, then take whatever else arrives within linger_seconds, up to batch_size.
+
+    Returns:
+        List of items, or None once the stream has ended
+    """
+    item = await inbox.get()
+    if item is None:
+        # Leave the end marker for the stage's other workers
+        inbox.put_nowait(None)
+        return None
+    batch = [item]
+    deadline = time.monotonic() + linger_seconds
+    while len(batch) < batch_size:
+        try:
+            item = await asyncio.wait_for(inbox.get(), max(deadline - time.monotonic(), 0))
+        except asyncio.TimeoutError:
+            break
+        if item is None:
+            inbox.put_nowait(None)
+            break
+        batch.append(item)
+    return batch
+
+async def run_stage(name, inbox, outbox, handlers, stats, log, batch_size=1, linger_seconds=0.0):
+    """
+    Feed batches from inbox to the handlers, one worker per handler, and put what
+    they return on outbox. Puts the end marker on outbox once inbox has ended.
+    """
+    stage_stats = stats.setdefault(name, {"in": 0, "out": 0, "errors": 0, "busy_seconds": 0.0})
+
+    async def worker(handler):
+        while True:
+            batch = await next_batch(inbox, batch_size, linger_seconds)
+            if batch is None:
+                return
+            stage_stats["in"] += len(batch)
+            start_time = time.monotonic()
+            try:
+                outputs = await handler(batch)
+            except Exception as e:
+                log.error(f"Stream stage '{name}' failed on {batch}: {e}")
+                stage_stats["errors"] += len(batch)
+                outputs = []
+            stage_stats["busy_seconds"] += time.monotonic() - start_time
+            for output in outputs:
+                stage_stats["out"] += 1
+                await outbox.put(output)
+
+    await asyncio.gather(*(worker(handler) for handler in handlers))
+    await outbox.put(None)
+
+class NullQueue:
+    """Sink for the last stage's outputs"""
+
+    async def put(self, item):
+        pass
+
+async def stream_videos(urls, lid_clients, did_client, manifest, config, log):
+    """
+    Run each video through download, LID, DID, extraction and segmentation as
+    soon as the previous stage is done with it.
+
+    Stages are connected by bounded queues, so a slow stage holds back the ones
+    before it instead of letting work pile up. LID and DID get the videos in
+    small jobs, one worker per LID replica. Every stage records its result in
+    the manifest; videos it has already seen through are not streamed again,
+    and videos an interrupted run left part-way start at their next stage.
+
+    Returns:
+        Dict with per-stage counters, segmented videos and time to the first segmented video
+    """
+    options = dict(STREAM_DEFAULTS, **(config.get("stream") or {}))
+    target_lang = config.get("lang", "ar")
+    dialect = config.get("dialect", "ECA")
+    mixedlanguage_folder = os.path.join(os.getcwd(), f"mixedlanguage-{dialect}")
+    arabic_only_folder = os.path.join(os.getcwd(), f"arabic-only-{dialect}")
+    output_folder = os.path.join(os.getcwd(), f"output-folder-{dialect}")
+    for folder in [mixedlanguage_folder, arabic_only_folder, output_folder]:
+        os.makedirs(folder, exist_ok=True)
+
+    queues = {name: asyncio.Queue(maxsize=options["queue_size"]) for name in ("download", "lid", "did", "extract", "segment")}
+    stats = {}
+    start_time = time.monotonic()
+    first_segment_seconds = None
+    segmented = 0
+
+    # Stages pass video ids along; where each video's files are is in the manifest
+    async def download(batch):
+        url = batch[0]
+        row = manifest.get(get_video_id(url) or "")
+        if not needs_download(row):
+            # Already downloaded; feed puts it on the queue of its next stage
+            return []
+        download_start = time.monotonic()
+        video_id = await asyncio.to_thread(download_video, url, target_lang, log)
+        if not video_id:
+            return []
+        seconds = round(time.monotonic() - download_start, 3)
+        registered = await asyncio.to_thread(register_download, manifest, video_id, url, target_lang, seconds)
+        return [video_id] if registered and manifest.get(video_id)["stage"] == "downloaded" else []
+
+    def detect_language(client):
+        async def handler(batch):
+            job = await client.submit_job(files=[manifest.get(video_id)["audio_path"] for video_id in batch])
+            _, results = await client.follow_job(job["job_id"])
+            for result in results:
+                if result.get("status") != "success":
+                    log.error(f"LID failed on {result.get('file')}: {result.get('message')}")
+                manifest.record_lid(video_id_of(result["file"]), result)
+            return [video_id for video_id in batch if manifest.get(video_id)["stage"] == "language_detected"]
+        return handler
+
+    async def detect_dialect(batch):
+        did_start = time.monotonic()
+        job = await did_client.submit_job(files=[manifest.get(video_id)["captions_path"] for video_id in batch])
+        _, results = await did_client.follow_job(job["job_id"])
+        seconds = round((time.monotonic() - did_start) / len(batch), 3)
+        for result in results:
+            if result.get("status") == "error":
+                log.error(f"DID failed on {result.get('file')}: {result.get('message')}")
+            manifest.record_did(video_id_of(result["file"]), result, seconds)
+        return [video_id for video_id in batch if manifest.get(video_id)["dialect"] == dialect]
+
+    async def extract(batch):
+        video_id = batch[0]
+        extract_start = time.monotonic()
+        outcome, _ = await asyncio.to_thread(extract_transcriptions, manifest.get(video_id)["captions_path"], mixedlanguage_folder, arabic_only_folder, log)
+        manifest.record_extraction(video_id, outcome, round(time.monotonic() - extract_start, 3))
+        return [video_id] if outcome in ("processed", "skipped") else []
+
+    async def segment(batch):
+        nonlocal first_segment_seconds, segmented
+        video_id = batch[0]
+        segment_start = time.monotonic()
+        segments = await asyncio.to_thread(segment_audio, manifest.get(video_id)["audio_path"], arabic_only_folder, mixedlanguage_folder, output_folder, log)
+        manifest.record_segments(video_id, segments or 0, round(time.monotonic() - segment_start, 3))
+        if segments:
+            segmented += 1
+            if first_segment_seconds is None:
+                first_segment_seconds = round(time.monotonic() - start_time, 1)
+                log.info(f"First video segmented after {first_segment_seconds}s")
+        return []
+
+    def resumable():
+        """(queue name, video id) for each streamed video waiting for a stage after download"""
+        wanted = {get_video_id(url) for url in urls}
+        for row in manifest.pending(STAGES[0]):
+            if row["video_id"] in wanted and not os.path.exists(row["audio_path"]):
+                # Moved by a LID job that was interrupted before it reported the file
+                moved = find_moved_audio(row["audio_path"])
+                if moved is not None:
+                    manifest.record_lid(row["video_id"], moved)
+        resumed = []
+        for stage, queue_name in zip(STAGES, ("lid", "did", "extract", "segment")):
+            for row in manifest.pending(stage, dialect=dialect if stage == STAGES[2] else None):
+                # Downloaded videos whose audio is gone are fetched again by the download stage
+                if row["video_id"] in wanted and (stage != STAGES[0] or os.path.exists(row["audio_path"])):
+                    resumed.append((queue_name, row["video_id"]))
+        return resumed
+
+    async def feed():
+        resumed = await asyncio.to_thread(resumable)
+        if resumed:
+            log.info(f"Resuming {len(resumed)} videos an earlier run left part-way")
+        for queue_name, video_id in resumed:
+            await queues[queue_name].put(video_id)
+        for url in urls:
+            await queues["download"].put(url)
+        await queues["download"].put(None)
+
+    batching = {"batch_size": options["batch_size"], "linger_seconds": options["batch_linger_seconds"]}
+    await asyncio.gather(
+        feed(),
+        run_stage("download", queues["download"], queues["lid"], [download] * options["download_workers"], stats, log),
+        run_stage("lid", queues["lid"], queues["did"], [detect_language(client) for client in lid_clients], stats, log, **batching),
+        run_stage("did", queues["did"], queues["extract"], [detect_dialect], stats, log, **batching),
+        run_stage("extract", queues["extract"], queues["segment"], [extract] * options["extract_workers"], stats, log),
+        run_stage("segment", queues["segment"], NullQueue(), [segment] * options["segment_workers"], stats, log),
+    )
+    await asyncio.to_thread(align_text_files, output_folder)
+
+    return {
+        "stages": {name: dict(counters, busy_seconds=round(counters["busy_seconds"], 1)) for name, counters in stats.items()},
+        "segmented_videos": segmented,
+        "first_segment_seconds": first_segment_seconds,
+        "elapsed_seconds": round(time.monotonic() - start_time, 1),
+    }
+
+# ---------------- Jobs and Sensors ----------------
+process_keywords_job = define_asset_job(
+    "process_keywords_job",
+    selection=[optimized_youtube_keyword_processor, filter_song_urls],
+)
+
+process_video_shard_job = define_asset_job(
+    "process_video_shard_job",
+    selection=[download_audio_and_captions, language_detection_client, dialect_detection_client, mixed_arabic_extractor, audio_segmenter],
+    partitions_def=VIDEO_SHARDS,
+    # A step that fails because a service is down is retried within the run
+    op_retry_policy=RetryPolicy(max_retries=2, delay=60, backoff=Backoff.EXPONENTIAL),
+)
+
+stream_videos_job = define_asset_job(
+    "stream_videos_job",
+    selection=[optimized_youtube_keyword_processor, filter_song_urls, streaming_pipeline],
+)
+
+def streaming_mode():
+    # pipeline_mode: "stream" runs each video through all stages as soon as it is downloaded
+    return load_pipeline_config().get("pipeline_mode", "batch") == "stream"
 
 @sensor(
-    job=process_and_download_job,
+    jobs=[process_keywords_job, stream_videos_job],
     minimum_interval_seconds=5,
     default_status=DefaultSensorStatus.RUNNING,
 )
@@ -839,11 +1350,79 @@ def keyword_file_sensor(context):
     if new_keywords:
         context.log.info(f"New keywords detected: {new_keywords}")
         run_key = "new_" + "_".join(sorted(new_keywords))
-        return RunRequest(run_key=run_key)
+        job_name = stream_videos_job.name if streaming_mode() else process_keywords_job.name
+        return RunRequest(run_key=run_key, job_name=job_name)
     return None
 
+def urls_filtered(context):
+    """
+    Whether filter_song_urls has materialized since URLS_FILE was last
+    written; the keyword search rewrites it after every keyword, before the
+    song URLs are filtered out.
+    """
+    if not os.path.exists(URLS_FILE):
+        return True
+    event = context.instance.get_latest_materialization_event(filter_song_urls.key)
+    return event is not None and event.timestamp >= os.path.getmtime(URLS_FILE)
+
+def latest_shard_run(context, shard):
+    runs = context.instance.get_runs(
+        filters=RunsFilter(job_name=process_video_shard_job.name, tags={"dagster/partition": shard}),
+        limit=1,
+    )
+    return runs[0] if runs else None
+
+def shard_run_key(shard, urls, unfinished, latest_run):
+    """
+    Run key of a shard: its URLs plus the stage of each of its unfinished
+    videos, so a shard whose videos are still moving through the stages is
+    run again. A key whose last run failed gets a retry suffix, since a
+    failed run usually leaves the manifest unchanged.
+    """
+    key = f"{shard}:{fingerprint(urls)}:{fingerprint(unfinished)}"
+    if (
+        latest_run is not None
+        and latest_run.status == DagsterRunStatus.FAILURE
+        and latest_run.tags.get("dagster/run_key", "").startswith(key)
+    ):
+        key += f":retry-{latest_run.run_id[:8]}"
+    return key
+
+@sensor(
+    job=process_video_shard_job,
+    minimum_interval_seconds=30,
+    default_status=DefaultSensorStatus.RUNNING,
+)
+def video_shard_sensor(context):
+    """
+    Request a run for every shard whose URLs or unfinished videos changed
+    since its last run, once the song URLs have been filtered out. Shards
+    that have not changed are not run again and changed ones run in parallel.
+    """
+    if streaming_mode():
+        return None
+    if not urls_filtered(context):
+        context.log.info(f"Waiting for filter_song_urls to process {URLS_FILE}")
+        return None
+    unfinished = {}
+    manifest = open_manifest()
+    try:
+        for row in manifest.unfinished():
+            unfinished.setdefault(row["shard"], []).append(f"{row['video_id']}:{row['stage']}")
+    finally:
+        manifest.close()
+    requests = []
+    for shard, urls in sorted(urls_by_shard(read_url_lists()).items()):
+        latest_run = latest_shard_run(context, shard)
+        if latest_run is not None and not latest_run.is_finished:
+            # Its videos change stage while it runs; look again once it is done
+            continue
+        run_key = shard_run_key(shard, urls, unfinished.get(shard, []), latest_run)
+        requests.append(RunRequest(run_key=run_key, partition_key=shard))
+    return requests
+
 defs = Definitions(
-    assets=[optimized_youtube_keyword_processor, filter_song_urls, download_audio_and_captions, language_detection_client, dialect_detection_client, mixed_arabic_extractor, audio_segmenter],
-    jobs=[process_and_download_job],
-    sensors=[keyword_file_sensor],
+    assets=[optimized_youtube_keyword_processor, filter_song_urls, download_audio_and_captions, language_detection_client, dialect_detection_client, mixed_arabic_extractor, audio_segmenter, streaming_pipeline],
+    jobs=[process_keywords_job, process_video_shard_job, stream_videos_job],
+    sensors=[keyword_file_sensor, video_shard_sensor],
 )
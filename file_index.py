@@ -0,0 +1,110 @@
+import os
+import shutil
+import threading
+
+# Shared by the pipeline and the LID/DID services; both images are built from
+# the repository root and copy this file next to their own modules
+
+def video_id_of(name):
+    """'<id>.mp3', '<id>.ar.vtt' or '<id>.ar_arabic_only.vtt' -> '<id>'"""
+    return os.path.basename(name).split(".")[0]
+
+class FileIndex:
+    """
+    The files directly inside one directory, grouped by video id.
+
+    The directory is read once with os.scandir, so finding a file's sidecars
+    (its captions, its audio) is a dict lookup rather than a listing of the
+    whole directory. Files moved, added or removed through the index keep it
+    current. A lookup made on behalf of a file the index hasn't seen means
+    something else wrote to the directory since the scan, and rescans it once.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.groups = {}
+        self.scan()
+
+    def scan(self):
+        groups = {}
+        if os.path.isdir(self.path):
+            with os.scandir(self.path) as entries:
+                for entry in entries:
+                    if entry.is_file():
+                        groups.setdefault(video_id_of(entry.name), set()).add(entry.name)
+        with self.lock:
+            self.groups = groups
+
+    def __contains__(self, name):
+        with self.lock:
+            return name in self.groups.get(video_id_of(name), ())
+
+    def names(self, video_id, suffix="", refresh_for=None):
+        """
+        Names of a video's files ending with suffix, sorted.
+
+        Args:
+            video_id: Video id, see video_id_of
+            suffix: File name suffix such as '.vtt'
+            refresh_for: Name of a file known to be in the directory; the
+                directory is rescanned first if the index hasn't seen it
+        """
+        if refresh_for is not None and refresh_for not in self:
+            self.scan()
+        with self.lock:
+            return sorted(name for name in self.groups.get(video_id, ()) if name.endswith(suffix))
+
+    def paths(self, video_id, suffix="", refresh_for=None):
+        return [os.path.join(self.path, name) for name in self.names(video_id, suffix, refresh_for)]
+
+    def all_names(self, suffix=""):
+        """Every file name in the directory ending with suffix, sorted"""
+        with self.lock:
+            return sorted(name for names in self.groups.values() for name in names if name.endswith(suffix))
+
+    def add(self, name):
+        with self.lock:
+            self.groups.setdefault(video_id_of(name), set()).add(name)
+
+    def discard(self, name):
+        with self.lock:
+            names = self.groups.get(video_id_of(name))
+            if names is not None:
+                names.discard(name)
+                if not names:
+                    del self.groups[video_id_of(name)]
+
+    def move(self, name, destination):
+        """Move a file to another directory, updating this index and the destination's if it is cached"""
+        target = os.path.join(destination, name)
+        shutil.move(os.path.join(self.path, name), target)
+        self.discard(name)
+        record_added(target)
+        return target
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def index_for(path):
+    """The process-wide index of a directory, scanned on first use"""
+    key = os.path.abspath(path)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = _indexes[key] = FileIndex(path)
+        return index
+
+def record_added(file_path):
+    """Tell the cached index of the file's directory, if there is one, about a new file"""
+    with _indexes_lock:
+        index = _indexes.get(os.path.abspath(os.path.dirname(file_path)))
+    if index is not None:
+        index.add(os.path.basename(file_path))
+
+def record_removed(file_path):
+    """Tell the cached index of the file's directory, if there is one, that a file is gone"""
+    with _indexes_lock:
+        index = _indexes.get(os.path.abspath(os.path.dirname(file_path)))
+    if index is not None:
+        index.discard(os.path.basename(file_path))
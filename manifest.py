@@ -0,0 +1,208 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+MANIFEST_PATH = "url_list/manifest.sqlite3"
+
+# Stages a video moves through, in order; a video that leaves the pipeline
+# early (not Arabic, no usable transcriptions) is marked "excluded" and one
+# that can't be processed at all "failed"
+STAGES = ("downloaded", "language_detected", "dialect_detected", "extracted", "segmented")
+EXCLUDED = "excluded"
+FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS videos (
+    video_id TEXT PRIMARY KEY,
+    url TEXT,
+    shard TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    audio_path TEXT,
+    captions_path TEXT,
+    audio_sha1 TEXT,
+    captions_sha1 TEXT,
+    language TEXT,
+    lid_route TEXT,
+    dialect TEXT,
+    did_decided_by TEXT,
+    extraction TEXT,
+    segments INTEGER,
+    error TEXT,
+    download_seconds REAL,
+    lid_seconds REAL,
+    did_seconds REAL,
+    extract_seconds REAL,
+    segment_seconds REAL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS videos_by_stage ON videos (stage, shard);
+"""
+
+def file_sha1(path):
+    """SHA-1 of a file's contents, or None if it doesn't exist"""
+    if not path or not os.path.exists(path):
+        return None
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+class Manifest:
+    """
+    SQLite table with one row per video: the stage it has reached, where its
+    files are, their content hashes, the LID and DID outputs, segment counts
+    and per-stage timings.
+
+    Stages find their work with pending(), which reads the (stage, shard)
+    index instead of listing folders, and each record_* call updates a row in
+    its own transaction. The database runs in WAL mode so shard runs in
+    separate processes can write to it at the same time.
+    """
+
+    def __init__(self, path=MANIFEST_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.lock = threading.Lock()
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def get(self, video_id):
+        with self.lock:
+            row = self.conn.execute("SELECT * FROM videos WHERE video_id = ?", (video_id,)).fetchone()
+        return dict(row) if row else None
+
+    def videos(self, shard):
+        """Every video of a shard, in video id order"""
+        with self.lock:
+            rows = self.conn.execute("SELECT * FROM videos WHERE shard = ? ORDER BY video_id", (shard,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def pending(self, stage, shard=None, dialect=None):
+        """
+        Videos that have reached stage and wait for the next one.
+
+        Args:
+            stage: One of STAGES
+            shard: Only videos of this shard, if given
+            dialect: Only videos of this dialect folder ('ECA' or 'MSA'), if given
+
+        Returns:
+            List of row dicts, in video id order
+        """
+        query = "SELECT * FROM videos WHERE stage = ?"
+        params = [stage]
+        if shard is not None:
+            query += " AND shard = ?"
+            params.append(shard)
+        if dialect is not None:
+            query += " AND dialect = ?"
+            params.append(dialect)
+        with self.lock:
+            rows = self.conn.execute(query + " ORDER BY video_id", params).fetchall()
+        return [dict(row) for row in rows]
+
+    def unfinished(self):
+        """Videos of every shard that are still moving through the stages"""
+        query = f"SELECT video_id, shard, stage FROM videos WHERE stage IN ({', '.join('?' * (len(STAGES) - 1))})"
+        with self.lock:
+            rows = self.conn.execute(query + " ORDER BY video_id", STAGES[:-1]).fetchall()
+        return [dict(row) for row in rows]
+
+    def counts(self, shard=None):
+        """Number of videos at each stage"""
+        query = "SELECT stage, COUNT(*) FROM videos"
+        params = []
+        if shard is not None:
+            query += " WHERE shard = ?"
+            params.append(shard)
+        with self.lock:
+            rows = self.conn.execute(query + " GROUP BY stage", params).fetchall()
+        return {stage: count for stage, count in rows}
+
+    def _update(self, video_id, **columns):
+        columns["updated_at"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in columns)
+        with self.lock, self.conn:
+            self.conn.execute(f"UPDATE videos SET {assignments} WHERE video_id = ?", (*columns.values(), video_id))
+
+    def record_download(self, video_id, url, shard, audio_path, captions_path, seconds=None):
+        """
+        Register a downloaded video. A video already in the manifest keeps its
+        progress unless the content of its audio or captions changed, in which
+        case it starts over.
+        """
+        audio_sha1 = file_sha1(audio_path)
+        captions_sha1 = file_sha1(captions_path)
+        existing = self.get(video_id)
+        if existing and (existing["audio_sha1"], existing["captions_sha1"]) == (audio_sha1, captions_sha1):
+            return
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM videos WHERE video_id = ?", (video_id,))
+            self.conn.execute(
+                "INSERT INTO videos (video_id, url, shard, stage, audio_path, captions_path, audio_sha1, captions_sha1, "
+                "download_seconds, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (video_id, url, shard, STAGES[0], audio_path, captions_path, audio_sha1, captions_sha1, seconds, time.time()),
+            )
+
+    def record_lid(self, video_id, result):
+        """
+        Store a LID server result. The server moves the audio and captions to
+        the language folder; Arabic videos with captions go on to DID.
+        """
+        if result.get("status") != "success":
+            # Quarantined files can't be decoded; other errors are retried on the next run
+            stage = FAILED if "quarantined" in result else STAGES[0]
+            self._update(video_id, stage=stage, error=result.get("message"), lid_seconds=result.get("seconds"))
+            return
+        row = self.get(video_id)
+        folder = os.path.dirname(result["destination"])
+        captions_path = os.path.join(folder, os.path.basename(row["captions_path"])) if result.get("vtt_found") and row["captions_path"] else None
+        arabic = result["language"].strip() == "Arabic" and captions_path is not None
+        self._update(
+            video_id,
+            stage=STAGES[1] if arabic else EXCLUDED,
+            language=result["language"].strip(),
+            lid_route=result.get("route"),
+            audio_path=result["destination"],
+            captions_path=captions_path,
+            error=None,
+            lid_seconds=result.get("seconds"),
+        )
+
+    def record_did(self, video_id, result, seconds=None):
+        """Store a DID server result; the server moves the files to the ECA or MSA folder"""
+        if result.get("status") == "error":
+            self._update(video_id, error=result.get("message"))
+            return
+        row = self.get(video_id)
+        folder = os.path.join(os.path.dirname(row["captions_path"]), result["target_folder"])
+        self._update(
+            video_id,
+            stage=STAGES[2],
+            dialect=result["target_folder"],
+            did_decided_by=result.get("decided_by"),
+            audio_path=os.path.join(folder, os.path.basename(row["audio_path"])),
+            captions_path=os.path.join(folder, os.path.basename(row["captions_path"])),
+            error=None,
+            did_seconds=seconds,
+        )
+
+    def record_extraction(self, video_id, outcome, seconds=None):
+        """Store the outcome of extract_transcriptions; deleted files leave the pipeline"""
+        if outcome == "error":
+            self._update(video_id, extraction=outcome, extract_seconds=seconds)
+            return
+        stage = EXCLUDED if outcome == "deleted" else STAGES[3]
+        self._update(video_id, stage=stage, extraction=outcome, error=None, extract_seconds=seconds)
+
+    def record_segments(self, video_id, segments, seconds=None):
+        """Store the number of segments a video was split into"""
+        self._update(video_id, stage=STAGES[4] if segments else EXCLUDED, segments=segments, segment_seconds=seconds)
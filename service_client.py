@@ -0,0 +1,281 @@
+import asyncio
+import json
+import logging
+import random
+import time
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Long-poll window for /status; the servers cap it at 60 seconds
+LONG_POLL_SECONDS = 30
+# The servers send an SSE keepalive every 15 seconds, so a stream silent for longer is dead
+STREAM_READ_TIMEOUT = 60
+# How often progress is logged while following a job
+PROGRESS_LOG_SECONDS = 30
+PAGE_SIZE = 1000
+
+class ServiceError(RuntimeError):
+    """A LID/DID service answered with an error or could not be reached within the retry budget"""
+
+def backoff_delays(base=0.5, cap=10.0):
+    """Endless full-jitter exponential backoff: uniform(0, min(cap, base * 2 ** attempt))"""
+    attempt = 0
+    while True:
+        yield random.uniform(0, min(cap, base * 2 ** attempt))
+        attempt += 1
+
+def format_progress(progress):
+    return (
+        f"{progress.get('done', 0)} done, {progress.get('failed', 0)} failed, "
+        f"{progress.get('remaining', '?')} remaining, {progress.get('files_per_second', 0)} files/s, "
+        f"ETA {progress.get('eta_seconds')}s"
+    )
+
+async def read_events(response):
+    """Yield (event, data) pairs from a server-sent events response"""
+    event, data = "message", []
+    async for line in response.aiter_lines():
+        if not line:
+            if data:
+                yield event, "\n".join(data)
+            event, data = "message", []
+        elif line.startswith(":"):
+            # Keepalive comment
+            continue
+        elif line.startswith("event:"):
+            event = line[6:].strip()
+        elif line.startswith("data:"):
+            data.append(line[5:].strip())
+
+class ServiceClient:
+    """
+    Async client for one LID or DID server.
+
+    Requests share a pooled keep-alive connection, transient failures are
+    retried with jittered exponential backoff, and completion is awaited with
+    the server's event stream or long-polling rather than fixed-interval
+    polling. The time spent waiting on the service is added up per phase
+    ("health", "job") in wait_seconds.
+    """
+
+    def __init__(self, base_url, name=None, log=None, retries=5, max_connections=8):
+        self.base_url = base_url.rstrip("/")
+        self.name = name or self.base_url
+        self.log = log or logger
+        self.retries = retries
+        self.http = httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=httpx.Timeout(30.0, read=LONG_POLL_SECONDS + 30),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+        self.wait_seconds = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self):
+        await self.http.aclose()
+
+    def _waited(self, phase, seconds):
+        self.wait_seconds[phase] = self.wait_seconds.get(phase, 0.0) + seconds
+
+    def wait_report(self):
+        """Seconds spent waiting on the service, per phase"""
+        return {phase: round(seconds, 1) for phase, seconds in self.wait_seconds.items()}
+
+    async def _request(self, method, path, retry_on=httpx.TransportError, **kwargs):
+        """
+        Send a request, retrying transport errors and 5xx answers with backoff.
+
+        Returns:
+            The response; 4xx responses are returned as-is since they carry an error message
+        """
+        delays = backoff_delays()
+        for attempt in range(self.retries + 1):
+            try:
+                response = await self.http.request(method, path, **kwargs)
+                if response.status_code < 500:
+                    return response
+                error = ServiceError(f"HTTP {response.status_code}")
+            except retry_on as e:
+                error = e
+            if attempt == self.retries:
+                break
+            delay = next(delays)
+            self.log.warning(f"{self.name}: {method} {path} failed ({error}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+        raise ServiceError(f"{self.name}: {method} {path} failed after {self.retries + 1} attempts: {error}") from error
+
+    async def wait_until_healthy(self, wait_for_model=True, timeout=600):
+        """
+        Check /health, retrying with backoff until the model is loaded.
+
+        Args:
+            wait_for_model: If False, return after the first check
+            timeout: Maximum seconds to wait for the model
+
+        Returns:
+            Boolean indicating whether the server is up with its model loaded
+        """
+        start_time = time.monotonic()
+        delays = backoff_delays()
+        try:
+            while True:
+                try:
+                    response = await self.http.get("/health", timeout=10)
+                    data = response.json()
+                    if response.status_code == 200 and data.get("model_loaded"):
+                        self.log.info(f"{self.name} is healthy, model loaded")
+                        return True
+                    message = data.get("message") or f"status {data.get('status', response.status_code)}"
+                except (httpx.HTTPError, ValueError) as e:
+                    message = f"error connecting: {e}"
+                elapsed = time.monotonic() - start_time
+                if not wait_for_model:
+                    self.log.error(f"{self.name} is not ready: {message}")
+                    return False
+                if elapsed > timeout:
+                    self.log.error(f"Timeout waiting for {self.name} ({timeout} seconds): {message}")
+                    return False
+                delay = next(delays)
+                self.log.info(f"{self.name}: {message}. Retrying in {delay:.1f}s ({elapsed:.1f}s elapsed)")
+                await asyncio.sleep(delay)
+        finally:
+            self._waited("health", time.monotonic() - start_time)
+
+    async def start_processing(self):
+        """POST /process, which starts a job over the server's default folder"""
+        # Only retried if the request never reached the server
+        response = await self._request("POST", "/process", retry_on=(httpx.ConnectError, httpx.ConnectTimeout))
+        return response.json()
+
+    async def submit_job(self, files=None, directory=None):
+        """
+        POST /jobs for an explicit file list or a directory.
+
+        Returns:
+            The server's answer, with the job id under 'job_id'
+
+        Raises:
+            ServiceError: If the server rejects the job
+        """
+        payload = {"files": files} if files is not None else {"directory": directory}
+        response = await self._request("POST", "/jobs", json=payload, retry_on=(httpx.ConnectError, httpx.ConnectTimeout))
+        data = response.json()
+        if response.status_code != 202:
+            raise ServiceError(f"{self.name} rejected the job: {data.get('message')}")
+        return data
+
+    async def follow_job(self, job_id):
+        """
+        Stream a job's events until it finishes, reconnecting after the last
+        result seen if the connection drops.
+
+        Returns:
+            Tuple of (final job summary, results)
+        """
+        path = f"/jobs/{job_id}/events"
+        results = []
+        start_time = time.monotonic()
+        last_log = start_time
+        delays = backoff_delays()
+        failures = 0
+        try:
+            while True:
+                try:
+                    headers = {"Last-Event-ID": str(len(results))} if results else {}
+                    timeout = httpx.Timeout(30.0, read=STREAM_READ_TIMEOUT)
+                    async with self.http.stream("GET", path, headers=headers, timeout=timeout) as response:
+                        if response.status_code >= 400:
+                            await response.aread()
+                            raise ServiceError(f"{self.name}: GET {path} returned HTTP {response.status_code}: {response.text}")
+                        async for event, data in read_events(response):
+                            failures = 0
+                            if event == "result":
+                                results.append(json.loads(data))
+                            elif event == "done":
+                                return json.loads(data), results
+                            if time.monotonic() - last_log > PROGRESS_LOG_SECONDS:
+                                last_log = time.monotonic()
+                                self.log.info(f"{self.name}: job {job_id} has {len(results)} files finished")
+                    raise httpx.RemoteProtocolError("event stream closed before the job finished")
+                except httpx.TransportError as e:
+                    failures += 1
+                    if failures > self.retries:
+                        raise ServiceError(f"{self.name}: lost job {job_id} after {failures} reconnects: {e}") from e
+                    delay = next(delays)
+                    self.log.warning(f"{self.name}: event stream for job {job_id} dropped ({e}), reconnecting in {delay:.1f}s")
+                    await asyncio.sleep(delay)
+        finally:
+            self._waited("job", time.monotonic() - start_time)
+
+    async def get_job(self, job_id, page_size=PAGE_SIZE):
+        """
+        Page through GET /jobs/<id> without waiting for the job to finish.
+
+        Returns:
+            Tuple of (job summary, results), or None if the server doesn't know the job
+        """
+        results = []
+        cursor = 0
+        while True:
+            response = await self._request("GET", f"/jobs/{job_id}", params={"cursor": cursor, "limit": page_size})
+            if response.status_code == 404:
+                return None
+            page = response.json()
+            if response.status_code >= 400:
+                raise ServiceError(f"{self.name}: GET /jobs/{job_id} returned HTTP {response.status_code}: {page.get('message')}")
+            results.extend(page.get("results", []))
+            cursor = page.get("next_cursor", cursor)
+            if not page.get("results") or cursor >= page.get("progress", {}).get("total", 0):
+                break
+        for key in ("results", "cursor", "next_cursor", "has_more"):
+            page.pop(key, None)
+        return page, results
+
+    async def follow_status(self, page_size=PAGE_SIZE):
+        """
+        Long-poll /status until the job started by /process finishes, logging
+        the live counters, then page through the results.
+
+        Returns:
+            Final status dict with all results
+        """
+        start_time = time.monotonic()
+        try:
+            cursor = 0
+            while True:
+                response = await self._request("GET", "/status", params={"limit": 0, "cursor": cursor, "wait": LONG_POLL_SECONDS})
+                status = response.json()
+                if status.get("status") != "processing":
+                    break
+                progress = status.get("progress", {})
+                # Only wake up again once another file has finished (or the wait expires)
+                cursor = progress.get("done", 0) + progress.get("failed", 0)
+                self.log.info(f"{self.name} processing: {format_progress(progress)}")
+
+            if "progress" not in status:
+                # Error or idle responses carry no job
+                return status
+
+            results = []
+            cursor = 0
+            while True:
+                response = await self._request("GET", "/status", params={"cursor": cursor, "limit": page_size})
+                page = response.json()
+                results.extend(page.get("results", []))
+                cursor = page.get("next_cursor", cursor)
+                if not page.get("has_more") or not page.get("results"):
+                    break
+        finally:
+            self._waited("job", time.monotonic() - start_time)
+
+        status["results"] = results
+        for key in ("cursor", "next_cursor", "has_more"):
+            status.pop(key, None)
+        return status
@@ -0,0 +1,147 @@
+import json
+import threading
+import time
+import uuid
+
+# Shared by the LID and DID job queues; both images are built from the repository
+# root and copy this file next to their own modules
+
+class Job:
+    """A batch of files submitted to the server, with its own status and results"""
+
+    def __init__(self, files, source=None, job_id=None, created_at=None):
+        self.id = job_id or uuid.uuid4().hex
+        self.files = list(files)
+        self.source = source
+        self.status = "queued"
+        self.results = []
+        self.failed = 0
+        self.created_at = created_at or time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.next_index = 0
+        # Notified whenever a result is added or the job finishes
+        self.changed = threading.Condition()
+
+    @property
+    def done(self):
+        return self.status in ("completed", "error")
+
+    def mark_started(self):
+        with self.changed:
+            if self.started_at is None:
+                self.started_at = time.time()
+                self.status = "processing"
+
+    def finish(self, status="completed"):
+        with self.changed:
+            self.status = status
+            self.finished_at = time.time()
+            self.changed.notify_all()
+
+    def add_result(self, result):
+        """Record a file's outcome; returns True if it was the job's last file"""
+        with self.changed:
+            self.results.append(result)
+            if result.get("status") == "error":
+                self.failed += 1
+            completed = len(self.results) == len(self.files)
+            if completed:
+                self.status = "completed"
+                self.finished_at = time.time()
+            self.changed.notify_all()
+            return completed
+
+    def progress(self):
+        """Live counters; cheap enough to compute on every poll"""
+        with self.changed:
+            processed = len(self.results)
+            remaining = len(self.files) - processed
+            end_time = self.finished_at or time.time()
+            elapsed = end_time - self.started_at if self.started_at else 0.0
+            files_per_second = processed / elapsed if elapsed > 0 else 0.0
+            eta = remaining / files_per_second if files_per_second > 0 else None
+            return {
+                "total": len(self.files),
+                "done": processed - self.failed,
+                "failed": self.failed,
+                "remaining": remaining,
+                "files_per_second": round(files_per_second, 3),
+                "eta_seconds": round(eta, 1) if eta is not None else None,
+                "elapsed_seconds": round(elapsed, 1),
+            }
+
+    def summary(self):
+        with self.changed:
+            data = {
+                "job_id": self.id,
+                "status": self.status,
+                "source": self.source,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+            }
+        data["progress"] = self.progress()
+        return data
+
+    def page(self, cursor=0, limit=500):
+        """
+        Return results[cursor:cursor + limit]; results are append-only, so a
+        cursor stays valid for the lifetime of the job.
+        """
+        with self.changed:
+            results = self.results[cursor:cursor + limit]
+            next_cursor = cursor + len(results)
+            return {
+                "results": results,
+                "cursor": cursor,
+                "next_cursor": next_cursor,
+                "has_more": next_cursor < len(self.results) or not self.done,
+            }
+
+    def wait_for_results(self, cursor, timeout):
+        """Block until there are results past the cursor, the job finishes or the timeout expires"""
+        with self.changed:
+            return self.changed.wait_for(lambda: len(self.results) > cursor or self.done, timeout=timeout)
+
+# Result paging and long-polling limits for /status, /jobs/<id> and the event streams
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 5000
+MAX_WAIT_SECONDS = 60
+SSE_KEEPALIVE_SECONDS = 15
+
+def page_args(request):
+    """Read cursor, limit and long-poll wait (seconds) from a Flask request's query string"""
+    cursor = max(request.args.get("cursor", 0, type=int), 0)
+    limit = min(max(request.args.get("limit", DEFAULT_PAGE_SIZE, type=int), 0), MAX_PAGE_SIZE)
+    wait = min(max(request.args.get("wait", 0, type=float), 0.0), MAX_WAIT_SECONDS)
+    return cursor, limit, wait
+
+def job_page(job, request, summarize=Job.summary):
+    """Job summary (from summarize) with live counters and one page of results, long-polling if asked to"""
+    cursor, limit, wait = page_args(request)
+    if wait:
+        job.wait_for_results(cursor, wait)
+    data = summarize(job)
+    data.update(job.page(cursor, limit))
+    return data
+
+def event_cursor(request):
+    """Where an event stream resumes: after the last event the client saw"""
+    cursor = request.headers.get("Last-Event-ID", type=int) or request.args.get("cursor", 0, type=int)
+    return max(cursor, 0)
+
+def stream_job_events(job, cursor, summarize=Job.summary):
+    """Server-sent events: one 'result' event per finished file, then a 'done' event"""
+    while True:
+        job.wait_for_results(cursor, SSE_KEEPALIVE_SECONDS)
+        page = job.page(cursor, MAX_PAGE_SIZE)
+        for result in page["results"]:
+            cursor += 1
+            yield f"id: {cursor}\nevent: result\ndata: {json.dumps(result, ensure_ascii=False)}\n\n"
+        if job.done and not page["has_more"]:
+            yield f"event: done\ndata: {json.dumps(summarize(job))}\n\n"
+            return
+        if not page["results"]:
+            # Comment line keeps proxies from closing an idle connection
+            yield ": keepalive\n\n"
@@ -0,0 +1,68 @@
+import argparse
+import json
+import time
+
+import torch
+
+from dialect_engine import BACKENDS, DialectEngine
+from distill_ngram import collect_cues
+
+MODEL_NAME = "AMR-KELEG/ADI-NADI-2023"
+MODEL_DIR = "did-model"
+
+def main():
+    parser = argparse.ArgumentParser(description="Check int8/ONNX dialect backends against the eager model and time them")
+    parser.add_argument("--folder", default="audio-and-captions/Arabic", help="Folder searched recursively for VTT files")
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS, help="Backends to evaluate")
+    parser.add_argument("--max-cues", type=int, default=5000, help="Distinct cues to classify")
+    parser.add_argument("--batch-size", type=int, default=32, help="Cues per forward pass")
+    parser.add_argument("--max-length", type=int, default=128, help="Token limit per cue")
+    parser.add_argument("--threads", type=int, default=None, help="torch/onnxruntime intra-op threads")
+    parser.add_argument("--min-agreement", type=float, default=0.99, help="Minimum label agreement with eager to recommend a backend")
+    parser.add_argument("--output", default="did_benchmark.json", help="Where to write the JSON report")
+    args = parser.parse_args()
+
+    # Distinct cues only, so the engine's cache can't flatter any backend
+    texts = list(dict.fromkeys(text for cues in collect_cues(args.folder, args.max_cues).values() for text in cues))[:args.max_cues]
+    if not texts:
+        print(f"No VTT files with cues under {args.folder}")
+        return
+    print(f"Benchmarking on {len(texts)} distinct cues")
+
+    backends = ["eager"] + [backend for backend in args.backends if backend != "eager"]
+    reports = {}
+    reference = None
+    for backend in backends:
+        engine = DialectEngine(MODEL_NAME, batch_size=args.batch_size, max_length=args.max_length, cache_size=0,
+                               device="cpu", backend=backend, num_threads=args.threads, model_dir=MODEL_DIR)
+        # Warm-up so lazy initialisation isn't billed to the run
+        engine.classify(texts[:args.batch_size])
+        engine.cache.clear()
+
+        start_time = time.perf_counter()
+        predictions = engine.classify(texts)
+        elapsed = time.perf_counter() - start_time
+        if reference is None:
+            reference = predictions
+
+        agreement = sum(label == reference_label for (label, _), (reference_label, _) in zip(predictions, reference)) / len(texts)
+        score_diffs = [abs(score - reference_score) for (_, score), (_, reference_score) in zip(predictions, reference)]
+        reports[backend] = {
+            "label_agreement_with_eager": round(agreement, 4),
+            "mean_score_diff": round(sum(score_diffs) / len(score_diffs), 5),
+            "max_score_diff": round(max(score_diffs), 5),
+            "cues_per_second": round(len(texts) / elapsed, 1),
+        }
+        print(f"{backend:>6}: agreement {agreement:.4f}, max score diff {reports[backend]['max_score_diff']:.5f}, "
+              f"{reports[backend]['cues_per_second']:.1f} cues/s")
+
+    eligible = [backend for backend in backends if reports[backend]["label_agreement_with_eager"] >= args.min_agreement]
+    recommended = max(eligible, key=lambda backend: reports[backend]["cues_per_second"])
+    print(f"\nFastest backend with at least {args.min_agreement:.2%} agreement: {recommended} (set DID_BACKEND={recommended})")
+
+    with open(args.output, 'w') as f:
+        json.dump({"cues": len(texts), "threads": args.threads or torch.get_num_threads(), "batch_size": args.batch_size,
+                   "min_agreement": args.min_agreement, "backends": reports, "recommended": recommended}, f, indent=4)
+
+if __name__ == "__main__":
+    main()
@@ -1,91 +1,48 @@
-import requests
-import time
-import sys
 import argparse
+import asyncio
 import json
+import logging
+import os
+import sys
+
+# The shared service client lives at the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from service_client import ServiceClient, ServiceError
 
 BASE_URL = "http://localhost:3003"
 
-def check_health(wait_for_model=False, timeout=300):
+# Seconds spent waiting on the server, per phase
+wait_seconds = {}
+
+async def run(args):
     """
-    Check if the server is healthy and the model is loaded.
-    
-    Args:
-        wait_for_model: If True, wait until the model is fully loaded.
-        timeout: Maximum seconds to wait for model loading.
-    
+    Wait for the server, start processing unless asked not to, and follow the
+    run to completion.
+
     Returns:
-        Boolean indicating server health.
+        Final status dict with all results, or None if the server isn't usable
     """
-    start_time = time.time()
-    while True:
+    async with ServiceClient(BASE_URL, name="Server") as client:
         try:
-            response = requests.get(f"{BASE_URL}/health", timeout=10)
-            response_data = response.json()
-            
-            if response.status_code == 200:
-                if wait_for_model and response_data.get("status") == "initializing":
-                    elapsed = time.time() - start_time
-                    if elapsed > timeout:
-                        print(f"Timeout waiting for model initialization ({timeout} seconds)")
-                        return False
-                    
-                    print(f"Model is still initializing. Waiting... ({elapsed:.1f}s)")
-                    time.sleep(5)
-                    continue
-                
-                model_loaded = response_data.get('model_loaded', False)
-                print(f"Server is healthy! Model loaded: {model_loaded}")
-                
-                if wait_for_model and not model_loaded:
-                    elapsed = time.time() - start_time
-                    if elapsed > timeout:
-                        print(f"Timeout waiting for model initialization ({timeout} seconds)")
-                        return False
-                    print(f"Waiting for model to load... ({elapsed:.1f}s)")
-                    time.sleep(5)
-                    continue
-                
-                return True
-            else:
-                print(f"Server health check failed with status code: {response.status_code}")
-                if wait_for_model:
-                    elapsed = time.time() - start_time
-                    if elapsed > timeout:
-                        print(f"Timeout waiting for server ({timeout} seconds)")
-                        return False
-                    print(f"Retrying in 5 seconds... ({elapsed:.1f}s)")
-                    time.sleep(5)
-                    continue
-                return False
-                
-        except requests.exceptions.RequestException as e:
-            print(f"Error connecting to server: {e}")
-            elapsed = time.time() - start_time
-            if elapsed > timeout:
-                print(f"Timeout waiting for server connection ({timeout} seconds)")
-                return False
-            
-            print(f"Retrying connection in 5 seconds... ({elapsed:.1f}s)")
-            time.sleep(5)
+            if not await client.wait_until_healthy(wait_for_model=args.wait, timeout=args.timeout):
+                print("Server is not healthy or timeout reached. Exiting.")
+                return None
 
-def start_processing():
-    try:
-        response = requests.post(f"{BASE_URL}/process", timeout=30)
-        data = response.json()
-        print(f"Process start response: {json.dumps(data, indent=2)}")
-        return data
-    except Exception as e:
-        print(f"Error starting processing: {e}")
-        return None
+            if not args.skip_process:
+                print("\nStarting dialect processing...")
+                result = await client.start_processing()
+                print(f"Process start response: {json.dumps(result, indent=2)}")
+                if result.get("status") == "error":
+                    print(f"Error: {result.get('message')}")
+                    return None
+            else:
+                print("\nSkipping processing, checking status only...")
 
-def check_status():
-    try:
-        response = requests.get(f"{BASE_URL}/status", timeout=30)
-        return response.json()
-    except Exception as e:
-        print(f"Error checking status: {e}")
-        return None
+            print("\nChecking processing status...")
+            # Long-polls: the server answers as soon as another file finishes
+            return await client.follow_status()
+        finally:
+            wait_seconds.update(client.wait_report())
 
 def main():
     parser = argparse.ArgumentParser(description="Dialect Detection Client")
@@ -93,47 +50,31 @@ def main():
     parser.add_argument("--timeout", type=int, default=600, help="Timeout in seconds")
     parser.add_argument("--skip-process", action="store_true", help="Skip processing, just check status")
     args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     
     print("Dialect Detection Client")
     
-    if not check_health(wait_for_model=args.wait, timeout=args.timeout):
-        print("Server is not healthy or timeout reached. Exiting.")
+    try:
+        status = asyncio.run(run(args))
+    except ServiceError as e:
+        print(f"Error: {e}")
         sys.exit(1)
-    
-    if not args.skip_process:
-        print("\nStarting dialect processing...")
-        result = start_processing()
-        if result and result.get("status") == "error":
-            print(f"Error: {result.get('message')}")
-            sys.exit(1)
-    else:
-        print("\nSkipping processing, checking status only...")
-    
-    print("\nChecking processing status...")
-    while True:
-        status = check_status()
-        
-        if status is None:
-            print("Error checking status. Exiting.")
-            break
-            
-        if status.get("status") == "processing":
-            print("Processing is still running. Waiting 5 seconds...")
-            time.sleep(5)
+    if status is None:
+        sys.exit(1)
+
+    print("\nProcessing completed!")
+    print("Final status:")
+    for key, value in status.items():
+        if key == "results" and isinstance(value, list):
+            print(f"\nProcessed {len(value)} files:")
+            # Count as success if no "status" key is present or if it's explicitly "success"
+            success_count = sum(1 for r in value if r.get("status", "success") == "success")
+            error_count = sum(1 for r in value if r.get("status", "success") != "success")
+            print(f"  - Success: {success_count}")
+            print(f"  - Errors: {error_count}")
         else:
-            print("\nProcessing completed!")
-            print("Final status:")
-            for key, value in status.items():
-                if key == "results" and isinstance(value, list):
-                    print(f"\nProcessed {len(value)} files:")
-                    # Count as success if no "status" key is present or if it's explicitly "success"
-                    success_count = sum(1 for r in value if r.get("status", "success") == "success")
-                    error_count = sum(1 for r in value if r.get("status", "success") != "success")
-                    print(f"  - Success: {success_count}")
-                    print(f"  - Errors: {error_count}")
-                else:
-                    print(f"{key}: {value}")
-            break
+            print(f"{key}: {value}")
+    print(f"\nSeconds spent waiting on the server: {json.dumps(wait_seconds)}")
     
 if __name__ == "__main__":
     main()
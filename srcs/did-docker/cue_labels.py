@@ -0,0 +1,21 @@
+import os
+
+def cue_labels_path(vtt_file):
+    """'<id>.ar.vtt' -> '<id>.cues.parquet' in the same folder"""
+    folder, name = os.path.split(vtt_file)
+    return os.path.join(folder, f"{name.split('.')[0]}.cues.parquet")
+
+def write_cue_labels(path, cues, predictions):
+    """Write one row per cue (cue_id, start, end, text, label, score) to a Parquet file"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    table = pa.table({
+        "cue_id": pa.array(range(len(cues)), type=pa.int32()),
+        "start": pa.array([start for start, _, _ in cues], type=pa.float64()),
+        "end": pa.array([end for _, end, _ in cues], type=pa.float64()),
+        "text": pa.array([text for _, _, text in cues], type=pa.string()),
+        "label": pa.array([label for label, _ in predictions], type=pa.string()),
+        "score": pa.array([score for _, score in predictions], type=pa.float32()),
+    })
+    pq.write_table(table, path)
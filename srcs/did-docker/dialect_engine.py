@@ -0,0 +1,217 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import torch
+from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+from metrics import BATCH_SIZE, CACHE_LOOKUPS, CUES_CLASSIFIED, stage_timer
+
+TAG = re.compile(r'<[^>]+>')
+WHITESPACE = re.compile(r'\s+')
+TATWEEL = '\u0640'
+
+# "int8" is dynamic int8 quantization of the Linear layers and "onnx" an
+# onnxruntime export; both run on CPU
+BACKENDS = ("eager", "int8", "onnx")
+
+def load_model(model_name, backend="eager", model_dir="did-model", device=None, num_threads=None):
+    """
+    Load the sequence classifier for a serving backend.
+
+    Args:
+        model_name: Hugging Face model id
+        backend: One of BACKENDS
+        model_dir: Folder where the ONNX export is cached between starts
+        device: Device for the eager backend, picked automatically if None
+        num_threads: Intra-op threads for torch and onnxruntime, library default if None
+
+    Returns:
+        Tuple of (model, device)
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown DID backend '{backend}', choose one of: {', '.join(BACKENDS)}")
+    if num_threads:
+        torch.set_num_threads(num_threads)
+
+    if backend == "onnx":
+        import onnxruntime
+        from optimum.onnxruntime import ORTModelForSequenceClassification
+        options = onnxruntime.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        onnx_dir = os.path.join(model_dir, "onnx", model_name.replace("/", "--"))
+        if os.path.exists(os.path.join(onnx_dir, "model.onnx")):
+            model = ORTModelForSequenceClassification.from_pretrained(onnx_dir, session_options=options)
+        else:
+            model = ORTModelForSequenceClassification.from_pretrained(model_name, export=True, session_options=options)
+            model.save_pretrained(onnx_dir)
+            print(f"Exported {model_name} to {onnx_dir}")
+        return model, "cpu"
+
+    model = AutoModelForSequenceClassification.from_pretrained(model_name).eval()
+    if backend == "int8":
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        return model, "cpu"
+    device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+    return model.to(device), device
+
+def normalize(text):
+    """Cache key for a cue: caption tags, tatweel and repeated whitespace removed"""
+    text = TAG.sub(' ', text).replace(TATWEEL, '')
+    return WHITESPACE.sub(' ', text).strip()
+
+class RunStats:
+    """Counters for one run (job) of the engine"""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.finished_at = None
+        self.cues = 0
+        self.cache_hits = 0
+        self.classified = 0
+        self.tokens = 0
+        self.padded_tokens = 0
+        # Files decided by the n-gram pre-classifier versus the transformer vote
+        self.decided_by = {}
+
+    def file_decided(self, decider):
+        self.decided_by[decider] = self.decided_by.get(decider, 0) + 1
+
+    def counters(self):
+        """Plain counters, small enough to send back from a worker process"""
+        return {
+            "cues": self.cues,
+            "cache_hits": self.cache_hits,
+            "classified": self.classified,
+            "tokens": self.tokens,
+            "padded_tokens": self.padded_tokens,
+            "decided_by": dict(self.decided_by),
+        }
+
+    def merge(self, counters):
+        """Add the counters of a shard processed elsewhere"""
+        for name in ("cues", "cache_hits", "classified", "tokens", "padded_tokens"):
+            setattr(self, name, getattr(self, name) + counters[name])
+        for decider, count in counters["decided_by"].items():
+            self.decided_by[decider] = self.decided_by.get(decider, 0) + count
+
+    def finish(self):
+        self.finished_at = time.time()
+
+    def report(self):
+        elapsed = (self.finished_at or time.time()) - self.started_at
+        return {
+            "cues": self.cues,
+            "cache_hits": self.cache_hits,
+            "cache_hit_rate": round(self.cache_hits / self.cues, 4) if self.cues else 0.0,
+            "cues_classified": self.classified,
+            # Share of the batch tensors that is real tokens rather than padding
+            "padding_efficiency": round(self.tokens / self.padded_tokens, 4) if self.padded_tokens else 1.0,
+            "cues_per_second": round(self.cues / elapsed, 2) if elapsed > 0 else 0.0,
+            "files_decided_by": dict(self.decided_by),
+        }
+
+class DialectEngine:
+    """
+    Dialect classifier driven through the tokenizer and model directly.
+
+    Cues are looked up in a bounded LRU cache keyed by normalized text first,
+    so captions repeated across videos skip tokenization and inference. The
+    rest are tokenized once, sorted by token length and batched, which keeps
+    the padding in each batch small. The model always sees a cue's own text;
+    normalization only decides which cues share a prediction.
+    """
+
+    def __init__(self, model_name, batch_size=32, max_length=128, cache_size=100_000, device=None,
+                 backend="eager", num_threads=None, model_dir="did-model"):
+        self.backend = backend
+        self.model, self.device = load_model(model_name, backend, model_dir, device=device, num_threads=num_threads)
+        # The Rust tokenizer; the slow Python one dominates small batches
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name, use_fast=True)
+        self.id2label = self.model.config.id2label
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.cache_size = cache_size
+        # normalized text -> (label, score)
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _lookup(self, key):
+        with self.lock:
+            entry = self.cache.get(key)
+            if entry is not None:
+                self.cache.move_to_end(key)
+            return entry
+
+    def _store(self, key, entry):
+        with self.lock:
+            self.cache[key] = entry
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+    def _forward(self, batch_ids):
+        """Labels and scores for a batch of token id lists"""
+        batch = self.tokenizer.pad({"input_ids": batch_ids}, return_tensors="pt")
+        if "token_type_ids" in self.tokenizer.model_input_names:
+            # Exported graphs take it as a required input
+            batch["token_type_ids"] = torch.zeros_like(batch["input_ids"])
+        batch = batch.to(self.device)
+        with stage_timer("classify_batch"), torch.inference_mode():
+            probabilities = self.model(**batch).logits.softmax(dim=-1)
+        scores, indices = probabilities.max(dim=-1)
+        return [(self.id2label[index], score) for index, score in zip(indices.tolist(), scores.tolist())]
+
+    def classify(self, texts, stats=None):
+        """
+        Classify cues, reusing cached predictions for repeated ones.
+
+        Returns:
+            List of (label, score) in the order of texts
+        """
+        keys = [normalize(text) for text in texts]
+        predictions = {}
+        # Keys without a cached prediction, and the text of their first cue
+        misses = []
+        miss_texts = []
+        seen = set()
+        for key, text in zip(keys, texts):
+            if key in seen:
+                continue
+            seen.add(key)
+            entry = self._lookup(key)
+            if entry is None:
+                misses.append(key)
+                miss_texts.append(text)
+            else:
+                predictions[key] = entry
+        # Repeats within the call count as hits too
+        hits = len(keys) - len(misses)
+        CACHE_LOOKUPS.labels(result="hit").inc(hits)
+        CACHE_LOOKUPS.labels(result="miss").inc(len(misses))
+
+        if misses:
+            with stage_timer("tokenize"):
+                encoded = self.tokenizer(miss_texts, truncation=True, max_length=self.max_length)["input_ids"]
+            # Length bucketing: neighbours in sorted order have similar lengths
+            order = sorted(range(len(misses)), key=lambda i: len(encoded[i]))
+            for batch_start in range(0, len(order), self.batch_size):
+                indices = order[batch_start:batch_start + self.batch_size]
+                batch_ids = [encoded[i] for i in indices]
+                BATCH_SIZE.observe(len(batch_ids))
+                CUES_CLASSIFIED.inc(len(batch_ids))
+                if stats is not None:
+                    stats.tokens += sum(len(ids) for ids in batch_ids)
+                    stats.padded_tokens += len(batch_ids) * max(len(ids) for ids in batch_ids)
+                for i, prediction in zip(indices, self._forward(batch_ids)):
+                    predictions[misses[i]] = prediction
+                    self._store(misses[i], prediction)
+
+        if stats is not None:
+            stats.cues += len(keys)
+            stats.cache_hits += hits
+            stats.classified += len(misses)
+        return [predictions[key] for key in keys]
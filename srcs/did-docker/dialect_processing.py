@@ -0,0 +1,249 @@
+import math
+import os
+import random
+
+from cue_labels import cue_labels_path, write_cue_labels
+from dialect_engine import DialectEngine, RunStats, normalize
+from file_index import index_for, video_id_of
+from metrics import stage_timer
+from ngram_model import NgramDialectModel
+from webvtt import read_cues
+from worker_metrics import recording
+
+# Loaded once per process by load_models
+classifier = None
+ngram_model = None
+
+MODEL_NAME = "AMR-KELEG/ADI-NADI-2023"
+# Cues per forward pass; cues of several files share a pass, grouped by length
+BATCH_SIZE = int(os.environ.get("DID_BATCH_SIZE", 32))
+# Longer cues are truncated to this many tokens
+MAX_LENGTH = int(os.environ.get("DID_MAX_LENGTH", 128))
+# Files whose sampled cues are pooled into the same batches
+FILES_PER_BATCH = int(os.environ.get("DID_FILES_PER_BATCH", 16))
+# Cues sampled from each file for the majority vote
+SAMPLE_SIZE = int(os.environ.get("DID_SAMPLE_SIZE", 50))
+# Sampling is seeded per file name, so reruns pick the same cues
+SEED = os.environ.get("DID_SEED", "0")
+# Sampled cues are classified ROUND_SIZE at a time per file; a file stops early once
+# it has MIN_CUES labels and an exact sign test rejects a tie between Egypt and the
+# most frequent other label at EARLY_STOP_ALPHA (kept small since the test is
+# repeated every round)
+ROUND_SIZE = int(os.environ.get("DID_ROUND_SIZE", 10))
+MIN_CUES = int(os.environ.get("DID_MIN_CUES", 10))
+EARLY_STOP_ALPHA = float(os.environ.get("DID_EARLY_STOP_ALPHA", 0.01))
+# Distinct normalized cues whose prediction is kept in memory
+CACHE_SIZE = int(os.environ.get("DID_CACHE_SIZE", 100_000))
+# One of dialect_engine.BACKENDS; benchmark_did.py checks parity and speed
+BACKEND = os.environ.get("DID_BACKEND", "eager")
+# Intra-op threads for torch/onnxruntime; 0 keeps the library default
+NUM_THREADS = int(os.environ.get("DID_NUM_THREADS", 0))
+MODEL_DIR = "did-model"
+# DID_CUE_LABELS=1 classifies every cue instead of a sample and writes the labels
+# to '<id>.cues.parquet' next to the moved VTT, so later stages can select cues by dialect
+CUE_LABELS = os.environ.get("DID_CUE_LABELS", "0") == "1"
+# Hashed n-gram model from distill_ngram.py that scores every cue of a file first;
+# only files whose Egypt/other share is within NGRAM_MIN_MARGIN of an even split
+# go to the transformer. Without the model file every file does.
+NGRAM_MODEL_PATH = os.environ.get("DID_NGRAM_MODEL", os.path.join(MODEL_DIR, "ngram.npz"))
+NGRAM_MIN_MARGIN = float(os.environ.get("DID_NGRAM_MIN_MARGIN", 0.6))
+
+def load_models():
+    """Load the dialect engine (and the n-gram pre-classifier if there is one) into this process"""
+    global classifier, ngram_model
+    classifier = DialectEngine(MODEL_NAME, batch_size=BATCH_SIZE, max_length=MAX_LENGTH, cache_size=CACHE_SIZE,
+                               backend=BACKEND, num_threads=NUM_THREADS or None, model_dir=MODEL_DIR)
+    print(f"Serving the dialect model with the {BACKEND} backend on {classifier.device}")
+    if NGRAM_MODEL_PATH and os.path.exists(NGRAM_MODEL_PATH):
+        ngram_model = NgramDialectModel.load(NGRAM_MODEL_PATH)
+        print(f"Loaded n-gram pre-classifier from {NGRAM_MODEL_PATH}")
+
+def read_dialogues(file_path):
+    """Text of each cue of a VTT file; distill_ngram.py trains the n-gram model on the same"""
+    with stage_timer("read"):
+        return [text for _, _, text in read_cues(file_path)]
+
+def sample_dialogues(file_path, dialogues):
+    """Pick the cues of a file used for its transformer majority vote"""
+    # Stratified sample of up to SAMPLE_SIZE dialogues: one random cue from each
+    # of SAMPLE_SIZE equal stretches of the timeline (or all if fewer)
+    rng = random.Random(f"{SEED}:{os.path.basename(file_path)}")
+    count = min(SAMPLE_SIZE, len(dialogues))
+    picks = [rng.randrange(i * len(dialogues) // count, (i + 1) * len(dialogues) // count) for i in range(count)]
+    # Shuffled so the first rounds already span the whole file
+    rng.shuffle(picks)
+    return [dialogues[i] for i in picks]
+
+def binomial_p_value(successes, trials):
+    """Two-sided exact binomial test against p = 0.5"""
+    tail = sum(math.comb(trials, i) for i in range(min(successes, trials - successes) + 1)) / 2 ** trials
+    return min(1.0, 2 * tail)
+
+def vote_settled(labels):
+    """
+    Whether more cues could no longer change the file's ECA/MSA decision at EARLY_STOP_ALPHA.
+
+    The decision is whether Egypt is the plurality label, so it only changes if
+    Egypt and the most frequent other label swap places: the cues of those two
+    labels are tested against an even split.
+    """
+    if len(labels) < MIN_CUES:
+        return False
+    egypt = labels.count('Egypt')
+    others = [labels.count(label) for label in set(labels) if label != 'Egypt']
+    top_other = max(others, default=0)
+    return binomial_p_value(egypt, egypt + top_other) < EARLY_STOP_ALPHA
+
+def process_vtt_file(file_path, labels):
+    """Move a VTT file (and its audio) to the folder of the majority dialect among its cue labels"""
+    # Count the frequency of each detected dialect
+    dialect_frequency = {}
+    for predicted_class in labels:
+        dialect_frequency[predicted_class] = dialect_frequency.get(predicted_class, 0) + 1
+
+    # Determine the majority dialect
+    majority_dialect = max(dialect_frequency, key=dialect_frequency.get)
+
+    # Decide target sub-folder: 'ECA' if majority is 'Egypt', else 'MSA'
+    target_sub_folder = 'ECA' if majority_dialect == 'Egypt' else 'MSA'
+    folder, name = os.path.split(file_path)
+    target_folder_path = os.path.join(folder, target_sub_folder)
+
+    with stage_timer("move"):
+        # Create the sub-folder if it doesn't exist
+        if not os.path.exists(target_folder_path):
+            os.makedirs(target_folder_path)
+
+        # The corresponding audio file, looked up before the VTT leaves the folder
+        index = index_for(folder)
+        audio_files = index.names(video_id_of(name), ".mp3", refresh_for=name)
+
+        # Move the VTT file and the audio file if there is one
+        index.move(name, target_folder_path)
+        for audio_file in audio_files:
+            index.move(audio_file, target_folder_path)
+
+    print(f"Moved '{os.path.basename(file_path)}' and corresponding audio file to '{target_folder_path}' based on majority dialect: {majority_dialect}")
+    return {
+        "file": os.path.basename(file_path),
+        "majority_dialect": majority_dialect,
+        "target_folder": target_sub_folder,
+        "cues_used": len(labels),
+    }
+
+def error_result(file_path, e):
+    print(f"Error processing {file_path}: {e}")
+    return {"file": os.path.basename(file_path), "status": "error", "message": str(e)}
+
+def finish_file(results, stats, result):
+    stats.file_decided(result["decided_by"])
+    results.append(result)
+
+def label_all_cues(results, stats, group):
+    """Classify every cue of a group of files in one pooled pass, vote on all of them and keep the labels"""
+    cues = {}
+    for file_path in group:
+        try:
+            with stage_timer("read"):
+                cues[file_path] = read_cues(file_path)
+        except Exception as e:
+            results.append(error_result(file_path, e))
+
+    texts = [text for file_cues in cues.values() for _, _, text in file_cues]
+    try:
+        predictions = classifier.classify(texts, stats=stats)
+    except Exception as e:
+        for file_path in cues:
+            results.append(error_result(file_path, e))
+        return
+
+    offset = 0
+    for file_path, file_cues in cues.items():
+        file_predictions = predictions[offset:offset + len(file_cues)]
+        offset += len(file_cues)
+        try:
+            result = process_vtt_file(file_path, [label for label, _ in file_predictions])
+            moved_vtt = os.path.join(os.path.dirname(file_path), result["target_folder"], os.path.basename(file_path))
+            with stage_timer("write_cues"):
+                result["cue_labels"] = cue_labels_path(moved_vtt)
+                write_cue_labels(result["cue_labels"], file_cues, file_predictions)
+            result["decided_by"] = "transformer"
+            finish_file(results, stats, result)
+        except Exception as e:
+            results.append(error_result(file_path, e))
+
+def process_files(files, stats):
+    """
+    Files the n-gram model is confident about are moved straight away. The rest
+    are classified FILES_PER_BATCH at a time, in rounds: every round pools
+    the next ROUND_SIZE sampled cues of each file still undecided, so batches
+    stay full, and a file is moved as soon as its vote is settled or its
+    sample runs out.
+    """
+    results = []
+    for group_start in range(0, len(files), FILES_PER_BATCH):
+        group = files[group_start:group_start + FILES_PER_BATCH]
+        if CUE_LABELS:
+            label_all_cues(results, stats, group)
+            continue
+        samples = {}
+        for file_path in group:
+            try:
+                dialogues = read_dialogues(file_path)
+                if ngram_model is not None and len(dialogues) >= MIN_CUES:
+                    with stage_timer("ngram"):
+                        labels, share, margin = ngram_model.file_vote([normalize(text) for text in dialogues])
+                    if margin >= NGRAM_MIN_MARGIN:
+                        result = process_vtt_file(file_path, labels)
+                        result.update({"decided_by": "ngram", "ngram_margin": round(margin, 4)})
+                        finish_file(results, stats, result)
+                        continue
+                samples[file_path] = sample_dialogues(file_path, dialogues)
+            except Exception as e:
+                results.append(error_result(file_path, e))
+
+        labels = {file_path: [] for file_path in samples}
+        while samples:
+            rounds = {file_path: dialogues[len(labels[file_path]):len(labels[file_path]) + ROUND_SIZE]
+                      for file_path, dialogues in samples.items()}
+            texts = [text for dialogues in rounds.values() for text in dialogues]
+            try:
+                predictions = classifier.classify(texts, stats=stats)
+            except Exception as e:
+                for file_path in samples:
+                    results.append(error_result(file_path, e))
+                break
+
+            offset = 0
+            for file_path, dialogues in rounds.items():
+                labels[file_path].extend(label for label, _ in predictions[offset:offset + len(dialogues)])
+                offset += len(dialogues)
+                settled = vote_settled(labels[file_path])
+                if not settled and len(labels[file_path]) < len(samples[file_path]):
+                    continue
+                cues_sampled = len(samples.pop(file_path))
+                try:
+                    result = process_vtt_file(file_path, labels[file_path])
+                    result["cues_sampled"] = cues_sampled
+                    result["early_stopped"] = len(labels[file_path]) < cues_sampled
+                    result["decided_by"] = "transformer"
+                    finish_file(results, stats, result)
+                except Exception as e:
+                    results.append(error_result(file_path, e))
+    return results
+
+def run_shard(files):
+    """
+    Process one shard of a job; runs in a worker process or in the server itself.
+
+    Returns:
+        Dict with the "results" in the order of files, the run "stats" counters
+        and the "metrics" updates, which the server replays into /metrics
+    """
+    stats = RunStats()
+    with recording() as observations:
+        results = process_files(files, stats)
+    order = {os.path.basename(file_path): i for i, file_path in enumerate(files)}
+    # Early stopping finishes files out of order; put them back in shard order
+    results.sort(key=lambda result: order.get(result["file"], len(order)))
+    return {"results": results, "stats": stats.counters(), "metrics": observations}
@@ -1,98 +1,128 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request, stream_with_context
+import multiprocessing
 import os
-import random
-import shutil
-from transformers import pipeline
 import threading
 import time
+from concurrent.futures import ProcessPoolExecutor
+import dialect_processing
+from dialect_engine import RunStats
+from file_index import index_for
+from jobs import ShardedJobQueue
+from metrics import (
+    FILES_DECIDED,
+    FILES_PROCESSED,
+    MODEL_WARMUP,
+    QUEUE_DEPTH,
+    render as render_metrics,
+)
+from service_jobs import event_cursor, job_page, stream_job_events
+from worker_metrics import replay
 
 app = Flask(__name__)
+PROCESS_START_TIME = time.time()
 
 # Global variables
-classifier = None
 model_initialized = False
-is_processing = False
+# Job started by the last /process call
+current_job = None
 processing_results = None
+# Throughput and cache counters per job id
+run_stats = {}
+job_queue = None
 
-MODEL_NAME = "AMR-KELEG/ADI-NADI-2023"
 FOLDER_PATH = "audio-and-captions/Arabic"
+# Worker processes, each loading the model once; 0 classifies in the server process
+NUM_WORKERS = int(os.environ.get("DID_NUM_WORKERS", 0))
+# Shards per job; fixed so results don't depend on NUM_WORKERS
+NUM_SHARDS = int(os.environ.get("DID_NUM_SHARDS", 64))
+# Finished jobs GET /jobs still knows, with their results and engine stats
+MAX_FINISHED_JOBS = int(os.environ.get("DID_MAX_FINISHED_JOBS", 100))
+
+def stats_for(job):
+    # The dispatcher may get to a job before queue_job has stored its stats
+    return run_stats.setdefault(job.id, RunStats())
+
+def collect_shard(job, output):
+    """Add a finished shard's results to its job, in order, and count them"""
+    stats = stats_for(job)
+    if output["stats"] is not None:
+        stats.merge(output["stats"])
+    # Stage timings, batch sizes and cache lookups made in a worker process
+    replay(output["metrics"])
+    for result in output["results"]:
+        if result.get("status") == "error":
+            FILES_PROCESSED.labels(status="error").inc()
+        else:
+            FILES_PROCESSED.labels(status="success").inc()
+            FILES_DECIDED.labels(decider=result["decided_by"]).inc()
+        job.add_result(result)
+
+def finish_job(job):
+    stats_for(job).finish()
+
+def forget_job(job_id):
+    run_stats.pop(job_id, None)
+
+def queue_job(files, source=None):
+    job = job_queue.submit(files, source=source)
+    stats_for(job)
+    return job
+
+def start_worker_pool():
+    # Spawned rather than forked: CUDA and tokenizer threads don't survive a fork
+    pool = ProcessPoolExecutor(
+        max_workers=NUM_WORKERS,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=dialect_processing.load_models,
+    )
+    # Returns once a worker has finished its initializer, i.e. loaded the model
+    pool.submit(os.getpid).result()
+    print(f"Started {NUM_WORKERS} dialect worker processes")
+    return pool
 
 def initialize_model():
-    global classifier, model_initialized
+    global job_queue, model_initialized
     try:
-        classifier = pipeline("text-classification", model=MODEL_NAME)
+        make_pool = None
+        if NUM_WORKERS > 0:
+            make_pool = start_worker_pool
+        else:
+            dialect_processing.load_models()
+        job_queue = ShardedJobQueue(dialect_processing.run_shard, collect_shard, NUM_SHARDS, make_pool=make_pool,
+                                    max_finished_jobs=MAX_FINISHED_JOBS, on_finish=finish_job, on_forget=forget_job)
+        job_queue.start()
+        QUEUE_DEPTH.set_function(job_queue.queue_depth)
+        MODEL_WARMUP.set(time.time() - PROCESS_START_TIME)
         model_initialized = True
         print("Dialect model loaded successfully!")
     except Exception as e:
         print(f"Error loading dialect model: {e}")
         model_initialized = False
 
-# Start model initialization in a separate thread
-init_thread = threading.Thread(target=initialize_model)
-init_thread.daemon = True
-init_thread.start()
-
-def classify_dialect(text):
-    results = classifier(text)
-    return results[0]['label'], results[0]['score']
-
-def process_vtt_file(file_path):
-    # Read the VTT file
-    with open(file_path, 'r', encoding='utf-8') as file:
-        lines = file.readlines()
-
-    # Extract non-empty dialogue lines (ignoring timestamp lines)
-    dialogues = [line.strip() for line in lines if line.strip() and '-->' not in line]
-
-    # Randomly select up to 50 dialogues for analysis (or all if fewer)
-    selected_dialogues = random.sample(dialogues, min(50, len(dialogues)))
-
-    # Count the frequency of each detected dialect
-    dialect_frequency = {}
-    for dialogue in selected_dialogues:
-        predicted_class, _ = classify_dialect(dialogue)
-        dialect_frequency[predicted_class] = dialect_frequency.get(predicted_class, 0) + 1
-
-    # Determine the majority dialect
-    majority_dialect = max(dialect_frequency, key=dialect_frequency.get)
-
-    # Decide target sub-folder: 'ECA' if majority is 'Egypt', else 'MSA'
-    target_sub_folder = 'ECA' if majority_dialect == 'Egypt' else 'MSA'
-    target_folder_path = os.path.join(os.path.dirname(file_path), target_sub_folder)
-
-    # Create the sub-folder if it doesn't exist
-    if not os.path.exists(target_folder_path):
-        os.makedirs(target_folder_path)
-
-    # Move the VTT file
-    shutil.move(file_path, os.path.join(target_folder_path, os.path.basename(file_path)))
-
-    # Construct the corresponding audio file path and move it if it exists
-    audio_file_path = file_path.replace('.ar.vtt', '.mp3')
-    if os.path.exists(audio_file_path):
-        shutil.move(audio_file_path, os.path.join(target_folder_path, os.path.basename(audio_file_path)))
-
-    print(f"Moved '{os.path.basename(file_path)}' and corresponding audio file to '{target_folder_path}' based on majority dialect: {majority_dialect}")
-    return {
-        "file": os.path.basename(file_path),
-        "majority_dialect": majority_dialect,
-        "target_folder": target_sub_folder
-    }
-
-def process_all_vtt_files():
-    results = []
-    if not os.path.exists(FOLDER_PATH):
-        return {"status": "error", "message": f"Folder '{FOLDER_PATH}' does not exist"}
-    for file_name in os.listdir(FOLDER_PATH):
-        if file_name.endswith('.vtt'):
-            file_path = os.path.join(FOLDER_PATH, file_name)
-            try:
-                result = process_vtt_file(file_path)
-                results.append(result)
-            except Exception as e:
-                print(f"Error processing {file_path}: {e}")
-                results.append({"file": file_name, "status": "error", "message": str(e)})
-    return {"status": "completed", "results": results}
+# Start model initialization in a separate thread; spawned workers re-import
+# this module when it is run as a script and must not start their own pool
+if multiprocessing.parent_process() is None:
+    init_thread = threading.Thread(target=initialize_model)
+    init_thread.daemon = True
+    init_thread.start()
+
+def list_vtt_files(folder_path):
+    # One scan per job, which also refreshes the index the moves in this process go through
+    index = index_for(folder_path)
+    index.scan()
+    return [os.path.join(folder_path, file_name) for file_name in index.all_names('.vtt')]
+
+def job_summary(job):
+    """Job summary plus the engine's throughput and cache hit rate for the run"""
+    data = job.summary()
+    if job.id in run_stats:
+        data["engine"] = run_stats[job.id].report()
+    return data
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    body, content_type = render_metrics()
+    return Response(body, content_type=content_type)
 
 @app.route('/health', methods=['GET'])
 def health_check():
@@ -100,38 +130,84 @@ def health_check():
         return jsonify({"status": "initializing", "message": "Dialect model is still initializing"})
     return jsonify({"status": "healthy", "model_loaded": True})
 
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """Queue a job for an explicit list of VTT files or for every VTT file in a directory"""
+    if not model_initialized:
+        return jsonify({"status": "error", "message": "Dialect model is still initializing, please try again later"}), 503
+
+    payload = request.get_json(silent=True) or {}
+    files = payload.get("files")
+    directory = payload.get("directory")
+    if files is not None:
+        if not isinstance(files, list) or not all(isinstance(f, str) for f in files):
+            return jsonify({"status": "error", "message": "'files' must be a list of paths"}), 400
+        source = "files"
+    elif directory is not None:
+        if not os.path.isdir(directory):
+            return jsonify({"status": "error", "message": f"Directory '{directory}' does not exist"}), 400
+        files = list_vtt_files(directory)
+        source = directory
+    else:
+        return jsonify({"status": "error", "message": "Provide either 'files' or 'directory'"}), 400
+
+    job = queue_job(files, source=source)
+    return jsonify({"status": "queued", "job_id": job.id, "total": len(job.files)}), 202
+
+@app.route('/jobs', methods=['GET'])
+def list_jobs():
+    return jsonify({"jobs": [job_summary(job) for job in job_queue.list()]})
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": f"Unknown job '{job_id}'"}), 404
+    return jsonify(job_page(job, request, job_summary))
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": f"Unknown job '{job_id}'"}), 404
+    return Response(stream_with_context(stream_job_events(job, event_cursor(request), job_summary)), mimetype="text/event-stream")
+
 @app.route('/process', methods=['POST'])
 def process_dialect():
-    global is_processing, processing_results
+    global current_job, processing_results
     if not model_initialized:
         return jsonify({"status": "error", "message": "Dialect model is still initializing, please try again later"})
-    if is_processing:
+    if current_job is not None and not current_job.done:
         return jsonify({"status": "processing", "message": "Dialect processing is already in progress"})
-    
-    def process_thread():
-        global is_processing, processing_results
-        try:
-            processing_results = process_all_vtt_files()
-            is_processing = False
-        except Exception as e:
-            processing_results = {"status": "error", "message": str(e)}
-            is_processing = False
-
-    is_processing = True
-    thread = threading.Thread(target=process_thread)
-    thread.start()
-    
-    return jsonify({"status": "started", "message": "Dialect processing has started"})
+    if not os.path.exists(FOLDER_PATH):
+        processing_results = {"status": "error", "message": f"Folder '{FOLDER_PATH}' does not exist"}
+        current_job = None
+        return jsonify({"status": "started", "message": "Dialect processing has started"})
+
+    processing_results = None
+    current_job = queue_job(list_vtt_files(FOLDER_PATH), source=FOLDER_PATH)
+    return jsonify({"status": "started", "message": "Dialect processing has started", "job_id": current_job.id})
 
 @app.route('/status', methods=['GET'])
 def status():
-    if is_processing:
-        return jsonify({"status": "processing", "message": "Dialect processing is in progress"})
+    if current_job is not None:
+        # Counters are always included; results come one page at a time (?cursor=&limit=)
+        data = job_page(current_job, request, job_summary)
+        if not current_job.done:
+            data["status"] = "processing"
+            data["message"] = "Dialect processing is in progress"
+        return jsonify(data)
     elif processing_results is not None:
         return jsonify(processing_results)
     else:
         return jsonify({"status": "idle", "message": "No processing has been initiated"})
 
+@app.route('/status/events', methods=['GET'])
+def status_events():
+    if current_job is None:
+        return jsonify({"status": "idle", "message": "No processing has been initiated"})
+    return Response(stream_with_context(stream_job_events(current_job, event_cursor(request), job_summary)), mimetype="text/event-stream")
+
 if __name__ == '__main__':
     print("Starting dialect detection server on port 3003")
     app.run(host='0.0.0.0', port=3003, debug=False)
@@ -0,0 +1,130 @@
+import argparse
+import glob
+import json
+import os
+import zlib
+
+import numpy as np
+
+from dialect_engine import DialectEngine, normalize
+from ngram_model import NgramDialectModel, hashed_ngrams, ngram_logits
+from webvtt import read_cues
+
+MODEL_NAME = "AMR-KELEG/ADI-NADI-2023"
+
+def collect_cues(folder, max_cues_per_file):
+    """
+    Collect the caption cues of every VTT file under a folder, read the way
+    the server reads them (webvtt.read_cues), so headers, cue numbers and
+    timing lines are never trained on.
+
+    Returns:
+        Dict of file path -> list of cue texts
+    """
+    cues = {}
+    for vtt_file in sorted(glob.glob(os.path.join(folder, "**", "*.vtt"), recursive=True)):
+        texts = [text for _, _, text in read_cues(vtt_file)]
+        if texts:
+            cues[vtt_file] = texts[:max_cues_per_file]
+    return cues
+
+def train(texts, targets, n_features, ngram_range, epochs, learning_rate, l2):
+    """Full-batch gradient descent on the logistic loss with Adagrad step sizes"""
+    rows, features = hashed_ngrams(texts, n_features, ngram_range)
+    counts = np.maximum(np.bincount(rows, minlength=len(texts)), 1)
+    scale = 1.0 / np.sqrt(counts)
+    weights = np.zeros(n_features, dtype=np.float32)
+    bias = 0.0
+    accumulated = np.full(n_features, 1e-8, dtype=np.float32)
+    for epoch in range(epochs):
+        logits = ngram_logits(weights, bias, rows, features, len(texts))
+        errors = (1.0 / (1.0 + np.exp(-logits)) - targets) / len(texts)
+        gradient = np.zeros(n_features, dtype=np.float32)
+        np.add.at(gradient, features, (errors * scale)[rows])
+        gradient += l2 * weights
+        accumulated += gradient ** 2
+        weights -= learning_rate * gradient / np.sqrt(accumulated)
+        bias -= learning_rate * float(errors.sum())
+        if epoch % 10 == 0 or epoch == epochs - 1:
+            probabilities = np.clip(1.0 / (1.0 + np.exp(-logits)), 1e-7, 1 - 1e-7)
+            loss = -np.mean(targets * np.log(probabilities) + (1 - targets) * np.log(1 - probabilities))
+            print(f"Epoch {epoch}: loss {loss:.4f}")
+    return NgramDialectModel(weights, bias, ngram_range)
+
+def agreement_report(model, holdout, teacher_labels, margins):
+    """Cue- and file-level agreement of the n-gram model with the transformer on held-out files"""
+    cue_agreement = []
+    files = []
+    for vtt_file, texts in holdout.items():
+        labels, share, margin = model.file_vote(texts)
+        teacher = [label == "Egypt" for label in teacher_labels[vtt_file]]
+        cue_agreement.extend((label == "Egypt") == egypt for label, egypt in zip(labels, teacher))
+        # Same rule as the server: the ECA folder if Egypt is the plurality label
+        teacher_counts = {}
+        for label in teacher_labels[vtt_file]:
+            teacher_counts[label] = teacher_counts.get(label, 0) + 1
+        teacher_eca = max(teacher_counts, key=teacher_counts.get) == "Egypt"
+        files.append((share > 0.5, teacher_eca, margin))
+
+    report = {
+        "holdout_files": len(files),
+        "holdout_cues": len(cue_agreement),
+        "cue_agreement": float(np.mean(cue_agreement)) if cue_agreement else None,
+        "file_agreement": float(np.mean([ngram == teacher for ngram, teacher, _ in files])) if files else None,
+        "by_min_margin": {},
+    }
+    for min_margin in margins:
+        decided = [(ngram, teacher) for ngram, teacher, margin in files if margin >= min_margin]
+        report["by_min_margin"][str(min_margin)] = {
+            "files_decided_by_ngram": len(decided) / len(files) if files else 0.0,
+            "agreement_on_decided": float(np.mean([ngram == teacher for ngram, teacher in decided])) if decided else None,
+        }
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Distil a hashed character n-gram dialect model from ADI-NADI-2023 labels")
+    parser.add_argument("--folder", default="audio-and-captions/Arabic", help="Folder searched recursively for VTT files")
+    parser.add_argument("--output", default="did-model/ngram.npz", help="Where to save the model")
+    parser.add_argument("--report", default="did-model/ngram_report.json", help="Where to write the agreement report")
+    parser.add_argument("--max-cues-per-file", type=int, default=200, help="Cues labelled per file")
+    parser.add_argument("--holdout", type=float, default=0.2, help="Share of files held out for the report")
+    parser.add_argument("--features", type=int, default=2 ** 20, help="Hash buckets")
+    parser.add_argument("--ngram-min", type=int, default=2)
+    parser.add_argument("--ngram-max", type=int, default=4)
+    parser.add_argument("--epochs", type=int, default=200)
+    parser.add_argument("--learning-rate", type=float, default=0.5)
+    parser.add_argument("--l2", type=float, default=1e-6)
+    parser.add_argument("--batch-size", type=int, default=64, help="Cues per transformer forward pass")
+    parser.add_argument("--margins", type=float, nargs="+", default=[0.2, 0.4, 0.6, 0.8], help="File margins to report")
+    args = parser.parse_args()
+
+    cues = collect_cues(args.folder, args.max_cues_per_file)
+    if not cues:
+        print(f"No VTT files with cues under {args.folder}")
+        return
+    print(f"Labelling {sum(len(texts) for texts in cues.values())} cues from {len(cues)} files with {MODEL_NAME}")
+
+    teacher = DialectEngine(MODEL_NAME, batch_size=args.batch_size, cache_size=10 ** 7)
+    teacher_labels = {vtt_file: [label for label, _ in teacher.classify(texts)] for vtt_file, texts in cues.items()}
+    # The teacher sees the cue text as served; the n-gram model scores normalized cues, as the server does
+    cues = {vtt_file: [normalize(text) for text in texts] for vtt_file, texts in cues.items()}
+
+    # Split by file, by hash so the split stays the same between runs
+    holdout = {f: t for f, t in cues.items() if zlib.crc32(f.encode("utf-8")) % 1000 < args.holdout * 1000}
+    training = {f: t for f, t in cues.items() if f not in holdout}
+    texts = [text for f in training for text in cues[f]]
+    targets = np.asarray([label == "Egypt" for f in training for label in teacher_labels[f]], dtype=np.float32)
+    print(f"Training on {len(texts)} cues ({targets.mean():.1%} Egypt), holding out {len(holdout)} files")
+
+    model = train(texts, targets, args.features, (args.ngram_min, args.ngram_max), args.epochs, args.learning_rate, args.l2)
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    model.save(args.output)
+    print(f"Saved n-gram model to {args.output}")
+
+    report = agreement_report(model, holdout, teacher_labels, args.margins)
+    print(json.dumps(report, indent=4))
+    with open(args.report, 'w') as f:
+        json.dump(report, f, indent=4)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+import os
+import threading
+import zlib
+from collections import deque
+from concurrent.futures.process import BrokenProcessPool
+
+from service_jobs import Job
+
+def shard_files(files, num_shards):
+    """Split files into shards by a stable hash of their name; each shard is sorted by name"""
+    shards = [[] for _ in range(num_shards)]
+    for file_path in files:
+        shards[zlib.crc32(os.path.basename(file_path).encode("utf-8")) % num_shards].append(file_path)
+    return [sorted(shard, key=os.path.basename) for shard in shards if shard]
+
+def failed_shard(files, error):
+    """Output of a shard that could not be processed: an error result per file, no stats or metrics"""
+    results = [{"file": os.path.basename(file_path), "status": "error", "message": str(error)} for file_path in files]
+    return {"results": results, "stats": None, "metrics": []}
+
+class ShardedJobQueue:
+    """
+    First-in, first-out queue of jobs.
+
+    Each job is split into num_shards shards by file name hash. The shard count
+    doesn't depend on the number of workers, so a file set is always grouped and
+    batched the same way. Shards run on a process pool from make_pool (or in the
+    dispatcher thread without one), and their results are handed to collect in
+    shard order.
+
+    If a worker process dies, the shards that were in flight get error results
+    and a new pool is started for the rest of the job and the jobs behind it.
+
+    Each finished job is handed to on_finish. Only the last max_finished_jobs
+    finished jobs are kept; older ones are forgotten, and their ids handed to
+    on_forget.
+    """
+
+    def __init__(self, run_shard, collect, num_shards, make_pool=None, max_finished_jobs=100,
+                 on_finish=None, on_forget=None):
+        self.run_shard = run_shard
+        self.collect = collect
+        self.num_shards = num_shards
+        self.make_pool = make_pool
+        self.pool = make_pool() if make_pool is not None else None
+        self.max_finished_jobs = max_finished_jobs
+        self.on_finish = on_finish
+        self.on_forget = on_forget
+        self.jobs = {}
+        self.pending = deque()
+        # Ids of the finished jobs still in self.jobs, oldest first
+        self.finished = deque()
+        self.condition = threading.Condition()
+
+    def start(self):
+        threading.Thread(target=self._dispatch_loop, name="job-dispatcher", daemon=True).start()
+
+    def submit(self, files, source=None):
+        job = Job(files, source=source)
+        with self.condition:
+            self.jobs[job.id] = job
+            self.pending.append(job)
+            self.condition.notify_all()
+        return job
+
+    def get(self, job_id):
+        with self.condition:
+            return self.jobs.get(job_id)
+
+    def list(self):
+        with self.condition:
+            return list(self.jobs.values())
+
+    def queue_depth(self):
+        """Files submitted but not processed yet, across the running and the queued jobs"""
+        with self.condition:
+            jobs = [job for job in self.jobs.values() if not job.done]
+        return sum(job.progress()["remaining"] for job in jobs)
+
+    def _dispatch_loop(self):
+        while True:
+            with self.condition:
+                while not self.pending:
+                    self.condition.wait()
+                job = self.pending.popleft()
+            job.mark_started()
+            try:
+                shards = shard_files(job.files, self.num_shards)
+                if self.pool is not None:
+                    # Every shard is queued at once; waiting on them in order keeps the aggregation ordered
+                    pool = self.pool
+                    futures = [pool.submit(self.run_shard, shard) for shard in shards]
+                    outputs = (self._shard_output(pool, future, shard) for future, shard in zip(futures, shards))
+                else:
+                    outputs = (self.run_shard(shard) for shard in shards)
+                for output in outputs:
+                    self.collect(job, output)
+                if not job.done:
+                    job.finish()
+            except Exception as e:
+                print(f"Error processing job {job.id}: {e}")
+                job.finish(status="error")
+            self._retire(job)
+
+    def _retire(self, job):
+        if self.on_finish is not None:
+            self.on_finish(job)
+        with self.condition:
+            self.finished.append(job.id)
+            forgotten = []
+            while len(self.finished) > self.max_finished_jobs:
+                job_id = self.finished.popleft()
+                self.jobs.pop(job_id, None)
+                forgotten.append(job_id)
+        if self.on_forget is not None:
+            for job_id in forgotten:
+                self.on_forget(job_id)
+
+    def _shard_output(self, pool, future, shard):
+        try:
+            return future.result()
+        except BrokenProcessPool as e:
+            # Every shard still queued on the broken pool fails the same way; only the first replaces it
+            if self.pool is pool:
+                print(f"A dialect worker died, starting a new pool: {e}")
+                pool.shutdown(wait=False, cancel_futures=True)
+                self.pool = self.make_pool()
+            return failed_shard(shard, "The dialect worker process died while processing the shard")
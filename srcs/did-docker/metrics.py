@@ -0,0 +1,35 @@
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+from worker_metrics import ReplayableMetric
+
+# The default registry also exports process_resident_memory_bytes and the
+# other process_* series, so RSS needs no extra collector here. Counters and
+# histograms are ReplayableMetric, so worker processes can send their updates
+# back to the server process.
+
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+STAGE_LATENCY = ReplayableMetric(Histogram(
+    "did_stage_seconds",
+    "Time spent in each stage of processing one file",
+    ["stage"],
+    buckets=STAGE_BUCKETS,
+))
+FILES_PROCESSED = ReplayableMetric(Counter("did_files_processed_total", "Files finished, by outcome", ["status"]))
+CUES_CLASSIFIED = ReplayableMetric(Counter("did_cues_classified_total", "Caption cues sent to the classifier"))
+FILES_DECIDED = ReplayableMetric(Counter("did_files_decided_total", "Files by the model that decided their dialect", ["decider"]))
+CACHE_LOOKUPS = ReplayableMetric(Counter("did_cache_lookups_total", "Cue prediction cache lookups, by outcome", ["result"]))
+BATCH_SIZE = ReplayableMetric(Histogram(
+    "did_batch_size",
+    "Cues per classifier call",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256),
+))
+QUEUE_DEPTH = Gauge("did_queue_depth", "Files in the current job that have not been processed yet")
+MODEL_WARMUP = Gauge("did_model_warmup_seconds", "Seconds from process start until the model was ready")
+
+def stage_timer(stage):
+    """Context manager recording the duration of a stage in did_stage_seconds"""
+    return STAGE_LATENCY.labels(stage=stage).time()
+
+def render():
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,77 @@
+import zlib
+
+import numpy as np
+
+# Label the linear model predicts for non-Egyptian cues; the transformer's
+# country labels other than 'Egypt' all end up in the MSA folder anyway
+OTHER_LABEL = "Other"
+
+def hashed_ngrams(texts, n_features, ngram_range=(2, 4)):
+    """
+    Hash the character n-grams of each text (padded with spaces) into n_features buckets.
+
+    Returns:
+        Tuple of (row index, feature index) int arrays with one entry per n-gram
+    """
+    rows, features = [], []
+    for row, text in enumerate(texts):
+        padded = f" {text} "
+        for n in range(ngram_range[0], ngram_range[1] + 1):
+            for i in range(len(padded) - n + 1):
+                rows.append(row)
+                features.append(zlib.crc32(padded[i:i + n].encode("utf-8")) % n_features)
+    return np.asarray(rows, dtype=np.int64), np.asarray(features, dtype=np.int64)
+
+def ngram_logits(weights, bias, rows, features, n_rows):
+    """
+    Sum of the weights of every n-gram of each row, divided by the square root
+    of the row's n-gram count (the scaling distill_ngram.train uses), plus the bias
+    """
+    logits = np.zeros(n_rows, dtype=np.float32)
+    np.add.at(logits, rows, weights[features])
+    counts = np.maximum(np.bincount(rows, minlength=n_rows), 1)
+    return logits / np.sqrt(counts) + bias
+
+class NgramDialectModel:
+    """
+    Hashed character n-gram logistic regression for Egypt versus other
+    dialects, distilled from the transformer's labels with distill_ngram.py.
+    """
+
+    def __init__(self, weights, bias=0.0, ngram_range=(2, 4)):
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.bias = float(bias)
+        self.ngram_range = tuple(int(n) for n in ngram_range)
+
+    @property
+    def n_features(self):
+        return len(self.weights)
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        return cls(data["weights"], float(data["bias"]), tuple(data["ngram_range"]))
+
+    def save(self, path):
+        np.savez_compressed(path, weights=self.weights, bias=np.float32(self.bias), ngram_range=np.asarray(self.ngram_range))
+
+    def egypt_probabilities(self, texts):
+        """Probability that each cue is Egyptian, scored for all cues in one vectorized pass"""
+        if not texts:
+            return np.zeros(0, dtype=np.float32)
+        rows, features = hashed_ngrams(texts, self.n_features, self.ngram_range)
+        logits = ngram_logits(self.weights, self.bias, rows, features, len(texts))
+        return 1.0 / (1.0 + np.exp(-logits))
+
+    def file_vote(self, texts):
+        """
+        Vote over all cues of a file.
+
+        Returns:
+            Tuple of (cue labels, Egypt share, margin); the margin is the
+            distance of the share from an even split, from 0 to 1
+        """
+        is_egypt = self.egypt_probabilities(texts) > 0.5
+        share = float(is_egypt.mean()) if len(texts) else 0.5
+        labels = ["Egypt" if egypt else OTHER_LABEL for egypt in is_egypt]
+        return labels, share, abs(share - 0.5) * 2
@@ -0,0 +1,31 @@
+from dialect_processing import EARLY_STOP_ALPHA, MIN_CUES, binomial_p_value, process_vtt_file, vote_settled
+
+def test_binomial_p_value_is_two_sided():
+    assert binomial_p_value(5, 10) == 1.0
+    assert binomial_p_value(0, 10) == binomial_p_value(10, 10) == 2 / 2 ** 10
+
+def test_too_few_cues_never_settle():
+    assert not vote_settled(['Egypt'] * (MIN_CUES - 1))
+
+def test_clear_majorities_settle():
+    assert vote_settled(['Egypt'] * 30)
+    assert vote_settled(['Egypt'] * 2 + ['Levant'] * 28)
+
+def test_split_labels_do_not_settle_while_egypt_is_close_to_the_leader():
+    # Egypt against all others combined is 9 of 30 (p < 0.05), yet two more
+    # Egypt cues would make it the plurality and flip the file to ECA
+    labels = ['Egypt'] * 9 + ['Levant'] * 10 + ['Gulf'] * 11
+    assert binomial_p_value(9, 30) < 0.05
+    assert not vote_settled(labels)
+
+def test_split_labels_settle_once_the_leader_is_clear():
+    labels = ['Egypt'] * 2 + ['Levant'] * 22 + ['Gulf'] * 6
+    assert binomial_p_value(2, 24) < EARLY_STOP_ALPHA
+    assert vote_settled(labels)
+
+def test_settled_decision_matches_the_plurality_vote(tmp_path):
+    labels = ['Egypt'] * 20 + ['Levant'] * 5 + ['Gulf'] * 5
+    assert vote_settled(labels)
+    vtt = tmp_path / "video.ar.vtt"
+    vtt.write_text("WEBVTT\n", encoding='utf-8')
+    assert process_vtt_file(str(vtt), labels)["target_folder"] == 'ECA'
@@ -0,0 +1,143 @@
+import os
+from functools import lru_cache
+
+import torch
+import torch.nn.functional as F
+import torchaudio
+
+from metrics import AUDIO_SECONDS, stage_timer
+
+CHANNELS = 1
+SAMPLE_RATE = 16_000
+# Source frames read per file, matching the original torchaudio.load(num_frames=...) cap
+MAX_SOURCE_FRAMES = 10_000_000
+# "torchaudio" loads the full-rate file then preprocesses it; "stream" asks ffmpeg
+# for 16 kHz mono directly and decodes it chunk by chunk
+DECODE_MODE = os.environ.get("LID_DECODE_MODE", "torchaudio")
+STREAM_CHUNK_FRAMES = int(os.environ.get("LID_STREAM_CHUNK_FRAMES", 16_000 * 10))
+
+# VAD frames: 25 ms long, every 10 ms
+VAD_FRAME = 400
+VAD_HOP = 160
+# A frame counts as speech if it is within VAD_RELATIVE_DB of the file's loud
+# frames, above VAD_MIN_DB, and its zero-crossing rate is below VAD_MAX_ZCR
+VAD_RELATIVE_DB = float(os.environ.get("LID_VAD_RELATIVE_DB", 30.0))
+VAD_MIN_DB = float(os.environ.get("LID_VAD_MIN_DB", -55.0))
+VAD_MAX_ZCR = float(os.environ.get("LID_VAD_MAX_ZCR", 0.35))
+
+class DecodeError(RuntimeError):
+    """The audio file exists but can't be decoded; retrying it won't help"""
+
+@lru_cache(maxsize=None)
+def get_resampler(orig_freq: int) -> torchaudio.transforms.Resample:
+    # Kernel computation only happens once per source sample rate
+    return torchaudio.transforms.Resample(orig_freq=orig_freq, new_freq=SAMPLE_RATE)
+
+def preprocess(signal: torch.tensor, sr: int) -> torch.tensor:
+    # Convert to monochannel first so only one channel has to be resampled
+    if signal.shape[0] != CHANNELS:
+        signal = torch.mean(signal, dim=0, keepdim=True)
+
+    # Resample the audio (if not already)
+    if sr != SAMPLE_RATE:
+        signal = get_resampler(sr)(signal)
+
+    return signal
+
+def load_audio_stream(path: str) -> torch.tensor:
+    """Decode straight to 16 kHz mono in chunks, so the full-rate stereo tensor is never held"""
+    # torchaudio.io needs the ffmpeg libraries, which only the stream mode uses
+    from torchaudio.io import StreamReader
+
+    reader = StreamReader(path)
+    src_info = reader.get_src_stream_info(reader.default_audio_stream)
+    max_frames = int(MAX_SOURCE_FRAMES * SAMPLE_RATE / src_info.sample_rate)
+    reader.add_basic_audio_stream(
+        frames_per_chunk=STREAM_CHUNK_FRAMES,
+        sample_rate=SAMPLE_RATE,
+        num_channels=CHANNELS,
+    )
+
+    chunks = []
+    total_frames = 0
+    for (chunk,) in reader.stream():
+        # Chunks come as (frames, channels)
+        chunks.append(chunk[:, 0].clone())
+        total_frames += chunk.shape[0]
+        if total_frames >= max_frames:
+            break
+
+    if not chunks:
+        raise RuntimeError(f"No audio frames decoded from {path}")
+    return torch.cat(chunks)[:max_frames].unsqueeze(0)
+
+def load_audio(path: str) -> torch.tensor:
+    """
+    Return the audio file as a (1, frames) 16 kHz mono tensor.
+
+    Raises:
+        FileNotFoundError: If the file doesn't exist
+        DecodeError: If the file can't be decoded
+    """
+    if not os.path.isfile(path):
+        raise FileNotFoundError(f"Audio file {path} not found")
+    try:
+        if DECODE_MODE == "stream":
+            with stage_timer("load"):
+                signal = load_audio_stream(path)
+        else:
+            with stage_timer("load"):
+                signal, sr = torchaudio.load(path, num_frames=MAX_SOURCE_FRAMES)
+            with stage_timer("preprocess"):
+                signal = preprocess(signal=signal, sr=sr)
+    except Exception as e:
+        raise DecodeError(f"Could not decode {path}: {e}") from e
+    AUDIO_SECONDS.inc(signal.shape[-1] / SAMPLE_RATE)
+    return signal
+
+def audio_duration(path: str):
+    """Duration in seconds read from the file header, or None if it can't be read"""
+    try:
+        info = torchaudio.info(path)
+    except Exception:
+        return None
+    if not info.sample_rate or info.num_frames <= 0:
+        return None
+    return info.num_frames / info.sample_rate
+
+def window_starts(total_samples: int, window_size_samples: int, stride_size_samples: int):
+    """Start offsets of the classification windows over a signal"""
+    # If audio file is less than or equal to one window, classify it whole
+    if total_samples <= window_size_samples:
+        return [0]
+    # Iterate over the audio file with a window size == WINDOW_SIZE and a stride == STRIDE
+    return list(range(0, total_samples - window_size_samples + 1, stride_size_samples))
+
+def speech_frames(signal: torch.tensor) -> torch.tensor:
+    """
+    Vectorized frame-energy and zero-crossing VAD over a 1-D 16 kHz signal.
+
+    Returns:
+        Boolean tensor with one entry per VAD_HOP frame
+    """
+    if len(signal) < VAD_FRAME:
+        return torch.ones(1, dtype=torch.bool)
+    # Pooling keeps memory linear in the signal length (no framed copy of the audio)
+    energy = F.avg_pool1d(signal.pow(2).view(1, 1, -1), VAD_FRAME, VAD_HOP).flatten()
+    crossings = (torch.sign(signal[1:]) != torch.sign(signal[:-1])).float()
+    zcr = F.avg_pool1d(crossings.view(1, 1, -1), VAD_FRAME, VAD_HOP).flatten()
+    frames = min(len(energy), len(zcr))
+    energy_db = 10 * torch.log10(energy[:frames] + 1e-10)
+
+    # Threshold relative to the loud part of this file, so gain differences between uploads don't matter
+    reference_db = float(torch.quantile(energy_db, 0.95))
+    threshold_db = max(reference_db - VAD_RELATIVE_DB, VAD_MIN_DB)
+    return (energy_db > threshold_db) & (zcr[:frames] < VAD_MAX_ZCR)
+
+def window_speech_ratios(speech: torch.tensor, starts, window_size_samples: int) -> torch.tensor:
+    """Fraction of speech frames inside each window"""
+    cumulative = torch.cat([torch.zeros(1), torch.cumsum(speech.float(), dim=0)])
+    starts = torch.tensor(starts)
+    first = torch.clamp(starts // VAD_HOP, max=len(speech) - 1)
+    last = torch.clamp((starts + window_size_samples) // VAD_HOP, min=first + 1, max=len(speech))
+    return (cumulative[last] - cumulative[first]) / (last - first).float()
@@ -0,0 +1,122 @@
+import argparse
+import glob
+import json
+import os
+import time
+from collections import Counter
+
+import torch
+from speechbrain.inference import EncoderClassifier
+
+from audio import SAMPLE_RATE, load_audio, window_starts
+from lid_export import BACKENDS, load_backend
+
+MODEL_DIR = "lid-model"
+WINDOW_SIZE = 30
+STRIDE = 30
+
+def load_heldout(heldout_dir, max_files):
+    """
+    Read the held-out set: one sub-folder per language named like the LID
+    output folders (e.g. 'Arabic', 'English'), each holding MP3 files.
+
+    Returns:
+        List of (file path, expected language, list of windows)
+    """
+    samples = []
+    for language in sorted(os.listdir(heldout_dir)):
+        language_dir = os.path.join(heldout_dir, language)
+        if not os.path.isdir(language_dir):
+            continue
+        for audio_file in sorted(glob.glob(f'{language_dir}/*.mp3'))[:max_files]:
+            signal = load_audio(audio_file).squeeze(0)
+            window_size_samples = SAMPLE_RATE * WINDOW_SIZE
+            starts = window_starts(len(signal), window_size_samples, SAMPLE_RATE * STRIDE)
+            windows = [signal[start:start + window_size_samples] for start in starts]
+            samples.append((audio_file, language, windows))
+    return samples
+
+def run_variant(classifier, samples, batch_size):
+    """Classify every window; returns per-file window labels and the pure inference time"""
+    # Group equal-length windows so each batch can be stacked
+    by_length = {}
+    for file_index, (_, _, windows) in enumerate(samples):
+        for window_index, window in enumerate(windows):
+            by_length.setdefault(len(window), []).append((file_index, window_index, window))
+
+    labels = [[None] * len(windows) for _, _, windows in samples]
+    inference_seconds = 0.0
+    for items in by_length.values():
+        for batch_start in range(0, len(items), batch_size):
+            batch = items[batch_start:batch_start + batch_size]
+            wavs = torch.stack([window for _, _, window in batch])
+            start_time = time.perf_counter()
+            prediction = classifier.classify_batch(wavs)
+            inference_seconds += time.perf_counter() - start_time
+            for (file_index, window_index, _), label in zip(batch, prediction[3]):
+                labels[file_index][window_index] = label.split(":")[1].strip()
+    return labels, inference_seconds
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare exported/quantized LID backends against the eager model")
+    parser.add_argument("--heldout", required=True, help="Folder with one sub-folder of MP3 files per language")
+    parser.add_argument("--variants", nargs="+", default=list(BACKENDS), choices=BACKENDS, help="Backends to evaluate")
+    parser.add_argument("--tolerance", type=float, default=0.01, help="Maximum allowed drop in file accuracy versus eager")
+    parser.add_argument("--max-files", type=int, default=50, help="Files per language to use")
+    parser.add_argument("--batch-size", type=int, default=8, help="Windows per classify_batch call")
+    parser.add_argument("--threads", type=int, default=None, help="torch/onnxruntime intra-op threads")
+    parser.add_argument("--output", default="lid_benchmark.json", help="Where to write the JSON report")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    eager = EncoderClassifier.from_hparams(source=MODEL_DIR, savedir=MODEL_DIR, run_opts={"device": "cpu"})
+    eager.hparams.label_encoder.ignore_len()
+
+    samples = load_heldout(args.heldout, args.max_files)
+    if not samples:
+        print("Held-out folder doesn't contain audio files")
+        return
+    total_windows = sum(len(windows) for _, _, windows in samples)
+    print(f"Loaded {len(samples)} files, {total_windows} windows")
+
+    variants = ["eager"] + [variant for variant in args.variants if variant != "eager"]
+    reports = {}
+    eager_labels = None
+    for variant in variants:
+        classifier = load_backend(eager, variant, MODEL_DIR, num_threads=args.threads)
+        # Warm-up so lazy initialisation isn't billed to the first batch
+        classifier.classify_batch(torch.stack([samples[0][2][0]]))
+
+        labels, inference_seconds = run_variant(classifier, samples, args.batch_size)
+        if eager_labels is None:
+            eager_labels = labels
+
+        file_predictions = [Counter(window_labels).most_common(1)[0][0] for window_labels in labels]
+        correct = sum(prediction == language for prediction, (_, language, _) in zip(file_predictions, samples))
+        window_agreement = sum(
+            label == reference
+            for window_labels, reference_labels in zip(labels, eager_labels)
+            for label, reference in zip(window_labels, reference_labels)
+        )
+        reports[variant] = {
+            "file_accuracy": correct / len(samples),
+            "window_agreement_with_eager": window_agreement / total_windows,
+            "windows_per_second": total_windows / inference_seconds if inference_seconds else None,
+        }
+        print(f"{variant:>18}: accuracy {reports[variant]['file_accuracy']:.4f}, "
+              f"agreement {reports[variant]['window_agreement_with_eager']:.4f}, "
+              f"{reports[variant]['windows_per_second']:.1f} windows/s")
+
+    baseline = reports["eager"]["file_accuracy"]
+    eligible = [variant for variant in variants if reports[variant]["file_accuracy"] >= baseline - args.tolerance]
+    recommended = max(eligible, key=lambda variant: reports[variant]["windows_per_second"] or 0)
+    print(f"\nFastest variant within {args.tolerance:.2%} of eager accuracy: {recommended} (set LID_BACKEND={recommended})")
+
+    with open(args.output, 'w') as f:
+        json.dump({"files": len(samples), "windows": total_windows, "tolerance": args.tolerance,
+                   "variants": reports, "recommended": recommended}, f, indent=4)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import os
+import re
+
+from file_index import index_for, video_id_of
+from webvtt import read_cues
+
+# Arabic, Arabic Supplement, Arabic Extended-A and the presentation forms
+ARABIC_SCRIPT = re.compile(r'[\u0600-\u06FF\u0750-\u077F\u08A0-\u08FF\uFB50-\uFDFF\uFE70-\uFEFF]')
+
+def find_captions(audio_file, lang="ar"):
+    """Caption file of an MP3, preferring '<id>.<lang>.vtt' over any other '<id>*.vtt'"""
+    stem = audio_file[:-4]
+    preferred = f"{stem}.{lang}.vtt"
+    if os.path.exists(preferred):
+        return preferred
+    folder, name = os.path.split(audio_file)
+    candidates = index_for(folder).paths(video_id_of(name), ".vtt", refresh_for=name)
+    return candidates[0] if candidates else None
+
+def caption_stats(vtt_file, audio_seconds=None):
+    """
+    Cheap statistics of a caption file used as a prior for audio LID.
+
+    Args:
+        vtt_file: Path of the WebVTT file
+        audio_seconds: Duration of the audio; the end of the last cue is used if unknown
+
+    Returns:
+        Dict with the number of "cues", the "arabic_fraction" of cues written
+        mostly in Arabic script and the "coverage" of the audio by cues
+    """
+    cues = read_cues(vtt_file)
+    if not cues:
+        return {"cues": 0, "arabic_fraction": 0.0, "coverage": 0.0}
+
+    arabic_cues = 0
+    for _, _, text in cues:
+        letters = [char for char in text if char.isalpha()]
+        if letters and len(ARABIC_SCRIPT.findall(text)) / len(letters) > 0.5:
+            arabic_cues += 1
+
+    # Merge overlapping cues (rolling auto-captions repeat lines) before summing
+    covered = 0.0
+    current_start, current_end = None, None
+    for start, end, _ in sorted(cues):
+        if current_end is None or start > current_end:
+            if current_end is not None:
+                covered += current_end - current_start
+            current_start, current_end = start, end
+        else:
+            current_end = max(current_end, end)
+    covered += current_end - current_start
+
+    duration = audio_seconds or max(end for _, end, _ in cues)
+    return {
+        "cues": len(cues),
+        "arabic_fraction": round(arabic_cues / len(cues), 4),
+        "coverage": round(min(1.0, covered / duration), 4) if duration > 0 else 0.0,
+    }
+
+def caption_prior(stats, arabic_min, other_max, min_cues, min_coverage):
+    """
+    Route a file from its caption statistics.
+
+    Returns:
+        "arabic" or "other" when the captions are clear-cut, None when they are
+        ambiguous (or too sparse) and the file needs full audio LID
+    """
+    if stats["cues"] < min_cues or stats["coverage"] < min_coverage:
+        return None
+    if stats["arabic_fraction"] >= arabic_min:
+        return "arabic"
+    if stats["arabic_fraction"] <= other_max:
+        return "other"
+    return None
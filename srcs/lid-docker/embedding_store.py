@@ -0,0 +1,118 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+class EmbeddingStore:
+    """
+    Append-only float16 store of per-window LID vectors.
+
+    Each row is one window: the ECAPA embedding followed by the class
+    log-probabilities. Rows live in one flat binary file that readers map with
+    np.memmap, and an SQLite index records which rows belong to which file:
+
+        store_dir/
+            vectors.f16     rows of float16, row width given in meta.json
+            meta.json       {"dim", "embedding_dim", "num_classes", "dtype"}
+            index.sqlite    file, audio hash, first row, row count, window starts
+    """
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        self.data_path = os.path.join(store_dir, "vectors.f16")
+        self.meta_path = os.path.join(store_dir, "meta.json")
+        self.lock = threading.Lock()
+        os.makedirs(store_dir, exist_ok=True)
+        self.meta = None
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, 'r') as f:
+                self.meta = json.load(f)
+        self.conn = sqlite3.connect(os.path.join(store_dir, "index.sqlite"), check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS windows (
+                    file TEXT NOT NULL,
+                    audio_sha256 TEXT,
+                    model_revision TEXT,
+                    first_row INTEGER NOT NULL,
+                    row_count INTEGER NOT NULL,
+                    window_starts TEXT NOT NULL,
+                    created_at REAL
+                )
+            """)
+            self.conn.execute("CREATE INDEX IF NOT EXISTS windows_file ON windows (file)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS windows_hash ON windows (audio_sha256)")
+
+    def append(self, file, embeddings, log_probs, window_starts, audio_sha256=None, model_revision=None):
+        """
+        Append the vectors of one file.
+
+        Args:
+            file: Key to index the rows by (the audio file name)
+            embeddings: (windows, embedding_dim) array
+            log_probs: (windows, num_classes) array
+            window_starts: Start of each window in seconds
+        """
+        rows = np.concatenate([embeddings, log_probs], axis=1).astype(np.float16)
+        with self.lock:
+            if self.meta is None:
+                self.meta = {
+                    "dim": rows.shape[1],
+                    "embedding_dim": embeddings.shape[1],
+                    "num_classes": log_probs.shape[1],
+                    "dtype": "float16",
+                }
+                with open(self.meta_path, 'w') as f:
+                    json.dump(self.meta, f, indent=4)
+            elif rows.shape[1] != self.meta["dim"]:
+                raise ValueError(f"Row width {rows.shape[1]} doesn't match the store's {self.meta['dim']}")
+
+            with open(self.data_path, 'ab') as f:
+                first_row = f.tell() // (self.meta["dim"] * 2)
+                f.write(rows.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            # Rows are durable before the index points at them
+            with self.conn:
+                self.conn.execute(
+                    "INSERT INTO windows VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (file, audio_sha256, model_revision, first_row, len(rows), json.dumps(list(window_starts)), time.time()),
+                )
+
+    def has(self, audio_sha256, model_revision):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT 1 FROM windows WHERE audio_sha256 = ? AND model_revision = ? LIMIT 1",
+                (audio_sha256, model_revision),
+            ).fetchone()
+        return row is not None
+
+    def matrix(self):
+        """Read-only memory map over every stored row"""
+        if self.meta is None or not os.path.exists(self.data_path):
+            return np.zeros((0, 0), dtype=np.float16)
+        rows = os.path.getsize(self.data_path) // (self.meta["dim"] * 2)
+        return np.memmap(self.data_path, dtype=np.float16, mode='r', shape=(rows, self.meta["dim"]))
+
+    def vectors(self, file):
+        """
+        Return the most recent vectors stored for a file.
+
+        Returns:
+            Tuple of (embeddings, log_probs, window starts), or None if the file isn't in the store
+        """
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT first_row, row_count, window_starts FROM windows WHERE file = ? ORDER BY rowid DESC LIMIT 1",
+                (file,),
+            ).fetchone()
+        if row is None:
+            return None
+        first_row, row_count, starts = row
+        block = self.matrix()[first_row:first_row + row_count]
+        embedding_dim = self.meta["embedding_dim"]
+        return block[:, :embedding_dim], block[:, embedding_dim:], json.loads(starts)
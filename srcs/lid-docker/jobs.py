@@ -0,0 +1,124 @@
+import threading
+from collections import deque
+
+from service_jobs import Job
+
+class JobManager:
+    """
+    Queue of jobs sharing one pool of worker threads.
+
+    Workers take files from the active jobs in round-robin order, so a job
+    submitted while another is running starts making progress straight away
+    instead of waiting for the first one to finish.
+
+    With a journal every job and per-file outcome is also written to disk, so
+    unfinished jobs can be restored after a restart.
+
+    Only the last max_finished_jobs finished jobs are kept, with their results,
+    for GET /jobs/<id>; older ones are forgotten.
+    """
+
+    def __init__(self, process_file, num_workers=1, journal=None, max_finished_jobs=100):
+        self.process_file = process_file
+        self.num_workers = num_workers
+        self.journal = journal
+        self.max_finished_jobs = max_finished_jobs
+        self.jobs = {}
+        self.active = deque()
+        # Ids of the finished jobs still in self.jobs, oldest first
+        self.finished = deque()
+        self.condition = threading.Condition()
+        self.workers = []
+
+    def start(self):
+        for i in range(self.num_workers):
+            worker = threading.Thread(target=self._worker_loop, name=f"job-worker-{i}", daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def submit(self, files, source=None):
+        job = Job(files, source=source)
+        if self.journal is not None:
+            self.journal.open_job(job)
+        self._activate(job)
+        return job
+
+    def restore(self, job_id, files, results, source=None, created_at=None):
+        """
+        Re-queue a journaled job under its original id. Files that already
+        have a result are not processed again.
+        """
+        done = {result.get("file") for result in results}
+        remaining = [audio_file for audio_file in files if audio_file not in done]
+        # Finished files go first so next_index can skip over them
+        job = Job([audio_file for audio_file in files if audio_file in done] + remaining,
+                  source=source, job_id=job_id, created_at=created_at)
+        job.results = list(results)
+        job.failed = sum(1 for result in results if result.get("status") == "error")
+        job.next_index = len(job.files) - len(remaining)
+        if job.results:
+            # Rates and ETA count from the original start, including the downtime
+            job.started_at = job.created_at
+            job.status = "processing"
+        self._activate(job)
+        return job
+
+    def _activate(self, job):
+        with self.condition:
+            self.jobs[job.id] = job
+            if job.next_index < len(job.files):
+                self.active.append(job)
+                self.condition.notify_all()
+                return
+        job.finish()
+        self._retire(job)
+
+    def get(self, job_id):
+        with self.condition:
+            return self.jobs.get(job_id)
+
+    def list(self):
+        with self.condition:
+            return list(self.jobs.values())
+
+    def queue_depth(self):
+        """Number of files submitted but not yet handed to a worker"""
+        with self.condition:
+            return sum(len(job.files) - job.next_index for job in self.active)
+
+    def _next_file(self):
+        with self.condition:
+            while not self.active:
+                self.condition.wait()
+            job = self.active.popleft()
+            audio_file = job.files[job.next_index]
+            job.next_index += 1
+            job.mark_started()
+            # Put the job at the back of the line if it still has files left
+            if job.next_index < len(job.files):
+                self.active.append(job)
+            return job, audio_file
+
+    def _worker_loop(self):
+        while True:
+            job, audio_file = self._next_file()
+            if self.journal is not None:
+                self.journal.file_started(job.id, audio_file)
+            try:
+                result = self.process_file(audio_file)
+            except Exception as e:
+                print(f"  Error processing {audio_file}: {str(e)}")
+                result = {"file": audio_file, "status": "error", "message": str(e)}
+            if self.journal is not None:
+                self.journal.file_finished(job.id, result)
+            if job.add_result(result):
+                self._retire(job)
+
+    def _retire(self, job):
+        """Close a finished job's journal and forget the oldest finished jobs past the limit"""
+        if self.journal is not None:
+            self.journal.close_job(job.id, job.status)
+        with self.condition:
+            self.finished.append(job.id)
+            while len(self.finished) > self.max_finished_jobs:
+                self.jobs.pop(self.finished.popleft(), None)
@@ -0,0 +1,123 @@
+import glob
+import json
+import os
+import threading
+import time
+
+class JobJournal:
+    """
+    Append-only JSONL log of every job, one file per job, so a job survives a
+    crash or container restart.
+
+    Each journal starts with a "job" record holding the file list, followed by
+    a "started" record before a file is processed and a "result" record (fsynced)
+    once it is done, and ends with a "finished" record.
+
+    Finished journals are moved to the "finished" sub-folder, so a restart only
+    reads the jobs it may have to resume, and are deleted there after
+    retention_seconds.
+    """
+
+    def __init__(self, journal_dir, retention_seconds=7 * 24 * 3600):
+        self.journal_dir = journal_dir
+        self.finished_dir = os.path.join(journal_dir, "finished")
+        self.retention_seconds = retention_seconds
+        self.lock = threading.Lock()
+        self.handles = {}
+        os.makedirs(self.finished_dir, exist_ok=True)
+
+    def _path(self, job_id):
+        return os.path.join(self.journal_dir, f"{job_id}.jsonl")
+
+    def _write(self, job_id, record, sync=False):
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self.lock:
+            handle = self.handles.get(job_id)
+            if handle is None:
+                handle = self.handles[job_id] = open(self._path(job_id), 'a', encoding='utf-8')
+            handle.write(line)
+            handle.flush()
+            if sync:
+                os.fsync(handle.fileno())
+
+    def open_job(self, job):
+        self._write(job.id, {
+            "event": "job",
+            "job_id": job.id,
+            "files": job.files,
+            "source": job.source,
+            "created_at": job.created_at,
+        }, sync=True)
+
+    def file_started(self, job_id, audio_file):
+        # Only needs to survive a crash of this process, so no fsync
+        self._write(job_id, {"event": "started", "file": audio_file, "time": time.time()})
+
+    def file_finished(self, job_id, result):
+        self._write(job_id, {"event": "result", "result": result, "time": time.time()}, sync=True)
+
+    def close_job(self, job_id, status):
+        self._write(job_id, {"event": "finished", "status": status, "time": time.time()}, sync=True)
+        with self.lock:
+            handle = self.handles.pop(job_id, None)
+        if handle is not None:
+            handle.close()
+        os.replace(self._path(job_id), os.path.join(self.finished_dir, f"{job_id}.jsonl"))
+        self.prune()
+
+    def prune(self):
+        """Delete the finished journals older than retention_seconds"""
+        cutoff = time.time() - self.retention_seconds
+        with os.scandir(self.finished_dir) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_file() and entry.stat().st_mtime < cutoff:
+                        os.remove(entry.path)
+                except FileNotFoundError:
+                    # Pruned by a job closing at the same time
+                    continue
+
+    def unfinished_jobs(self):
+        """
+        Read back the jobs whose journal has no "finished" record. Journals
+        closed before the "finished" folder existed are moved there.
+
+        Returns:
+            List of dicts with "job_id", "files", "source", "created_at", the
+            recorded "results" and "attempts", the number of times each file
+            was started without a result (i.e. the process died on it)
+        """
+        jobs = []
+        for path in sorted(glob.glob(os.path.join(self.journal_dir, "*.jsonl")), key=os.path.getmtime):
+            header, results, attempts, finished = None, [], {}, False
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A torn last line from the crash itself
+                        continue
+                    event = record.get("event")
+                    if event == "job":
+                        header = record
+                    elif event == "started":
+                        attempts[record["file"]] = attempts.get(record["file"], 0) + 1
+                    elif event == "result":
+                        results.append(record["result"])
+                        attempts.pop(record["result"].get("file"), None)
+                    elif event == "finished":
+                        finished = True
+            if finished:
+                os.replace(path, os.path.join(self.finished_dir, os.path.basename(path)))
+                continue
+            if header is None:
+                continue
+            jobs.append({
+                "job_id": header["job_id"],
+                "files": header["files"],
+                "source": header.get("source"),
+                "created_at": header.get("created_at"),
+                "results": results,
+                "attempts": attempts,
+            })
+        return jobs
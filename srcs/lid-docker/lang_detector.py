@@ -8,6 +8,8 @@ import torch
 from tqdm import tqdm
 from collections import Counter
 
+from audio import preprocess
+
 def most_frequent(List):
     occurence_count = Counter(List)
 
@@ -70,27 +72,6 @@ def copy_audio_to_lang_folder(path, lang, audio_file):
         shutil.move(f'{audio_file}', f'{os.path.join(langPath, os.path.basename(audio_file))}')
         return False
 
-def preprocess(signal: torch.tensor, sr: int) -> torch.tensor:
-    CHANNELS = 1
-    SAMPLE_RATE = 16_000
-
-    # Resample the audio (if not already)
-    if sr != SAMPLE_RATE:
-        resample_transform = torchaudio.transforms.Resample(
-            orig_freq=sr, new_freq=SAMPLE_RATE
-        )
-        resampled_waveform = resample_transform(signal)
-    else:
-        resampled_waveform = signal
-
-    # Convert to monochannel (if not already)
-    if resampled_waveform.shape[0] != CHANNELS:
-        monochannel_waveform = torch.mean(resampled_waveform, dim=0, keepdim=True)
-    else:
-        monochannel_waveform = resampled_waveform
-
-    return monochannel_waveform
-
 def process_audio_files(language_id=None):
     """Process audio files and organize them by detected language"""
     # If model wasn't passed, load it (fallback)
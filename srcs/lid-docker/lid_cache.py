@@ -0,0 +1,99 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+def file_sha256(path):
+    """Hash a file's content in chunks so large audio files are never read into memory at once"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def checkpoint_hashes(model_dir):
+    """SHA-256 of every checkpoint and hyperparameter file in the model folder"""
+    checkpoints = {}
+    if os.path.isdir(model_dir):
+        for name in sorted(os.listdir(model_dir)):
+            if name.endswith(('.ckpt', '.yaml')):
+                checkpoints[name] = file_sha256(os.path.join(model_dir, name))
+    return checkpoints
+
+def model_revision(source, model_dir, settings, checkpoints=None):
+    """
+    Identify the model that produced a prediction.
+
+    Args:
+        source: Model source passed to EncoderClassifier.from_hparams
+        model_dir: Folder holding the checkpoint files
+        settings: Dict of inference settings that change the output (window, stride, ...)
+        checkpoints: Already computed checkpoint_hashes(model_dir), if available
+
+    Returns:
+        Hex digest combining the source, checkpoint hashes and settings
+    """
+    if checkpoints is None:
+        checkpoints = checkpoint_hashes(model_dir)
+    identity = {"source": source, "checkpoints": checkpoints, "settings": settings}
+    return hashlib.sha256(json.dumps(identity, sort_keys=True).encode()).hexdigest()
+
+class LIDResultCache:
+    """Persistent map from (audio content hash, model revision) to a LID prediction"""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS lid_results (
+                    audio_sha256 TEXT NOT NULL,
+                    model_revision TEXT NOT NULL,
+                    language TEXT NOT NULL,
+                    window_labels TEXT NOT NULL,
+                    window_scores TEXT NOT NULL,
+                    inference_seconds REAL,
+                    created_at REAL,
+                    PRIMARY KEY (audio_sha256, model_revision)
+                )
+            """)
+
+    def get(self, audio_sha256, revision):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT language, window_labels, window_scores, inference_seconds "
+                "FROM lid_results WHERE audio_sha256 = ? AND model_revision = ?",
+                (audio_sha256, revision),
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "language": row[0],
+            "window_labels": json.loads(row[1]),
+            "window_scores": json.loads(row[2]),
+            "inference_seconds": row[3],
+        }
+
+    def put(self, audio_sha256, revision, language, window_labels, window_scores, inference_seconds):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO lid_results VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    audio_sha256,
+                    revision,
+                    language,
+                    json.dumps(window_labels, ensure_ascii=False),
+                    json.dumps(window_scores),
+                    inference_seconds,
+                    time.time(),
+                ),
+            )
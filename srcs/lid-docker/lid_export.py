@@ -0,0 +1,150 @@
+import os
+
+import torch
+
+# Variants that can be served instead of the eager speechbrain model
+BACKENDS = ("eager", "torchscript", "torchscript-int8", "onnx", "onnx-int8")
+
+class ECAPAScorer(torch.nn.Module):
+    """
+    The part of EncoderClassifier.classify_batch that runs after feature
+    extraction: ECAPA embedding followed by the language classifier.
+
+    Feature extraction (Fbank + mean/variance normalisation) stays in eager
+    PyTorch, which keeps the exported graph free of STFT ops.
+    """
+
+    def __init__(self, classifier):
+        super().__init__()
+        self.embedding_model = classifier.mods.embedding_model
+        self.classifier = classifier.mods.classifier
+
+    def forward(self, feats):
+        embeddings = self.embedding_model(feats)
+        log_probs = self.classifier(embeddings).squeeze(1)
+        return embeddings.squeeze(1), log_probs
+
+def compute_features(classifier, wavs):
+    """Fbank features normalised the same way EncoderClassifier.encode_batch does it"""
+    wavs = wavs.to(classifier.device).float()
+    wav_lens = torch.ones(wavs.shape[0], device=classifier.device)
+    feats = classifier.mods.compute_features(wavs)
+    return classifier.mods.mean_var_norm(feats, wav_lens)
+
+def exported_path(model_dir, backend):
+    extension = "onnx" if backend.startswith("onnx") else "pt"
+    return os.path.join(model_dir, "exported", f"ecapa-{backend}.{extension}")
+
+def export_model(classifier, backend, model_dir, example_seconds=30):
+    """
+    Export the ECAPA scorer for a backend, applying dynamic int8
+    quantization to the linear layers for the *-int8 variants.
+
+    Returns:
+        Path of the exported model
+    """
+    if backend not in BACKENDS or backend == "eager":
+        raise ValueError(f"Cannot export backend '{backend}', choose one of: {', '.join(BACKENDS[1:])}")
+
+    output_path = exported_path(model_dir, backend)
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+
+    scorer = ECAPAScorer(classifier).cpu().eval()
+    example = torch.randn(1, 16_000 * example_seconds) * 0.01
+    with torch.no_grad():
+        example_feats = compute_features(classifier, example).cpu()
+
+        if backend.startswith("torchscript"):
+            if backend.endswith("int8"):
+                scorer = torch.ao.quantization.quantize_dynamic(scorer, {torch.nn.Linear}, dtype=torch.qint8)
+            traced = torch.jit.trace(scorer, example_feats)
+            traced = torch.jit.freeze(traced)
+            traced.save(output_path)
+        else:
+            fp32_path = exported_path(model_dir, "onnx")
+            if backend == "onnx" or not os.path.exists(fp32_path):
+                torch.onnx.export(
+                    scorer,
+                    (example_feats,),
+                    fp32_path,
+                    input_names=["feats"],
+                    output_names=["embeddings", "log_probs"],
+                    dynamic_axes={"feats": {0: "batch", 1: "frames"}, "embeddings": {0: "batch"}, "log_probs": {0: "batch"}},
+                    opset_version=17,
+                )
+            if backend == "onnx-int8":
+                # Quantizes the MatMul/Gemm weights, i.e. the linear layers
+                from onnxruntime.quantization import QuantType, quantize_dynamic
+                quantize_dynamic(fp32_path, output_path, weight_type=QuantType.QInt8)
+
+    print(f"Exported {backend} model to {output_path}")
+    return output_path
+
+class ExportedClassifier:
+    """
+    Drop-in replacement for EncoderClassifier.classify_batch backed by an
+    exported scorer. The eager model is kept for feature extraction and the
+    label encoder.
+    """
+
+    def __init__(self, classifier, backend, model_dir, num_threads=None):
+        self.eager = classifier
+        self.backend = backend
+        self.hparams = classifier.hparams
+        self.device = classifier.device
+        path = exported_path(model_dir, backend)
+        if not os.path.exists(path):
+            path = export_model(classifier, backend, model_dir)
+
+        if backend.startswith("torchscript"):
+            self.scorer = torch.jit.load(path, map_location="cpu")
+            self.session = None
+        else:
+            import onnxruntime
+            options = onnxruntime.SessionOptions()
+            if num_threads:
+                options.intra_op_num_threads = num_threads
+            self.session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+            self.scorer = None
+
+    def score_features(self, feats):
+        """Return (embeddings, log_probs) for a batch of normalised features"""
+        if self.session is not None:
+            embeddings, log_probs = self.session.run(None, {"feats": feats.cpu().numpy()})
+            return torch.from_numpy(embeddings), torch.from_numpy(log_probs)
+        return self.scorer(feats.cpu())
+
+    def classify_batch(self, wavs, wav_lens=None):
+        """Same return value as EncoderClassifier.classify_batch: (log_probs, score, index, labels)"""
+        with torch.no_grad():
+            feats = compute_features(self.eager, wavs)
+            _, out_prob = self.score_features(feats)
+            score, index = torch.max(out_prob, dim=-1)
+            text_lab = self.hparams.label_encoder.decode_torch(index)
+        return out_prob, score, index, text_lab
+
+def classify_with_embeddings(classifier, wavs):
+    """
+    classify_batch that also keeps the window embeddings.
+
+    Returns:
+        Tuple of (embeddings, log_probs, score, labels)
+    """
+    with torch.no_grad():
+        if isinstance(classifier, ExportedClassifier):
+            embeddings, out_prob = classifier.score_features(compute_features(classifier.eager, wavs))
+        else:
+            embeddings = classifier.encode_batch(wavs)
+            out_prob = classifier.mods.classifier(embeddings).squeeze(1)
+            embeddings = embeddings.squeeze(1)
+        score, index = torch.max(out_prob, dim=-1)
+        labels = classifier.hparams.label_encoder.decode_torch(index)
+    return embeddings, out_prob, score, labels
+
+def load_backend(classifier, backend, model_dir, num_threads=None):
+    """Wrap the eager classifier in the requested serving backend"""
+    if backend == "eager":
+        return classifier
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown LID backend '{backend}', choose one of: {', '.join(BACKENDS)}")
+    return ExportedClassifier(classifier, backend, model_dir, num_threads=num_threads)
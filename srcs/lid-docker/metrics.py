@@ -0,0 +1,39 @@
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+from worker_metrics import ReplayableMetric
+
+# The default registry also exports process_resident_memory_bytes and the
+# other process_* series, so RSS needs no extra collector here. Counters and
+# histograms are ReplayableMetric, so worker processes can send their updates
+# back to the server process.
+
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+STAGE_LATENCY = ReplayableMetric(Histogram(
+    "lid_stage_seconds",
+    "Time spent in each stage of processing one file",
+    ["stage"],
+    buckets=STAGE_BUCKETS,
+))
+FILES_PROCESSED = ReplayableMetric(Counter("lid_files_processed_total", "Files finished, by outcome", ["status"]))
+CACHE_LOOKUPS = ReplayableMetric(Counter("lid_cache_lookups_total", "Result cache lookups, by outcome", ["result"]))
+WINDOWS_CLASSIFIED = ReplayableMetric(Counter("lid_windows_classified_total", "Windows sent to the classifier"))
+WINDOWS_SKIPPED = ReplayableMetric(Counter("lid_windows_skipped_total", "Windows skipped by the VAD gate"))
+CASCADE_ROUTES = ReplayableMetric(Counter("lid_cascade_routes_total", "Files by the path they took through the caption-prior cascade", ["route"]))
+AUDIO_SECONDS = ReplayableMetric(Counter("lid_audio_seconds_total", "Seconds of 16 kHz audio decoded"))
+BATCH_SIZE = ReplayableMetric(Histogram(
+    "lid_batch_size",
+    "Windows per classify_batch call",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+))
+QUEUE_DEPTH = Gauge("lid_queue_depth", "Files submitted but not yet picked up by a worker")
+MODEL_LOAD = Gauge("lid_model_load_seconds", "Seconds spent loading and verifying the model")
+MODEL_WARMUP = Gauge("lid_model_warmup_seconds", "Seconds spent on the synthetic warm-up batch")
+COLD_START = Gauge("lid_cold_start_seconds", "Seconds from process start until /health reported ready")
+
+def stage_timer(stage):
+    """Context manager recording the duration of a stage in lid_stage_seconds"""
+    return STAGE_LATENCY.labels(stage=stage).time()
+
+def render():
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -1,138 +1,435 @@
-from flask import Flask, jsonify, request
 import os
+import time
+
+# Taken before the heavy imports so the reported cold start includes them
+PROCESS_START_TIME = time.time()
+
+MODEL_DIR = "lid-model"
+# "local" loads from the MODEL_DIR snapshot without touching the hub; "hub" always resolves MODEL_SOURCE
+MODEL_LOAD_MODE = os.environ.get("LID_MODEL_LOAD_MODE", "local")
+REQUIRED_MODEL_FILES = ("hyperparams.yaml", "embedding_model.ckpt", "classifier.ckpt", "label_encoder.ckpt")
+
+def missing_model_files():
+    """Names of the REQUIRED_MODEL_FILES that are missing or empty in MODEL_DIR"""
+    missing = []
+    for name in REQUIRED_MODEL_FILES:
+        file_path = os.path.join(MODEL_DIR, name)
+        if not os.path.isfile(file_path) or os.path.getsize(file_path) == 0:
+            missing.append(name)
+    return missing
+
+# huggingface_hub reads HF_HUB_OFFLINE once, when speechbrain imports it below,
+# so a snapshot we already have must switch the hub off before that
+if MODEL_LOAD_MODE == "local" and not missing_model_files():
+    os.environ.setdefault("HF_HUB_OFFLINE", "1")
+
+from flask import Flask, Response, jsonify, request, stream_with_context
+import json
 import threading
 from speechbrain.inference import EncoderClassifier
 import torch
-import time
+import numpy as np
 from natsort import natsorted, ns
-import shutil
-import glob
-import torchaudio
-from tqdm import tqdm
 from collections import Counter
+from audio import DECODE_MODE, DecodeError, SAMPLE_RATE, audio_duration, load_audio, speech_frames, window_speech_ratios, window_starts
+from caption_prior import caption_prior, caption_stats, find_captions
+from lid_cache import LIDResultCache, checkpoint_hashes, file_sha256, model_revision
+from jobs import JobManager
+from journal import JobJournal
+from service_jobs import event_cursor, job_page, stream_job_events
+from lid_export import classify_with_embeddings, export_model, exported_path, load_backend
+from embedding_store import EmbeddingStore
+from file_index import index_for, video_id_of
+from worker_pool import PreforkPool, WorkerCrashed
+from worker_metrics import recording, replay
+from metrics import (
+    BATCH_SIZE as BATCH_SIZE_HISTOGRAM,
+    CACHE_LOOKUPS,
+    CASCADE_ROUTES,
+    COLD_START,
+    FILES_PROCESSED,
+    MODEL_LOAD,
+    MODEL_WARMUP,
+    QUEUE_DEPTH,
+    WINDOWS_CLASSIFIED,
+    WINDOWS_SKIPPED,
+    render as render_metrics,
+    stage_timer,
+)
 
 app = Flask(__name__)
 
 # Global variables
-is_processing = False
+# Job started through the legacy /process endpoint, reported by /status
+legacy_job_id = None
 processing_results = None
 language_classifier = None
+result_cache = None
+model_revision_id = None
+worker_pool = None
+embedding_store = None
+# Prefork worker deaths per file; like a file that keeps crashing the server,
+# one in flight for MAX_ATTEMPTS of them is quarantined
+worker_crashes = Counter()
 
 def most_frequent(List):
     occurence_count = Counter(List)
     most_frequent_lang = occurence_count.most_common(1)[0][0]
     return most_frequent_lang
 
-def preprocess(signal: torch.tensor, sr: int) -> torch.tensor:
-    CHANNELS = 1
-    SAMPLE_RATE = 16_000
+def weighted_vote(labels, weights):
+    """Label with the largest total weight; ties go to the label seen first, like most_frequent"""
+    totals = {}
+    for label, weight in zip(labels, weights):
+        totals[label] = totals.get(label, 0.0) + weight
+    return max(totals, key=totals.get)
 
-    # Resample the audio (if not already)
-    if sr != SAMPLE_RATE:
-        resample_transform = torchaudio.transforms.Resample(
-            orig_freq=sr, new_freq=SAMPLE_RATE
-        )
-        resampled_waveform = resample_transform(signal)
-    else:
-        resampled_waveform = signal
+# Window and stride in seconds used for the majority vote
+WINDOW_SIZE = 30
+STRIDE = 30
 
-    # Convert to monochannel (if not already)
-    if resampled_waveform.shape[0] != CHANNELS:
-        monochannel_waveform = torch.mean(resampled_waveform, dim=0, keepdim=True)
-    else:
-        monochannel_waveform = resampled_waveform
+# "skip" drops windows whose speech ratio is below VAD_MIN_SPEECH_RATIO, "weight"
+# down-weights them in the vote and "off" classifies every window
+VAD_MODE = os.environ.get("LID_VAD_MODE", "skip")
+VAD_MIN_SPEECH_RATIO = float(os.environ.get("LID_VAD_MIN_SPEECH_RATIO", 0.2))
 
-    return monochannel_waveform
+# Caption-prior cascade: files whose captions are clearly Arabic (or clearly not)
+# only get CASCADE_CONFIRM_WINDOWS windows classified and fall back to full LID
+# if those disagree with the captions; LID_CASCADE=off runs full LID on every file
+CASCADE_MODE = os.environ.get("LID_CASCADE", "on")
+CAPTION_LANG = os.environ.get("LID_CAPTION_LANG", "ar")
+# Fraction of cues in Arabic script at or above which the captions count as Arabic...
+CASCADE_ARABIC_MIN = float(os.environ.get("LID_CASCADE_ARABIC_MIN", 0.9))
+# ...and at or below which they count as another language
+CASCADE_OTHER_MAX = float(os.environ.get("LID_CASCADE_OTHER_MAX", 0.1))
+# Sparse captions say little about the audio, so they always get full LID
+CASCADE_MIN_CUES = int(os.environ.get("LID_CASCADE_MIN_CUES", 10))
+CASCADE_MIN_COVERAGE = float(os.environ.get("LID_CASCADE_MIN_COVERAGE", 0.2))
+CASCADE_CONFIRM_WINDOWS = int(os.environ.get("LID_CASCADE_CONFIRM_WINDOWS", 3))
 
-def detect_lang(path: str, classifier: EncoderClassifier) -> str:
-    signal, sr = torchaudio.load(path, num_frames=10000000)
-    signal = preprocess(signal=signal, sr=sr)
+# Windows sent to classify_batch together
+BATCH_SIZE = int(os.environ.get("LID_BATCH_SIZE", 8))
+# "threaded" runs inference in the job worker threads; "prefork" forks LID_NUM_WORKERS
+# processes after the model is loaded, each pinned to its own cores
+SERVING_MODE = os.environ.get("LID_SERVING_MODE", "threaded")
+NUM_WORKERS = int(os.environ.get("LID_NUM_WORKERS", 2))
+# Worker threads shared by all queued jobs; in prefork mode one per worker process keeps them all busy
+WORKER_THREADS = int(os.environ.get("LID_WORKER_THREADS", NUM_WORKERS if SERVING_MODE == "prefork" else 1))
+DEFAULT_FOLDER = "audio-and-captions"
+
+MODEL_SOURCE = "speechbrain/lang-id-voxlingua107-ecapa"
+CHECKSUMS_FILE = os.path.join(MODEL_DIR, "checksums.json")
+# One of lid_export.BACKENDS; benchmark_lid.py reports which one to pick
+BACKEND = os.environ.get("LID_BACKEND", "eager")
+# Persistent result cache; set LID_CACHE_PATH to an empty string to disable it
+CACHE_PATH = os.environ.get("LID_CACHE_PATH", os.path.join(MODEL_DIR, "lid_cache.sqlite"))
+# Folder of the per-window embedding store; unset or empty keeps it disabled
+EMBEDDING_STORE_DIR = os.environ.get("LID_EMBEDDING_STORE", "")
+# Durable JSONL log of every job, replayed on startup; set to an empty string to disable it
+JOURNAL_DIR = os.environ.get("LID_JOURNAL_DIR", os.path.join(MODEL_DIR, "journal"))
+# Days a finished job's journal is kept, and how many finished jobs GET /jobs still knows
+JOURNAL_RETENTION_DAYS = float(os.environ.get("LID_JOURNAL_RETENTION_DAYS", 7))
+MAX_FINISHED_JOBS = int(os.environ.get("LID_MAX_FINISHED_JOBS", 100))
+# Files that fail to decode (or crash the server LID_MAX_ATTEMPTS times) are moved
+# to this sub-folder of their folder instead of being picked up again
+QUARANTINE_FOLDER = os.environ.get("LID_QUARANTINE_FOLDER", "quarantine")
+MAX_ATTEMPTS = int(os.environ.get("LID_MAX_ATTEMPTS", 2))
+
+def score_windows(path: str, classifier: EncoderClassifier, max_windows=None):
+    """
+    Classify every window of the audio file, or only max_windows of them
+    spread evenly over the file.
+
+    Returns:
+        Dict with the per-window "labels", "scores", vote "weights" and "starts"
+        (seconds) of the classified windows, "windows_total"/"windows_skipped"
+        counts from the VAD, plus "embeddings" and "log_probs" as float16 arrays
+        when the embedding store is enabled
+    """
+    signal = load_audio(path)
     signal = signal.squeeze(0)
 
     total_samples = len(signal)
-    WINDOW_SIZE = 30
-    STRIDE = 30
-    window_size_samples = int(16_000 * WINDOW_SIZE)
-    stride_size_samples = int(16_000 * STRIDE)
+    window_size_samples = int(SAMPLE_RATE * WINDOW_SIZE)
+    stride_size_samples = int(SAMPLE_RATE * STRIDE)
     preds = []
+    scores = []
+    embeddings = []
+    log_probs = []
 
-    # If audio file is less than or equal WINDOW_SIZE seconds
-    if total_samples <= window_size_samples:
-        start = 0
-        end = total_samples
+    starts = window_starts(total_samples, window_size_samples, stride_size_samples)
+    windows_total = len(starts)
+    weights = [1.0] * windows_total
+    if VAD_MODE != "off":
+        with stage_timer("vad"):
+            ratios = window_speech_ratios(speech_frames(signal), starts, window_size_samples).tolist()
+        if VAD_MODE == "skip":
+            keep = [i for i, ratio in enumerate(ratios) if ratio >= VAD_MIN_SPEECH_RATIO]
+            # Never skip everything: fall back to the window with the most speech
+            if not keep:
+                keep = [max(range(windows_total), key=lambda i: ratios[i])]
+            starts = [starts[i] for i in keep]
+            weights = [1.0] * len(starts)
+        else:
+            # Down-weight windows below the threshold in proportion to their speech ratio
+            weights = [min(1.0, ratio / VAD_MIN_SPEECH_RATIO) if VAD_MIN_SPEECH_RATIO > 0 else 1.0 for ratio in ratios]
+    windows_skipped = windows_total - len(starts)
+    WINDOWS_SKIPPED.inc(windows_skipped)
+    if max_windows and len(starts) > max_windows:
+        picks = sorted({round(i * (len(starts) - 1) / max(1, max_windows - 1)) for i in range(max_windows)})
+        starts = [starts[i] for i in picks]
+        weights = [weights[i] for i in picks]
 
-        window = signal[start:end]
-        window = window.unsqueeze(0)
+    # Every window has the same length, so they can be stacked into batches
+    for batch_start in range(0, len(starts), BATCH_SIZE):
+        windows = torch.stack([
+            signal[start:min(start + window_size_samples, total_samples)]
+            for start in starts[batch_start:batch_start + BATCH_SIZE]
+        ])
 
-        prediction = classifier.classify_batch(window)
-        lang_id = prediction[3]
-        preds.append(lang_id[0])
-    else:
-        # Iterate over the audio file with a window size == WINDOW_SIZE and a stride == STRIDE
-        for i in range(0, total_samples - window_size_samples + 1, stride_size_samples):
-            start = i
-            end = i + window_size_samples
+        BATCH_SIZE_HISTOGRAM.observe(len(windows))
+        WINDOWS_CLASSIFIED.inc(len(windows))
+        with stage_timer("classify_batch"):
+            if EMBEDDING_STORE_DIR:
+                batch_embeddings, batch_log_probs, batch_scores, batch_labels = classify_with_embeddings(classifier, windows)
+                embeddings.append(batch_embeddings.cpu().half().numpy())
+                log_probs.append(batch_log_probs.cpu().half().numpy())
+            else:
+                prediction = classifier.classify_batch(windows)
+                batch_scores, batch_labels = prediction[1], prediction[3]
+        preds.extend(batch_labels)
+        scores.extend(float(score) for score in batch_scores)
+
+    windows_result = {
+        "labels": preds,
+        "scores": scores,
+        "weights": weights,
+        "starts": [start / SAMPLE_RATE for start in starts],
+        "windows_total": windows_total,
+        "windows_skipped": windows_skipped,
+        "windows_classified": len(starts),
+    }
+    if EMBEDDING_STORE_DIR:
+        windows_result["embeddings"] = np.concatenate(embeddings)
+        windows_result["log_probs"] = np.concatenate(log_probs)
+    return windows_result
+
+def detect_lang(path: str, classifier: EncoderClassifier) -> str:
+    windows_result = score_windows(path, classifier)
+    # Return most frequent language in the audio file
+    return weighted_vote(windows_result["labels"], windows_result["weights"])
+
+def setup_worker(num_threads: int):
+    """
+    Build the onnxruntime session in a prefork worker: sessions don't survive
+    a fork, and their thread pool is sized to the worker's cores.
+    """
+    global language_classifier
+    language_classifier = load_backend(language_classifier, BACKEND, MODEL_DIR, num_threads=num_threads)
+    warm_up(language_classifier)
 
-            if end > total_samples:
-                end = total_samples
+def score_in_worker(path: str, max_windows=None):
+    """
+    Entry point for prefork workers. The classifier is the one inherited from
+    the parent (or built by setup_worker); the metric updates are sent back
+    with the result since the worker's registry isn't exported.
+    """
+    with recording() as observations:
+        windows_result = score_windows(path, language_classifier, max_windows=max_windows)
+    return windows_result, observations
 
-            window = signal[start:end]
-            window = window.unsqueeze(0)
+def run_scoring(path: str, classifier: EncoderClassifier, max_windows=None):
+    """Score the windows of a file in a prefork worker if the pool is running, otherwise in this thread"""
+    if worker_pool is not None:
+        windows_result, observations = worker_pool.run(score_in_worker, path, max_windows)
+        replay(observations)
+        return windows_result
+    return score_windows(path, classifier, max_windows=max_windows)
 
-            prediction = classifier.classify_batch(window)
-            lang_id = prediction[3]
-            preds.append(lang_id[0])
+def store_embeddings(path: str, windows_result, audio_hash=None):
+    """Keep the window vectors of a scored file if the embedding store is enabled"""
+    if embedding_store is not None:
+        with stage_timer("store"):
+            embedding_store.append(
+                os.path.basename(path),
+                windows_result["embeddings"],
+                windows_result["log_probs"],
+                windows_result["starts"],
+                audio_sha256=audio_hash,
+                model_revision=model_revision_id,
+            )
 
-    return most_frequent(preds)  # Return most frequent language in the audio file
+def caption_route(audio_file: str):
+    """
+    Statistics of the file's captions and the prior they give.
+
+    Returns:
+        Tuple of (stats, prior); stats is None without captions and prior is
+        None when the file needs full audio LID
+    """
+    if CASCADE_MODE == "off":
+        return None, None
+    vtt_file = find_captions(audio_file, CAPTION_LANG)
+    if vtt_file is None:
+        return None, None
+    with stage_timer("captions"):
+        stats = caption_stats(vtt_file, audio_duration(audio_file))
+    prior = caption_prior(stats, CASCADE_ARABIC_MIN, CASCADE_OTHER_MAX, CASCADE_MIN_CUES, CASCADE_MIN_COVERAGE)
+    return stats, prior
+
+def is_arabic(lang: str) -> bool:
+    return lang.split(":")[0].strip() == "ar"
+
+def cached_detect_lang(audio_file: str, classifier: EncoderClassifier):
+    """
+    Detect the language of an audio file, reusing a previous prediction for the
+    same audio content and model revision when the result cache is enabled.
+
+    Returns:
+        Dict with the "language" label, whether it was "cached", the cascade
+        "route" and, when the file was scored, its caption statistics and
+        window counts
+    """
+    audio_hash = None
+    if result_cache is not None and model_revision_id is not None:
+        with stage_timer("hash"):
+            audio_hash = file_sha256(audio_file)
+        cached = result_cache.get(audio_hash, model_revision_id)
+        if cached is not None:
+            CACHE_LOOKUPS.labels(result="hit").inc()
+            CASCADE_ROUTES.labels(route="cached").inc()
+            return {"language": cached["language"], "cached": True, "route": "cached",
+                    "window_scores": cached["window_scores"]}
+        CACHE_LOOKUPS.labels(result="miss").inc()
+
+    start_time = time.time()
+    stats, prior = caption_route(audio_file)
+    windows_result = None
+    route = "full"
+    if prior is not None:
+        # Clear-cut captions: a few windows only need to confirm them
+        confirmation = run_scoring(audio_file, classifier, max_windows=CASCADE_CONFIRM_WINDOWS)
+        lang = weighted_vote(confirmation["labels"], confirmation["weights"])
+        if is_arabic(lang) == (prior == "arabic"):
+            windows_result, route = confirmation, "confirmed"
+        else:
+            route = "escalated"
+    if windows_result is None:
+        windows_result = run_scoring(audio_file, classifier)
+        lang = weighted_vote(windows_result["labels"], windows_result["weights"])
+    CASCADE_ROUTES.labels(route=route).inc()
+
+    store_embeddings(audio_file, windows_result, audio_hash=audio_hash)
+    if audio_hash is not None:
+        result_cache.put(audio_hash, model_revision_id, lang, windows_result["labels"],
+                         windows_result["scores"], time.time() - start_time)
+    return {
+        "language": lang,
+        "cached": False,
+        "route": route,
+        "caption_stats": stats,
+        "windows_total": windows_result["windows_total"],
+        "windows_skipped": windows_result["windows_skipped"],
+        "windows_classified": windows_result["windows_classified"],
+        "window_scores": [round(score, 4) for score in windows_result["scores"]],
+    }
 
 def copy_audio_to_lang_folder(path, lang, audio_file):
     langPath = os.path.join(path, lang.strip())
     os.makedirs(langPath, exist_ok=True)
-    vtt_file = [file for file in os.listdir(path) if file.startswith(os.path.basename(audio_file[:-4])) and file.endswith(".vtt")]
+    name = os.path.basename(audio_file)
+    index = index_for(path)
+    vtt_file = index.names(video_id_of(name), ".vtt", refresh_for=name)
+    index.move(name, langPath)
     if vtt_file:
-        shutil.move(f'{audio_file}', f'{os.path.join(langPath, os.path.basename(audio_file))}')
-        shutil.move(f'{os.path.join(path, vtt_file[0])}', f'{os.path.join(langPath, vtt_file[0])}')
+        index.move(vtt_file[0], langPath)
         return True
-    else:
-        # If no VTT file found, just move the audio file
-        shutil.move(f'{audio_file}', f'{os.path.join(langPath, os.path.basename(audio_file))}')
-        return False
+    # If no VTT file found, just the audio file is moved
+    return False
 
-def process_audio_files():
-    """Process audio files and organize them by detected language"""
-    global language_classifier
-    
-    path = "audio-and-captions"
-    audio_list = glob.glob(f'{path}/*.mp3')
-    
-    results = []
-    if len(audio_list)==0:
-        print("Folder doesn't contain audio files")
-        return {"status": "error", "message": "Folder doesn't contain audio files"}
-    else:
-        audio_list = natsorted(audio_list, alg=ns.IGNORECASE)
-        for audio_file in tqdm(
-                audio_list,
-                total=len(audio_list),
-                desc=f"Processing",
-                ):
-            print(f"Processing {audio_file}")
-            try:
-                lang = detect_lang(audio_file, language_classifier)
-                print(f"  Detected language: {lang}")
-                language_code = lang.split(":")[1]
-                vtt_found = copy_audio_to_lang_folder(path, language_code, audio_file)
-                results.append({
-                    "file": audio_file, 
-                    "language": language_code, 
-                    "vtt_found": vtt_found,
-                    "status": "success"
-                })
-            except Exception as e:
-                print(f"  Error processing {audio_file}: {str(e)}")
-                results.append({"file": audio_file, "status": "error", "message": str(e)})
-    
-    return {"status": "completed", "results": results}
+def quarantine_file(audio_file):
+    """Move an audio file and its captions out of the way; returns the new audio path"""
+    path = os.path.dirname(audio_file)
+    quarantine_path = os.path.join(path, QUARANTINE_FOLDER)
+    os.makedirs(quarantine_path, exist_ok=True)
+    name = os.path.basename(audio_file)
+    index = index_for(path)
+    for file in index.names(video_id_of(name), ".vtt", refresh_for=name):
+        index.move(file, quarantine_path)
+    destination = os.path.join(quarantine_path, name)
+    if os.path.exists(audio_file):
+        index.move(name, quarantine_path)
+    return destination
+
+def list_audio_files(path):
+    """Return the MP3 files directly inside a folder in natural sort order"""
+    # One scan per job; the per-file caption lookups read the refreshed index
+    index = index_for(path)
+    index.scan()
+    audio_list = [os.path.join(path, name) for name in index.all_names(".mp3")]
+    return natsorted(audio_list, alg=ns.IGNORECASE)
+
+def process_audio_file(audio_file):
+    """Detect the language of one audio file and move it (and its captions) to the language folder"""
+    print(f"Processing {audio_file}")
+    start_time = time.time()
+    try:
+        detection = cached_detect_lang(audio_file, language_classifier)
+        lang, cached = detection["language"], detection["cached"]
+        print(f"  Detected language: {lang}{' (cached)' if cached else ''}")
+        language_code = lang.split(":")[1]
+        path = os.path.dirname(audio_file)
+        with stage_timer("move"):
+            vtt_found = copy_audio_to_lang_folder(path, language_code, audio_file)
+    except DecodeError as e:
+        print(f"  {e}, moving it to {QUARANTINE_FOLDER}")
+        FILES_PROCESSED.labels(status="quarantined").inc()
+        return {
+            "file": audio_file,
+            "status": "error",
+            "message": str(e),
+            "quarantined": quarantine_file(audio_file),
+            "seconds": round(time.time() - start_time, 3),
+        }
+    except WorkerCrashed as e:
+        worker_crashes[audio_file] += 1
+        if worker_crashes[audio_file] < MAX_ATTEMPTS:
+            FILES_PROCESSED.labels(status="error").inc()
+            raise
+        print(f"  {audio_file} was in flight when {worker_crashes[audio_file]} LID workers died, moving it to {QUARANTINE_FOLDER}")
+        FILES_PROCESSED.labels(status="quarantined").inc()
+        return {
+            "file": audio_file,
+            "status": "error",
+            "message": str(e),
+            "quarantined": quarantine_file(audio_file),
+            "seconds": round(time.time() - start_time, 3),
+        }
+    except Exception:
+        FILES_PROCESSED.labels(status="error").inc()
+        raise
+    FILES_PROCESSED.labels(status="success").inc()
+    return {
+        "file": audio_file,
+        "language": language_code,
+        "vtt_found": vtt_found,
+        "cached": cached,
+        "windows_total": detection.get("windows_total"),
+        "windows_skipped": detection.get("windows_skipped"),
+        "windows_classified": detection.get("windows_classified"),
+        "window_scores": detection.get("window_scores"),
+        "route": detection["route"],
+        "caption_stats": detection.get("caption_stats"),
+        "destination": os.path.join(path, language_code.strip(), os.path.basename(audio_file)),
+        "seconds": round(time.time() - start_time, 3),
+        "status": "success"
+    }
+
+journal = JobJournal(JOURNAL_DIR, retention_seconds=JOURNAL_RETENTION_DAYS * 24 * 3600) if JOURNAL_DIR else None
+job_manager = JobManager(process_audio_file, num_workers=WORKER_THREADS, journal=journal,
+                         max_finished_jobs=MAX_FINISHED_JOBS)
+job_manager.start()
+QUEUE_DEPTH.set_function(job_manager.queue_depth)
 
 # Initialize the model at module level before Flask starts
 print("Initializing language detection model...")
@@ -142,21 +439,184 @@ print(f"Using device: {device}")
 # Global variable to track initialization status
 model_initialized = False
 
+# Startup timings reported by /health
+startup_info = {}
+
+def verify_local_snapshot():
+    """
+    Check that MODEL_DIR holds a complete snapshot whose files match the
+    recorded checksums.
+
+    Returns:
+        Dict of checkpoint hashes, or None if the snapshot is incomplete
+
+    Raises:
+        RuntimeError: If a file no longer matches its recorded checksum
+    """
+    missing = missing_model_files()
+    if missing:
+        print(f"Local model snapshot is missing {', '.join(missing)}")
+        return None
+
+    hashes = checkpoint_hashes(MODEL_DIR)
+    if os.path.exists(CHECKSUMS_FILE):
+        with open(CHECKSUMS_FILE, 'r') as f:
+            expected = json.load(f)
+        mismatched = [name for name, digest in expected.items() if hashes.get(name) != digest]
+        if mismatched:
+            raise RuntimeError(f"Model files do not match {CHECKSUMS_FILE}: {', '.join(mismatched)}")
+    else:
+        # First load of this snapshot: record its checksums for later starts
+        with open(CHECKSUMS_FILE, 'w') as f:
+            json.dump(hashes, f, indent=4)
+        print(f"Recorded model checksums in {CHECKSUMS_FILE}")
+    return hashes
+
+def load_classifier():
+    """Load the classifier from the local snapshot, falling back to the hub only when it is incomplete"""
+    hashes = verify_local_snapshot() if MODEL_LOAD_MODE == "local" else None
+    if hashes is not None:
+        # HF_HUB_OFFLINE was set for it at import time
+        source = MODEL_DIR
+    else:
+        print(f"Loading model from {MODEL_SOURCE}")
+        source = MODEL_SOURCE
+
+    classifier = EncoderClassifier.from_hparams(
+        source=source,
+        savedir=MODEL_DIR,
+        run_opts={"device": device}
+    )
+    classifier.hparams.label_encoder.ignore_len()
+
+    if hashes is None:
+        hashes = verify_local_snapshot()
+    return classifier, "local" if source == MODEL_DIR else "hub", hashes
+
+def warm_up(classifier):
+    """Run one synthetic batch so lazy kernel and allocator initialisation happens before the first real file"""
+    windows = torch.randn(BATCH_SIZE, int(SAMPLE_RATE * WINDOW_SIZE)) * 0.01
+    classifier.classify_batch(windows)
+    if device == "cuda":
+        torch.cuda.synchronize()
+
 # Function to initialize the model
 def initialize_model():
-    global language_classifier, model_initialized
+    global language_classifier, model_initialized, result_cache, model_revision_id, worker_pool, embedding_store
     try:
-        language_classifier = EncoderClassifier.from_hparams(
-            source="speechbrain/lang-id-voxlingua107-ecapa",
-            savedir="lid-model",
-            run_opts={"device": device}
-        )
-        language_classifier.hparams.label_encoder.ignore_len()
-        print("Model loaded successfully!")
+        load_start = time.time()
+        language_classifier, model_source, hashes = load_classifier()
+        load_seconds = time.time() - load_start
+        print(f"Model loaded successfully from {model_source} in {load_seconds:.1f}s!")
+        prefork = SERVING_MODE == "prefork" and device != "cuda"
+        # onnxruntime sessions don't survive a fork, so prefork workers build their own
+        worker_setup = setup_worker if prefork and BACKEND.startswith("onnx") else None
+        if BACKEND != "eager":
+            if device == "cuda":
+                print(f"Warning: the {BACKEND} backend runs on CPU")
+            if worker_setup is not None:
+                # Export once here rather than in every worker
+                if not os.path.exists(exported_path(MODEL_DIR, BACKEND)):
+                    export_model(language_classifier, BACKEND, MODEL_DIR)
+            else:
+                language_classifier = load_backend(language_classifier, BACKEND, MODEL_DIR, num_threads=torch.get_num_threads())
+            print(f"Serving with the {BACKEND} backend")
+
+        warmup_start = time.time()
+        warm_up(language_classifier)
+        warmup_seconds = time.time() - warmup_start
+        print(f"Warm-up batch finished in {warmup_seconds:.1f}s")
+
+        if SERVING_MODE == "prefork":
+            if not prefork:
+                print("Prefork serving is CPU only, keeping inference in threads")
+            else:
+                # Fork only after load and warm-up so the workers share the weights
+                worker_pool = PreforkPool(NUM_WORKERS, setup=worker_setup)
+                print(f"Started {worker_pool.num_workers} prefork LID workers on cores {worker_pool.core_sets}")
+
+        if CACHE_PATH or EMBEDDING_STORE_DIR:
+            model_revision_id = model_revision(MODEL_SOURCE, MODEL_DIR, {
+                "window_size": WINDOW_SIZE,
+                "stride": STRIDE,
+                "decode_mode": DECODE_MODE,
+                "backend": BACKEND,
+                "vad_mode": VAD_MODE,
+                "vad_min_speech_ratio": VAD_MIN_SPEECH_RATIO,
+                "cascade": [CASCADE_MODE, CAPTION_LANG, CASCADE_ARABIC_MIN, CASCADE_OTHER_MAX,
+                            CASCADE_MIN_CUES, CASCADE_MIN_COVERAGE, CASCADE_CONFIRM_WINDOWS],
+            }, checkpoints=hashes)
+        if CACHE_PATH:
+            result_cache = LIDResultCache(CACHE_PATH)
+            print(f"LID result cache enabled at {CACHE_PATH} (model revision {model_revision_id[:12]})")
+        if EMBEDDING_STORE_DIR:
+            embedding_store = EmbeddingStore(EMBEDDING_STORE_DIR)
+            print(f"Saving window embeddings to {EMBEDDING_STORE_DIR}")
+
+        cold_start_seconds = time.time() - PROCESS_START_TIME
+        startup_info.update({
+            "model_source": model_source,
+            "backend": BACKEND,
+            "serving_mode": "prefork" if worker_pool is not None else "threaded",
+            "load_seconds": round(load_seconds, 2),
+            "warmup_seconds": round(warmup_seconds, 2),
+            "cold_start_seconds": round(cold_start_seconds, 2),
+        })
+        MODEL_LOAD.set(load_seconds)
+        MODEL_WARMUP.set(warmup_seconds)
+        COLD_START.set(cold_start_seconds)
+        print(f"Cold start took {cold_start_seconds:.1f}s")
         model_initialized = True
     except Exception as e:
         print(f"Error loading model: {e}")
+        startup_info["error"] = str(e)
         model_initialized = False
+        return
+    # The model is up whatever happens here; a journal that can't be read only loses its jobs
+    try:
+        resume_journaled_jobs()
+    except Exception as e:
+        print(f"Error reading the job journal: {e}")
+
+def resume_journaled_jobs():
+    """
+    Re-queue the jobs the journal shows as unfinished. A job that fails to
+    resume is logged and skipped; the others are still resumed.
+    """
+    if journal is None:
+        return
+    for record in journal.unfinished_jobs():
+        try:
+            resume_job(record)
+        except Exception as e:
+            print(f"Error resuming job {record['job_id']}: {e}")
+
+def resume_job(record):
+    """
+    Re-queue one journaled job. A file that was started MAX_ATTEMPTS times
+    without a result took the server down with it, so it is quarantined
+    instead of being tried again.
+    """
+    global legacy_job_id
+    results = record["results"]
+    for audio_file, attempts in record["attempts"].items():
+        if attempts >= MAX_ATTEMPTS:
+            print(f"  {audio_file} was interrupted {attempts} times, moving it to {QUARANTINE_FOLDER}")
+            FILES_PROCESSED.labels(status="quarantined").inc()
+            result = {
+                "file": audio_file,
+                "status": "error",
+                "message": f"Processing was interrupted {attempts} times",
+                "quarantined": quarantine_file(audio_file),
+            }
+            journal.file_finished(record["job_id"], result)
+            results.append(result)
+    job = job_manager.restore(record["job_id"], record["files"], results,
+                              source=record["source"], created_at=record["created_at"])
+    print(f"Resumed job {job.id}: {len(results)} of {len(job.files)} files already done")
+    # Keep /status answering for a folder job started through /process
+    if job.source == DEFAULT_FOLDER:
+        legacy_job_id = job.id
 
 # Start model initialization in a thread so we don't block app startup
 init_thread = threading.Thread(target=initialize_model)
@@ -165,45 +625,106 @@ init_thread.start()
 
 @app.route('/health', methods=['GET'])
 def health_check():
-    global model_initialized
     if not model_initialized:
+        if "error" in startup_info:
+            return jsonify({"status": "error", "message": startup_info["error"], "model_loaded": False})
         return jsonify({"status": "initializing", "message": "Model is still initializing"})
-    return jsonify({"status": "healthy", "model_loaded": True})
+    return jsonify({"status": "healthy", "model_loaded": True, **startup_info})
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    body, content_type = render_metrics()
+    return Response(body, content_type=content_type)
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """Queue a job for an explicit list of files or for every MP3 in a directory"""
+    if not model_initialized:
+        return jsonify({"status": "error", "message": "Model is still initializing, please try again later"}), 503
+
+    payload = request.get_json(silent=True) or {}
+    files = payload.get("files")
+    directory = payload.get("directory")
+    if files is not None:
+        if not isinstance(files, list) or not all(isinstance(f, str) for f in files):
+            return jsonify({"status": "error", "message": "'files' must be a list of paths"}), 400
+        source = "files"
+    elif directory is not None:
+        if not os.path.isdir(directory):
+            return jsonify({"status": "error", "message": f"Directory '{directory}' does not exist"}), 400
+        files = list_audio_files(directory)
+        source = directory
+    else:
+        return jsonify({"status": "error", "message": "Provide either 'files' or 'directory'"}), 400
+
+    job = job_manager.submit(files, source=source)
+    return jsonify({"status": "queued", "job_id": job.id, "total": len(job.files)}), 202
+
+@app.route('/jobs', methods=['GET'])
+def list_jobs():
+    return jsonify({"jobs": [job.summary() for job in job_manager.list()]})
+
+def job_summary(job):
+    """Job summary plus the share of files that took each path through the cascade"""
+    data = job.summary()
+    with job.changed:
+        routes = Counter(result.get("route", "error") for result in job.results)
+    processed = sum(routes.values())
+    data["cascade"] = {
+        route: {"files": count, "fraction": round(count / processed, 4)}
+        for route, count in routes.items()
+    }
+    return data
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": f"Unknown job '{job_id}'"}), 404
+    return jsonify(job_page(job, request, job_summary))
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": f"Unknown job '{job_id}'"}), 404
+    return Response(stream_with_context(stream_job_events(job, event_cursor(request), job_summary)), mimetype="text/event-stream")
 
 @app.route('/process', methods=['POST'])
 def process_audio():
-    global is_processing, processing_results, model_initialized
-    
+    global legacy_job_id, processing_results
+
     # Check if model is loaded
     if not model_initialized:
         return jsonify({"status": "error", "message": "Model is still initializing, please try again later"})
-    
-    # Check if process is already running
-    if is_processing:
+
+    # Check if the folder job started by /process is still running
+    legacy_job = job_manager.get(legacy_job_id) if legacy_job_id else None
+    if legacy_job is not None and not legacy_job.done:
         return jsonify({"status": "processing", "message": "Audio processing is already in progress"})
-    
-    # Start processing in a separate thread
-    def process_thread():
-        global is_processing, processing_results
-        try:
-            processing_results = process_audio_files()
-            is_processing = False
-        except Exception as e:
-            processing_results = {"status": "error", "message": str(e)}
-            is_processing = False
-    
-    is_processing = True
-    thread = threading.Thread(target=process_thread)
-    thread.start()
-    
-    return jsonify({"status": "started", "message": "Audio processing has started"})
+
+    audio_list = list_audio_files(DEFAULT_FOLDER)
+    if len(audio_list) == 0:
+        print("Folder doesn't contain audio files")
+        processing_results = {"status": "error", "message": "Folder doesn't contain audio files"}
+        legacy_job_id = None
+        return jsonify(processing_results)
+
+    processing_results = None
+    legacy_job_id = job_manager.submit(audio_list, source=DEFAULT_FOLDER).id
+    return jsonify({"status": "started", "message": "Audio processing has started", "job_id": legacy_job_id})
 
 @app.route('/status', methods=['GET'])
 def check_status():
-    global is_processing, processing_results
-    
-    if is_processing:
-        return jsonify({"status": "processing", "message": "Audio processing is in progress"})
+    legacy_job = job_manager.get(legacy_job_id) if legacy_job_id else None
+
+    if legacy_job is not None:
+        # Counters are always included; results come one page at a time (?cursor=&limit=)
+        data = job_page(legacy_job, request, job_summary)
+        if not legacy_job.done:
+            data["status"] = "processing"
+            data["message"] = "Audio processing is in progress"
+        return jsonify(data)
     elif processing_results is not None:
         return jsonify(processing_results)
     else:
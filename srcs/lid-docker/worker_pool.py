@@ -0,0 +1,99 @@
+import gc
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import torch
+
+class WorkerCrashed(RuntimeError):
+    """A prefork worker died (OOM kill, segfault) while a file was in flight"""
+
+def partition_cores(num_workers):
+    """Split the CPUs this process may run on into num_workers contiguous, non-overlapping sets"""
+    cores = sorted(os.sched_getaffinity(0))
+    num_workers = max(1, min(num_workers, len(cores)))
+    per_worker = len(cores) // num_workers
+    return [cores[i * per_worker:(i + 1) * per_worker] for i in range(num_workers)]
+
+# Set in each worker by _init_worker; start-up tasks meet at it
+_start_barrier = None
+
+def _init_worker(core_sets, counter, barrier, setup):
+    global _start_barrier
+    _start_barrier = barrier
+    with counter.get_lock():
+        worker_index = counter.value % len(core_sets)
+        counter.value += 1
+    cores = core_sets[worker_index]
+    os.sched_setaffinity(0, cores)
+    torch.set_num_threads(len(cores))
+    if setup is not None:
+        setup(len(cores))
+    print(f"LID worker {os.getpid()} pinned to cores {cores}")
+
+def _wait_for_all_workers():
+    # Returns only once every worker is running this, so each one took a task
+    _start_barrier.wait()
+    return os.getpid()
+
+class PreforkPool:
+    """
+    Process pool forked after the model is loaded, so every worker shares the
+    parent's weights copy-on-write instead of loading its own copy.
+
+    Each worker is pinned to its own set of cores with a matching
+    torch.set_num_threads, so intra-op threads of different workers (and the
+    Flask threads in the parent) do not compete for the same CPUs. setup, if
+    given, runs in each worker after pinning with its number of cores; state
+    that doesn't survive a fork (onnxruntime sessions) is built there.
+
+    A worker that dies takes the files in flight with it: run raises
+    WorkerCrashed for them and the pool is forked again for the next files.
+    """
+
+    def __init__(self, num_workers, setup=None):
+        self.core_sets = partition_cores(num_workers)
+        self.num_workers = len(self.core_sets)
+        self.setup = setup
+        self.lock = threading.Lock()
+        # Objects that exist now are never collected by the workers, which keeps
+        # the GC from writing to (and so copying) the shared pages
+        gc.freeze()
+        self.executor = self._fork()
+        # The parent only hashes and moves files from now on
+        torch.set_num_threads(1)
+
+    def _fork(self):
+        context = multiprocessing.get_context("fork")
+        executor = ProcessPoolExecutor(
+            max_workers=self.num_workers,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(self.core_sets, context.Value("i", 0), context.Barrier(self.num_workers), self.setup),
+        )
+        # The executor may start workers only as tasks arrive. One task per
+        # worker, all held at a barrier, starts every worker (and its setup) now,
+        # while the parent is idle, and fails here if a setup does
+        futures = [executor.submit(_wait_for_all_workers) for _ in range(self.num_workers)]
+        for future in futures:
+            future.result()
+        return executor
+
+    def run(self, function, *args):
+        """Run a module-level function in one of the workers and wait for its result"""
+        executor = self.executor
+        try:
+            return executor.submit(function, *args).result()
+        except BrokenProcessPool as e:
+            with self.lock:
+                # Only the first of the failed calls replaces the pool
+                if self.executor is executor:
+                    print("A LID worker died, forking a new pool")
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    self.executor = self._fork()
+            raise WorkerCrashed("The LID worker process died while processing the file") from e
+
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
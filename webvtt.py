@@ -0,0 +1,36 @@
+import re
+
+# Shared by the LID and DID services; both images are built from the repository
+# root and copy this file next to their own modules
+
+TIMESTAMP = re.compile(r'(?:(\d+):)?(\d{2}):(\d{2})[.,](\d{3})\s*-->\s*(?:(\d+):)?(\d{2}):(\d{2})[.,](\d{3})')
+TAG = re.compile(r'<[^>]+>')
+
+def _seconds(hours, minutes, seconds, milliseconds):
+    return int(hours or 0) * 3600 + int(minutes) * 60 + int(seconds) + int(milliseconds) / 1000
+
+def read_cues(vtt_file):
+    """
+    Parse the cues of a WebVTT file.
+
+    Returns:
+        List of (start seconds, end seconds, text) tuples; a cue's lines are
+        joined with spaces and cues without text are left out
+    """
+    with open(vtt_file, 'r', encoding='utf-8', errors='ignore') as f:
+        lines = f.read().splitlines()
+    cues = []
+    i = 0
+    while i < len(lines):
+        match = TIMESTAMP.search(lines[i])
+        i += 1
+        if not match:
+            continue
+        text = []
+        while i < len(lines) and lines[i].strip():
+            text.append(TAG.sub('', lines[i]).strip())
+            i += 1
+        text = " ".join(line for line in text if line)
+        if text:
+            cues.append((_seconds(*match.groups()[:4]), _seconds(*match.groups()[4:]), text))
+    return cues
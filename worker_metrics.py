@@ -0,0 +1,65 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# Shared by the LID and DID services; both images are built from the repository
+# root and copy this file next to their own modules
+
+_local = threading.local()
+# Metrics that can be replayed, by name
+_metrics = {}
+
+class ReplayableMetric:
+    """
+    A prometheus_client Counter or Histogram whose updates can be made in a
+    worker process and applied in the server process, whose registry is the
+    one /metrics exports.
+
+    Outside recording() inc and observe update the metric directly. Inside it
+    they are appended to the recording instead, and replay() applies them.
+    """
+
+    def __init__(self, metric, name=None, labels=None):
+        self.metric = metric
+        self.name = name or metric.describe()[0].name
+        self.label_values = labels or {}
+        _metrics.setdefault(self.name, self)
+
+    def labels(self, **labels):
+        return ReplayableMetric(self.metric, self.name, labels)
+
+    def _apply(self, method, value):
+        observations = getattr(_local, "observations", None)
+        if observations is not None:
+            observations.append((self.name, self.label_values, method, value))
+            return
+        target = self.metric.labels(**self.label_values) if self.label_values else self.metric
+        getattr(target, method)(value)
+
+    def inc(self, amount=1):
+        self._apply("inc", amount)
+
+    def observe(self, value):
+        self._apply("observe", value)
+
+    @contextmanager
+    def time(self):
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start_time)
+
+@contextmanager
+def recording():
+    """Collect the metric updates made in this thread instead of applying them; yields the list"""
+    _local.observations = []
+    try:
+        yield _local.observations
+    finally:
+        _local.observations = None
+
+def replay(observations):
+    """Apply metric updates collected by recording(), usually in another process"""
+    for name, labels, method, value in observations:
+        _metrics[name].labels(**labels)._apply(method, value)